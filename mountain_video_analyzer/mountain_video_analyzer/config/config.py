@@ -22,10 +22,86 @@ CONFIG = {
         "frames_per_scene": 3,
         "context_window": 5  # シーン前後の文脈を考慮する数
     },
+    "pipeline": {
+        "mode": "graph",  # "graph"（ステージ単位）、"pipelined"（シーン単位）または "lazy"（質問時に分析）
+        "queue_size": 8,  # 検出済みで未処理のシーンを保持する上限
+        "workers": 4      # シーンを並行処理するワーカー数
+    },
+    "lazy": {
+        "prefetch": 1,         # "lazy"モードで質問されたシーンの前後に先読みするシーン数
+        "prefetch_workers": 1  # 同時に実行する先読みの数
+    },
+    "live": {
+        "chunk_size": 65536,       # 入力を読み取る単位（バイト）
+        "poll_interval": 0.5,      # 書き込み中のファイルへの追記を確認する間隔（秒）
+        "idle_timeout": 10.0,      # 追記がないままこの秒数が経過したら入力の終了とみなす
+        "max_scene_length": 60.0,  # シーン変更点がなくてもこの長さでシーンを確定する（秒）
+        "frame_rate": 1.0,         # 画像分析用に保持するフレームのレート（枚/秒）
+        "audio_timeout": 10.0      # シーンの終了時間までの音声の出力を待つ上限（秒）
+    },
+    "scheduler": {
+        "max_concurrent_processes": 4,  # 同時に実行するFFmpeg/FFprobeプロセスの上限
+        "threads_per_process": None     # FFmpegの-threads（Noneの場合はコア数から自動計算）
+    },
+    "session": {
+        "backend": "memory",            # セッション状態の保存先（"memory" または "sqlite"）
+        "db_path": "data/sessions.db",  # "sqlite"の場合のSQLiteファイル（複数のプロセスで共有できる）
+        "max_bytes": 256 * 1024 * 1024, # Webサーバーがメモリに保持するセッションの合計サイズの上限
+        "ttl": 3600.0,                  # 使われていないセッションをメモリに保持する秒数
+        "spill_dir": "data/sessions",   # メモリから取り除いたセッションの書き出し先（空文字列で無効）
+        "spill_ttl": 86400.0,           # 書き出したセッションのファイルを保持する秒数
+        "max_spill_bytes": 1024 * 1024 * 1024  # 書き出したファイルの合計サイズの上限（超えると古いものから削除）
+    },
+    "checkpoint": {
+        "enabled": True,
+        "dir": "data/checkpoints"  # シーン単位の途中結果を保存するディレクトリ
+    },
+    "search": {
+        "ngram_sizes": [2, 3],  # 全文検索インデックスの文字n-gramの長さ
+        "field_weights": {      # 一致した文書の種類ごとのスコアの重み
+            "description": 1.0,
+            "transcript": 0.8,
+            "frame_analysis": 0.6
+        },
+        "max_results": 20       # キーワード検索で返すシーン数の上限
+    },
+    "semantic_search": {
+        "dim": 256,               # 埋め込みベクトルの次元数
+        "ngram_sizes": [1, 2, 3], # HashingEncoderの文字n-gramの長さ
+        "quantize": False,        # ベクトルをint8で格納する（大規模なライブラリ向け、メモリ約1/4）
+        "max_results": 10         # セマンティック検索で返すシーン数の上限
+    },
+    "response_cache": {
+        "max_entries": 256,  # 対話型プロパティ照会で保持するLLM応答の上限
+        "ttl": 600.0         # LLM応答の有効期間（秒）
+    },
+    "precompute": {
+        "enabled": False,  # 分析後に全シーンの感情的なトーンと天候状況をまとめて計算する
+        "batch_size": 20,  # 1回のモデル呼び出しで問い合わせるシーン数
+        "concurrency": 2   # 同時に実行するモデル呼び出し数
+    },
     "ui": {
         "thumbnail_size": (320, 180),
         "preview_duration": 5.0,
         "max_scenes_per_page": 10
+    },
+    "batch": {
+        "workers": 2,  # 同時に分析する動画数
+        "video_extensions": [".mp4", ".mov", ".m4v", ".mkv", ".avi", ".ts"]
+    },
+    "library": {
+        "enabled": False,                # process_videoの結果をライブラリに保存する
+        "db_path": "data/library.db",    # 全動画のシーンを横断検索するSQLiteファイル
+        "max_results": 50                # ライブラリ検索で返すシーン数の上限
+    },
+    "jobs": {
+        "db_path": "data/jobs.db",  # ジョブキューのSQLiteファイル
+        "max_queued_jobs": 100,     # 待機できるジョブ数の上限（超えると429を返す）
+        "poll_interval": 1.0,       # ワーカーのポーリング間隔（秒）
+        "workers": 2,               # serverコマンドと同時に起動するワーカープロセス数
+        "lease_timeout": 60.0,      # 実行中のジョブのリース（秒）。ワーカーが延長しないまま切れると別のワーカーが取得し直す
+        "max_attempts": 3,          # 1つのジョブを取得できる回数の上限（ワーカーの異常終了が続くジョブは失敗にする）
+        "shutdown_timeout": 30.0    # サーバーの停止時に実行中のジョブの完了を待つ秒数（超えると中断して待機中に戻す）
     }
 }
 
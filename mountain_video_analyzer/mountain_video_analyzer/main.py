@@ -6,6 +6,10 @@ import argparse
 import asyncio
 from mountain_video_analyzer.agents.main_agent import MountainVideoAnalyzerAgent
 from mountain_video_analyzer.utils.session_manager import process_video
+from mountain_video_analyzer.utils.batch_processor import BatchProcessor, collect_video_paths
+from mountain_video_analyzer.utils.job_queue import run_worker
+from mountain_video_analyzer.utils.library_index import LibraryIndex
+from mountain_video_analyzer.utils.streaming_processor import StreamingProcessor
 from mountain_video_analyzer.ui.web_app import start_server
 from mountain_video_analyzer.tests.test_components import run_tests
 
@@ -20,11 +24,36 @@ def main():
     server_parser = subparsers.add_parser("server", help="Webサーバーを起動")
     server_parser.add_argument("--host", default="0.0.0.0", help="ホスト名")
     server_parser.add_argument("--port", type=int, default=8000, help="ポート番号")
+    server_parser.add_argument("--workers", type=int, help="同時に起動するジョブワーカー数")
+    
+    # ジョブワーカーを起動するコマンド
+    worker_parser = subparsers.add_parser("worker", help="ジョブキューのワーカーを起動")
+    worker_parser.add_argument("--db-path", help="ジョブキューのデータベースファイルのパス")
     
     # 動画を分析するコマンド
     analyze_parser = subparsers.add_parser("analyze", help="動画を分析")
-    analyze_parser.add_argument("video_path", help="分析する動画ファイルのパス")
-    analyze_parser.add_argument("--output", help="結果を保存するJSONファイルのパス")
+    analyze_parser.add_argument("video_paths", nargs="*", help="分析する動画ファイル・ディレクトリ・globパターン")
+    analyze_parser.add_argument("--manifest", help="分析する動画のパスを列挙したマニフェストファイル")
+    analyze_parser.add_argument("--output", help="結果を保存するJSONファイルのパス（動画が1本の場合）")
+    analyze_parser.add_argument("--output-dir", help="動画ごとの結果JSONを保存するディレクトリ（バッチ処理）")
+    analyze_parser.add_argument("--workers", type=int, help="同時に分析する動画数（バッチ処理）")
+    analyze_parser.add_argument("--force", action="store_true", help="結果が最新でも再分析する（バッチ処理）")
+    
+    # 分析済みの全動画のシーンを検索するコマンド
+    search_parser = subparsers.add_parser("search", help="ライブラリの全動画からシーンを検索")
+    search_parser.add_argument("keyword", nargs="?", help="説明文に含まれるキーワード")
+    search_parser.add_argument("--weather", help="天候状況に含まれる語（例: 晴）")
+    search_parser.add_argument("--since", help="撮影日の下限（YYYY-MM-DD）")
+    search_parser.add_argument("--until", help="撮影日の上限（YYYY-MM-DD、この日を含まない）")
+    search_parser.add_argument("--min-duration", type=float, help="シーンの長さの下限（秒）")
+    search_parser.add_argument("--max-duration", type=float, help="シーンの長さの上限（秒）")
+    search_parser.add_argument("--limit", type=int, help="表示するシーン数の上限")
+    search_parser.add_argument("--db-path", help="ライブラリのデータベースファイルのパス")
+    
+    # 書き込み中の動画・標準入力の動画をライブ分析するコマンド
+    live_parser = subparsers.add_parser("live", help="書き込み中の動画ファイル・標準入力の動画をライブ分析")
+    live_parser.add_argument("source", nargs="?", default="-", help="動画ファイルのパス（省略または-の場合は標準入力）")
+    live_parser.add_argument("--output", help="最終結果を保存するJSONファイルのパス")
     
     # テストを実行するコマンド
     test_parser = subparsers.add_parser("test", help="テストを実行")
@@ -35,31 +64,117 @@ def main():
     if args.command == "server":
         # Webサーバーを起動
         print(f"Webサーバーを起動します（{args.host}:{args.port}）")
-        start_server(host=args.host, port=args.port)
+        start_server(host=args.host, port=args.port, workers=args.workers)
+    
+    elif args.command == "worker":
+        # ジョブワーカーを起動（Webサーバーとは別のマシン・プロセスで実行可能）
+        print("ジョブワーカーを起動します")
+        run_worker(db_path=args.db_path)
     
     elif args.command == "analyze":
-        # 動画を分析
-        if not os.path.exists(args.video_path):
-            print(f"エラー: 動画ファイル {args.video_path} が見つかりません")
+        video_paths = collect_video_paths(args.video_paths, args.manifest)
+        
+        if not video_paths:
+            print("エラー: 分析する動画ファイルが指定されていません")
             return
         
-        print(f"動画 {args.video_path} を分析します")
+        is_single_video = (
+            len(video_paths) == 1
+            and args.video_paths == video_paths
+            and not args.manifest
+            and not args.output_dir
+        )
+        
+        if args.output and not is_single_video:
+            print("エラー: --outputは動画が1本の場合のみ指定できます（複数の動画の結果は--output-dirに保存されます）")
+            return
         
         # メインエージェントを作成
         main_agent = MountainVideoAnalyzerAgent()
         
-        # 動画を処理
-        result = asyncio.run(process_video(main_agent, args.video_path))
+        if is_single_video:
+            video_path = video_paths[0]
+            
+            # 動画を分析
+            if not os.path.exists(video_path):
+                print(f"エラー: 動画ファイル {video_path} が見つかりません")
+                return
+            
+            print(f"動画 {video_path} を分析します")
+            
+            # 動画を処理
+            result = asyncio.run(process_video(main_agent, video_path))
+            
+            # 結果を表示または保存
+            if args.output:
+                import json
+                with open(args.output, "w", encoding="utf-8") as f:
+                    json.dump(result, f, ensure_ascii=False, indent=2)
+                print(f"結果を {args.output} に保存しました")
+            else:
+                import json
+                print(json.dumps(result, ensure_ascii=False, indent=2))
+        
+        else:
+            # 複数の動画を1つのイベントループ内のワーカープールで分析
+            print(f"{len(video_paths)} 本の動画を分析します")
+            
+            processor = BatchProcessor(
+                main_agent,
+                output_dir=args.output_dir,
+                workers=args.workers,
+                force=args.force
+            )
+            summary = asyncio.run(processor.run(video_paths))
+            
+            print(f"処理済み: {summary['processed']} / スキップ: {summary['skipped']} / 失敗: {summary['failed']}")
+            print(f"経過時間: {summary['elapsed']:.1f} 秒")
+            print(f"スループット: {summary['videos_per_hour']:.1f} 本/時")
+            print(f"実時間比: {summary['realtime_factor']:.2f} 倍")
+            for failure in summary["failures"]:
+                print(f"失敗: {failure['video_path']}: {failure['error']}")
+    
+    elif args.command == "search":
+        from datetime import datetime
+        
+        def to_timestamp(date):
+            return datetime.strptime(date, "%Y-%m-%d").timestamp() if date else None
+        
+        scenes = LibraryIndex(args.db_path).search(
+            keyword=args.keyword,
+            recorded_after=to_timestamp(args.since),
+            recorded_before=to_timestamp(args.until),
+            weather=args.weather,
+            min_duration=args.min_duration,
+            max_duration=args.max_duration,
+            limit=args.limit
+        )
+        
+        for scene in scenes:
+            recorded = datetime.fromtimestamp(scene["recorded_at"]).strftime("%Y-%m-%d")
+            print(f"{recorded} {scene['video_path']} シーン{scene['scene_id']} "
+                  f"({scene['start_time']:.1f}〜{scene['end_time']:.1f}秒) 天候: {scene['weather'] or '-'}")
+        print(f"{len(scenes)} 件のシーンが見つかりました")
+    
+    elif args.command == "live":
+        import json
+        
+        processor = StreamingProcessor()
+        
+        async def print_event(event):
+            # シーンの分析が終わるたびにイベントを1行のJSONとして出力する
+            print(json.dumps(event, ensure_ascii=False), flush=True)
+        
+        async def run_live():
+            await processor.start_live(args.source, print_event)
+            return await processor.get_final_result()
+        
+        result = asyncio.run(run_live())
         
-        # 結果を表示または保存
         if args.output:
-            import json
             with open(args.output, "w", encoding="utf-8") as f:
                 json.dump(result, f, ensure_ascii=False, indent=2)
             print(f"結果を {args.output} に保存しました")
-        else:
-            import json
-            print(json.dumps(result, ensure_ascii=False, indent=2))
     
     elif args.command == "test":
         # テストを実行
@@ -0,0 +1,6 @@
+"""
+models/__init__.pyファイル - データモデルパッケージ初期化
+"""
+from .record import Record, to_builtin, estimate_size
+from .scene_data import Scene, SceneTable
+from .segment import TranscriptSegment, FrameAnalysis, FallbackFrameAnalysis
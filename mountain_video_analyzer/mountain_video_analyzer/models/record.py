@@ -0,0 +1,132 @@
+"""
+レコード基底クラス - __slots__で定義したフィールドを辞書のように参照できる軽量レコード
+"""
+import sys
+from collections.abc import Mapping
+
+class Record(Mapping):
+    """
+    __slots__で定義したフィールドを持つレコードの基底クラス
+
+    インスタンスごとの__dict__を持たないため、同じ内容の辞書よりもメモリ使用量が小さくなります。
+    Mappingを実装しているので、record["start_time"] や record.get("text") のように
+    従来の辞書と同じ方法で参照でき、dict(record) で辞書に変換できます。
+    """
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        """
+        Recordの初期化
+
+        Args:
+            *args: __slots__の順に並べたフィールドの値
+            **kwargs: フィールド名をキーとした値（省略したフィールドはNone）
+        """
+        if len(args) > len(self.__slots__):
+            raise TypeError(f"{type(self).__name__} のフィールドは {len(self.__slots__)} 個です")
+
+        for name, value in zip(self.__slots__, args):
+            setattr(self, name, value)
+        for name in self.__slots__[len(args):]:
+            setattr(self, name, kwargs.pop(name, None))
+
+        if kwargs:
+            raise TypeError(f"{type(self).__name__} に未知のフィールドがあります: {', '.join(kwargs)}")
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        辞書からレコードを作成する。既にレコードの場合はそのまま返す
+
+        Args:
+            data: フィールド名をキーとした辞書
+
+        Returns:
+            Record: レコード
+        """
+        if isinstance(data, cls):
+            return data
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+    def to_dict(self):
+        """
+        レコードを辞書に変換する
+
+        Returns:
+            dict: フィールド名をキーとした辞書
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+def to_builtin(value):
+    """
+    レコードやSceneTableを含む値を、JSONに変換できる組み込み型に変換します。
+    json.dumpのdefault引数としても使用できます。
+
+    Args:
+        value: 変換する値
+
+    Returns:
+        辞書・リスト・スカラーで構成された値
+    """
+    if isinstance(value, Record):
+        return value.to_dict()
+    if hasattr(value, "to_list"):
+        return value.to_list()
+    if isinstance(value, dict):
+        return {key: to_builtin(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_builtin(item) for item in value]
+    return value
+
+def estimate_size(value, seen=None):
+    """
+    値が参照するオブジェクトを含めた、おおよそのメモリ使用量を求めます。
+    同じオブジェクトを複数回参照している場合は1回だけ数えます。
+
+    Args:
+        value: 値
+        seen: 数えたオブジェクトのIDの集合（再帰呼び出し用）
+
+    Returns:
+        int: バイト数
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    # NumPy配列は自身が所有するデータのサイズを含む
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return size
+
+    if isinstance(value, dict):
+        size += sum(estimate_size(key, seen) + estimate_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, seen) for item in value)
+    elif isinstance(value, Record):
+        size += sum(estimate_size(getattr(value, name), seen) for name in value.__slots__)
+    elif hasattr(value, "__dict__"):
+        size += estimate_size(vars(value), seen)
+    return size
@@ -0,0 +1,164 @@
+"""
+シーンデータ - シーンのレコードと、数値列をNumPy構造化配列で保持するSceneTable
+"""
+import numpy as np
+from .record import Record
+
+SCENE_DTYPE = np.dtype([
+    ("scene_id", np.int64),
+    ("start_time", np.float64),
+    ("end_time", np.float64)
+])
+
+class Scene(Record):
+    """
+    1つのシーン
+    """
+    __slots__ = ("scene_id", "start_time", "end_time")
+
+class SceneTable:
+    """
+    シーンの一覧を列指向で保持するテーブル
+
+    シーンID・開始時間・終了時間を1行24バイトの構造化配列に格納するため、
+    シーンごとに辞書を持つ場合と比べてメモリ使用量が大幅に小さくなります。
+    各列はNumPy配列として参照できるので、区間の検索などをベクトル化して実行できます。
+    反復やインデックス参照ではSceneレコードを返すため、従来のシーンのリストと同じように扱えます。
+    """
+    def __init__(self, capacity=16):
+        """
+        SceneTableの初期化
+
+        Args:
+            capacity: 最初に確保する行数
+        """
+        self._data = np.zeros(max(capacity, 1), dtype=SCENE_DTYPE)
+        self._size = 0
+        # 内容が変わるたびに増える番号（派生したインデックスの再構築の判定に使う）
+        self.version = 0
+
+    @classmethod
+    def from_records(cls, scenes):
+        """
+        シーンのリスト（辞書またはScene）からテーブルを作成する
+
+        Args:
+            scenes: シーンのリスト
+
+        Returns:
+            SceneTable: テーブル（既にSceneTableの場合はそのまま返す）
+        """
+        if isinstance(scenes, cls):
+            return scenes
+
+        scenes = list(scenes)
+        table = cls(len(scenes))
+        for scene in scenes:
+            table.append(scene)
+        return table
+
+    @property
+    def scene_ids(self):
+        """シーンIDの列"""
+        return self._data["scene_id"][:self._size]
+
+    @property
+    def start_times(self):
+        """開始時間の列"""
+        return self._data["start_time"][:self._size]
+
+    @property
+    def end_times(self):
+        """終了時間の列"""
+        return self._data["end_time"][:self._size]
+
+    def append(self, scene):
+        """
+        シーンを末尾に追加する。容量が足りない場合は2倍に拡張する
+
+        Args:
+            scene: 追加するシーン（辞書またはScene）
+        """
+        if self._size == len(self._data):
+            data = np.zeros(len(self._data) * 2, dtype=SCENE_DTYPE)
+            data[:self._size] = self._data
+            self._data = data
+
+        self._data[self._size] = (scene["scene_id"], scene["start_time"], scene["end_time"])
+        self._size += 1
+        self.version += 1
+
+    def index_of(self, scene_id):
+        """
+        シーンIDの行番号を取得する
+
+        Args:
+            scene_id: シーンID
+
+        Returns:
+            int: 行番号（存在しない場合は-1）
+        """
+        matches = np.flatnonzero(self.scene_ids == scene_id)
+        return int(matches[0]) if len(matches) else -1
+
+    def get(self, scene_id):
+        """
+        シーンIDからシーンを取得する
+
+        Args:
+            scene_id: シーンID
+
+        Returns:
+            Scene: シーン（存在しない場合はNone）
+        """
+        position = self.index_of(scene_id)
+        return self[position] if position >= 0 else None
+
+    def containing(self, timestamp):
+        """
+        タイムスタンプを含むシーンの行番号を取得する
+
+        Args:
+            timestamp: タイムスタンプ（秒）
+
+        Returns:
+            numpy.ndarray: 行番号の配列（テーブル内の順序）
+        """
+        return np.flatnonzero((self.start_times <= timestamp) & (timestamp <= self.end_times))
+
+    def to_list(self):
+        """
+        シーンを辞書のリストに変換する
+
+        Returns:
+            list: シーンの辞書のリスト
+        """
+        return [
+            {"scene_id": int(scene_id), "start_time": float(start_time), "end_time": float(end_time)}
+            for scene_id, start_time, end_time in self._data[:self._size].tolist()
+        ]
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return SceneTable.from_records(self[i] for i in range(*position.indices(self._size)))
+
+        if position < 0:
+            position += self._size
+        if not 0 <= position < self._size:
+            raise IndexError("シーンの行番号が範囲外です")
+
+        scene_id, start_time, end_time = self._data[position].tolist()
+        return Scene(scene_id, start_time, end_time)
+
+    def __iter__(self):
+        for scene_id, start_time, end_time in self._data[:self._size].tolist():
+            yield Scene(scene_id, start_time, end_time)
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __repr__(self):
+        return f"SceneTable({len(self)} scenes)"
@@ -0,0 +1,60 @@
+"""
+セグメントデータ - シーン単位の書き起こしとフレーム分析のレコード
+"""
+from .record import Record
+
+# フレーム分析の構造化フィールドと、分析プロンプトで指定しているJSONのキー
+FRAME_PROPERTY_LABELS = {
+    "location": "場所の特徴",
+    "activity": "活動内容",
+    "weather": "天候状況",
+    "time_of_day": "時間帯",
+    "scenery": "風景や自然の特徴",
+    "climber": "登山者の状況や装備"
+}
+
+class TranscriptSegment(Record):
+    """
+    1つのシーンの書き起こし結果
+    """
+    __slots__ = ("scene_id", "start_time", "end_time", "text")
+
+class FrameAnalysis(Record):
+    """
+    1つのタイムスタンプ周辺のフレーム分析結果
+
+    analysisはモデルの応答テキストです。応答をJSONとして解析できた場合は、
+    各項目がlocation・weatherなどのフィールドに格納されます（解析できなかった項目はNone）。
+    """
+    __slots__ = ("timestamp", "analysis", *FRAME_PROPERTY_LABELS)
+
+    # 代替の分析結果かどうか（FallbackFrameAnalysisではTrue）
+    fallback = False
+
+    @property
+    def parsed(self):
+        """応答から1つ以上の項目を解析できたかどうか"""
+        return any(getattr(self, name) is not None for name in FRAME_PROPERTY_LABELS)
+
+    def get_properties(self):
+        """
+        解析できた項目を取得する
+
+        Returns:
+            dict: プロンプトの項目名をキー、値を値とする辞書
+        """
+        return {
+            label: getattr(self, name)
+            for name, label in FRAME_PROPERTY_LABELS.items()
+            if getattr(self, name) is not None
+        }
+
+class FallbackFrameAnalysis(FrameAnalysis):
+    """
+    モデルの応答を得られなかった場合の代替のフレーム分析結果
+
+    フィールドはFrameAnalysisと同じです。一時的な失敗の結果を保存しないよう、
+    チェックポイントには保存されず、再実行時に分析し直されます。
+    （Recordは__slots__からフィールドを取得するため、__slots__を定義し直さない）
+    """
+    fallback = True
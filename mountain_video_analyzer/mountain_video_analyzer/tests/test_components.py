@@ -4,10 +4,22 @@
 import asyncio
 import os
 from ..agents.main_agent import MountainVideoAnalyzerAgent
-from ..utils.session_manager import process_video
+from ..utils.session_manager import process_video, process_video_streaming
 from ..tools.scene_detection import detect_scenes
 from ..tools.transcription import transcribe_audio
-from ..tools.vision_analysis import analyze_frames
+from ..tools.vision_analysis import analyze_frames, parse_frame_analysis
+from ..agents.agent import Agent
+from ..agents.sequential_agent import SequentialAgent
+from ..agents.parallel_agent import ParallelAgent
+from ..utils.graph_executor import GraphExecutor
+from ..utils.session_manager import SessionManager, analyze_video, generate_descriptions, generate_editing_suggestions
+from ..utils.response_cache import ResponseCache
+from ..utils.vector_index import VectorIndex
+from ..utils.property_precompute import precompute_scene_properties, get_precomputed_property
+from ..utils.library_index import LibraryIndex
+from ..utils.session_store import SQLiteSessionState
+from ..utils.session_registry import SessionRegistry
+from ..models import Scene, SceneTable
 
 async def test_scene_detection(video_path):
     """
@@ -95,6 +107,1412 @@ async def test_full_pipeline(video_path):
     
     return True
 
+async def test_lazy_analysis(video_path):
+    """
+    "lazy"モードのテスト（シーン検出のみを実行し、質問されたシーンと前後のシーンだけを分析する）
+    
+    Args:
+        video_path: テスト用動画ファイルのパス
+    """
+    print("\n=== オンデマンド分析のテスト ===")
+    
+    session_manager = SessionManager()
+    await analyze_video(session_manager, video_path, mode="lazy")
+    
+    scenes = session_manager.get_state("scenes", [])
+    lazy_analyzer = session_manager.lazy_analyzer
+    print(f"シーン数: {len(scenes)}, 分析前の説明数: {len(session_manager.get_state('descriptions', []))}")
+    
+    if lazy_analyzer is None or session_manager.get_state("descriptions", []):
+        print("エラー: シーン検出の時点で分析が実行されています")
+        return False
+    if len(session_manager.get_state("editing_suggestions", [])) != len(scenes):
+        print("エラー: 編集提案が設定されていません")
+        return False
+    
+    try:
+        scene_id = scenes[0]["scene_id"]
+        await lazy_analyzer.ensure_scenes_async([scene_id])
+        
+        described = [description["scene_id"] for description in session_manager.get_state("descriptions", [])]
+        print(f"分析済みのシーン: {described}")
+        
+        if scene_id not in described:
+            print("エラー: 質問したシーンが分析されていません")
+            return False
+    finally:
+        session_manager.close()
+    
+    if session_manager.lazy_analyzer is not None or lazy_analyzer._thread is not None:
+        print("エラー: オンデマンド分析が停止されていません")
+        return False
+    
+    return True
+
+async def test_streaming_events(video_path):
+    """
+    ストリーミング処理のテスト（シーンごとのイベントが完了順に届き、進捗が増加することを確認）
+    
+    Args:
+        video_path: テスト用動画ファイルのパス
+    """
+    print("\n=== ストリーミング処理のテスト ===")
+    
+    events = []
+    
+    async def callback(event):
+        events.append(event)
+    
+    await process_video_streaming(MountainVideoAnalyzerAgent(), video_path, callback)
+    
+    types = [event["type"] for event in events]
+    percents = [event["percent"] for event in events if event["type"] == "progress"]
+    print(f"イベント数: {len(events)}, 進捗: {percents}")
+    
+    if not types or types[0] != "scene_detected" or types[-1] != "complete":
+        print("エラー: 最初のシーンの検出または完了のイベントがありません")
+        return False
+    
+    first_scene_id = events[0]["scene_id"]
+    if not any(event["type"] == "description_ready" and event["scene_id"] == first_scene_id for event in events):
+        print("エラー: シーンの説明文のイベントがありません")
+        return False
+    
+    if percents != sorted(percents):
+        print("エラー: 進捗が減少しています")
+        return False
+    
+    return True
+
+async def test_live_ingest(video_path):
+    """
+    ライブ分析のテスト（書き込み中のファイルを追従し、シーンが隙間なく確定され、
+    分析済みの音声が破棄されることを確認）
+    
+    Args:
+        video_path: テスト用動画ファイルのパス
+    """
+    import tempfile
+    import threading
+    import subprocess
+    from ..config import CONFIG
+    from ..utils.live_ingest import LiveAnalyzer, AudioWindow
+    
+    print("\n=== ライブ分析のテスト ===")
+    
+    # 音声バッファは分析済みの区間を破棄しても、入力の先頭からの時間で区間を取り出せる
+    audio = AudioWindow(sample_rate=100)
+    audio.append(bytes(range(200)) * 2)
+    audio.trim(1.0)
+    if audio.start_time != 1.0 or audio.slice(1.5, 2.0) != bytes(range(200))[100:200] or audio.slice(0.0, 1.0):
+        print("エラー: 音声バッファの区間が正しくありません")
+        return False
+    
+    live_config = CONFIG["live"]
+    saved_config = dict(live_config)
+    live_config.update(poll_interval=0.05, idle_timeout=1.0, max_scene_length=10.0, chunk_size=16384)
+    
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            # MP4は末尾まで書き込まれるまでデコードできないため、録画と同じくMPEG-TSに変換して流し込む
+            stream_path = os.path.join(directory, "source.ts")
+            subprocess.run(
+                ["ffmpeg", "-i", video_path, "-c", "copy", "-f", "mpegts", "-y", stream_path],
+                capture_output=True, check=True
+            )
+            live_path = os.path.join(directory, "live.ts")
+            open(live_path, "wb").close()
+            
+            def write_recording():
+                with open(stream_path, "rb") as source, open(live_path, "ab") as target:
+                    while True:
+                        chunk = source.read(65536)
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                        target.flush()
+                        threading.Event().wait(0.01)
+            
+            writer = threading.Thread(target=write_recording)
+            writer.start()
+            
+            session_manager = SessionManager()
+            analyzer = LiveAnalyzer(session_manager, live_path)
+            await analyzer.run()
+            writer.join()
+    finally:
+        live_config.clear()
+        live_config.update(saved_config)
+    
+    metrics = analyzer.get_metrics()
+    scenes = session_manager.get_state("scenes", [])
+    descriptions = session_manager.get_state("descriptions", [])
+    print(f"シーン数: {len(scenes)}, 統計情報: {metrics}")
+    
+    if not scenes or scenes[0]["start_time"] != 0.0:
+        print("エラー: シーンが確定されていません")
+        return False
+    
+    for previous, scene in zip(scenes, scenes[1:]):
+        if scene["start_time"] != previous["end_time"]:
+            print("エラー: シーンの間に隙間があります")
+            return False
+    
+    if any(scene["end_time"] - scene["start_time"] > 10.0 + 1e-6 for scene in scenes):
+        print("エラー: max_scene_lengthより長いシーンがあります")
+        return False
+    
+    if len(descriptions) != len(scenes) or metrics["pending_scenes"] != 0:
+        print("エラー: 分析されていないシーンがあります")
+        return False
+    
+    if metrics["buffered_audio_seconds"] > 10.0:
+        print("エラー: 分析済みの音声が破棄されていません")
+        return False
+    
+    return True
+
+async def test_stream_cancellation(video_path):
+    """
+    ストリーミング処理の停止のテスト（キャンセルされたジョブの実行枠が返却され、
+    停止後に分析が続かないことを確認）
+    
+    Args:
+        video_path: テスト用動画ファイルのパス
+    """
+    from ..utils.streaming_processor import StreamingProcessor
+    from ..tools.process_scheduler import ProcessScheduler, get_scheduler
+    from ..tools.cancellation import get_reclaimed_metrics
+    
+    print("\n=== ストリーミング処理の停止のテスト ===")
+    
+    # 実行中のジョブと、実行枠を待っているジョブをキャンセルする
+    scheduler = ProcessScheduler(max_concurrent=1)
+    before = get_reclaimed_metrics()
+    
+    async def hold_slot():
+        async with scheduler.async_slot():
+            await asyncio.sleep(10)
+    
+    running = asyncio.ensure_future(hold_slot())
+    await asyncio.sleep(0.01)
+    queued = asyncio.ensure_future(hold_slot())
+    await asyncio.sleep(0.01)
+    for task in (queued, running):
+        task.cancel()
+    await asyncio.gather(running, queued, return_exceptions=True)
+    
+    after = get_reclaimed_metrics()
+    if scheduler.get_metrics()["running"] != 0:
+        print("エラー: キャンセルされたジョブの実行枠が返却されていません")
+        return False
+    if (after["running_slots"] - before["running_slots"], after["queued_slots"] - before["queued_slots"]) != (1, 1):
+        print(f"エラー: 回収したリソースが記録されていません: {after}")
+        return False
+    
+    # 最初のイベントを受け取った時点で停止する
+    processor = StreamingProcessor()
+    events = []
+    running_before = get_scheduler().get_metrics()["running"]
+    
+    async def callback(event):
+        events.append(event)
+        processor.stop_streaming()
+    
+    await processor.start_streaming(video_path, callback)
+    event_count = len(events)
+    await asyncio.sleep(0.5)
+    
+    print(f"停止までのイベント数: {event_count}, 回収したリソース: {get_reclaimed_metrics()}")
+    
+    if not processor.stopped or any(event["type"] == "complete" for event in events):
+        print("エラー: ストリーミング処理が停止されていません")
+        return False
+    
+    if len(events) != event_count or get_scheduler().get_metrics()["running"] != running_before:
+        print("エラー: 停止後も分析が続いています")
+        return False
+    
+    return True
+
+async def test_event_buffer(video_path):
+    """
+    クライアントごとのイベントバッファのテスト（進捗がまとめられ、シーンや結果のイベントは破棄されず、
+    受け取り側が読み取らなくても分析が待たされないことを確認）
+    
+    Args:
+        video_path: テスト用動画ファイルのパス
+    """
+    from ..utils.event_stream import EventBuffer
+    
+    print("\n=== イベントバッファのテスト ===")
+    
+    buffer = EventBuffer(session_id="test")
+    for scene_id in range(1, 7):
+        buffer.put({"type": "scene_detected", "scene_id": scene_id})
+        buffer.put({"type": "progress", "percent": scene_id * 10.0})
+    buffer.put({"type": "complete"})
+    buffer.put({"type": "progress", "percent": 100.0})
+    
+    events = [event async for event in buffer]
+    print(f"受け取ったイベント: {[event['type'] for event in events]}, 統計情報: {buffer.get_metrics()}")
+    
+    if events[-1]["type"] != "complete":
+        print("エラー: 完了のイベントがありません")
+        return False
+    
+    progress = [event for event in events if event["type"] == "progress"]
+    if len(progress) != 1 or progress[0]["percent"] != 60.0 or buffer.coalesced != 5:
+        print("エラー: 進捗が最新のものにまとめられていません")
+        return False
+    
+    if [event["scene_id"] for event in events if "scene_id" in event] != [1, 2, 3, 4, 5, 6]:
+        print("エラー: シーンのイベントが破棄されています")
+        return False
+    
+    # 受け取り側が一度も読み取らなくても分析は最後まで進み、シーンのイベントはすべて残る
+    buffer = EventBuffer()
+    await asyncio.wait_for(
+        process_video_streaming(MountainVideoAnalyzerAgent(), video_path, buffer.send), timeout=120
+    )
+    events = [event async for event in buffer]
+    print(f"読み取らなかった場合の統計情報: {buffer.get_metrics()}")
+    
+    if events[-1]["type"] != "complete" or not any(event["type"] == "description_ready" for event in events):
+        print("エラー: 結果のイベントが残っていません")
+        return False
+    if sum(1 for event in events if event["type"] == "progress") > 1:
+        print("エラー: 未送信の進捗がまとめられていません")
+        return False
+    
+    return True
+
+async def test_stream_fanout(video_path):
+    """
+    ストリーミング分析の共有のテスト（同じ動画を複数のクライアントが購読しても分析は1回だけ実行され、
+    途中から購読したクライアントもそれまでのイベントを受け取ることを確認）
+    
+    Args:
+        video_path: テスト用動画ファイルのパス
+    """
+    from ..utils.streaming_processor import StreamingProcessor
+    from ..utils.stream_jobs import StreamJob, StreamJobRegistry, get_stream_job_key
+    
+    print("\n=== ストリーミング分析の共有のテスト ===")
+    
+    main_agent = MountainVideoAnalyzerAgent()
+    registry = StreamJobRegistry()
+    
+    def create(key):
+        session_manager = SessionManager()
+        job = StreamJob(key, session_manager.session_id, StreamingProcessor(main_agent))
+        job.start(job.processor.start_streaming(video_path, job.send, session_manager=session_manager))
+        return job
+    
+    async def collect(buffer):
+        return [event async for event in buffer]
+    
+    key = get_stream_job_key(video_path)
+    first_job, first = registry.attach(key, create)
+    
+    # 最初のクライアントがシーンを受け取った後に、2つ目のクライアントが購読する
+    first_events = []
+    async for event in first:
+        first_events.append(event)
+        if event["type"] == "scene_detected":
+            break
+    second_job, second = registry.attach(key, create)
+    
+    first_events += await asyncio.wait_for(collect(first), timeout=120)
+    second_events = await asyncio.wait_for(collect(second), timeout=120)
+    print(f"開始した分析: {registry.started}, 共有した購読: {registry.shared}")
+    print(f"受け取ったイベント数: {len(first_events)}, {len(second_events)}")
+    
+    if second_job is not first_job or registry.started != 1:
+        print("エラー: 同じ動画の分析が複数回実行されています")
+        return False
+    
+    scenes = lambda events: [event["scene_id"] for event in events if event["type"] == "scene_detected"]
+    if scenes(second_events) != scenes(first_events) or second_events[-1] != first_events[-1]:
+        print("エラー: 途中から購読したクライアントが、それまでのイベントを受け取っていません")
+        return False
+    
+    # 最後の購読者が購読を終了した場合は分析が中断され、次の購読では分析を開始し直す
+    job, buffer = registry.attach(key, create)
+    await job.detach(buffer)
+    if not job.task.done() or len(registry) != 0:
+        print("エラー: 購読者がいなくなった分析が中断されていません")
+        return False
+    
+    return True
+
+async def test_graph_executor():
+    """
+    エージェントグラフ実行器のテスト（並列ブランチが重なって実行されることを確認）
+    """
+    print("\n=== エージェントグラフ実行器のテスト ===")
+    
+    async def slow_handler(session_manager, video_path):
+        await asyncio.sleep(0.2)
+    
+    def blocking_handler(session_manager, video_path):
+        import time
+        time.sleep(0.2)
+    
+    tree = SequentialAgent(
+        name="root",
+        sub_agents=[
+            Agent(name="first"),
+            ParallelAgent(
+                name="parallel",
+                sub_agents=[Agent(name="left"), Agent(name="right")]
+            ),
+            Agent(name="last")
+        ]
+    )
+    executor = GraphExecutor(
+        {"first": slow_handler, "left": slow_handler, "right": blocking_handler, "last": slow_handler},
+        dependencies={"last": ["left", "right"]}
+    )
+    timings = await executor.run(tree, SessionManager(), "dummy.mp4")
+    
+    print(f"並列ブロックの実行時間: {timings['parallel']['duration']:.2f}秒")
+    print(f"全体の実行時間: {timings['root']['duration']:.2f}秒")
+    
+    # 並列ブランチが逐次実行されていれば0.4秒以上かかる
+    if timings["parallel"]["duration"] >= 0.35:
+        print("エラー: 並列ブランチが並行に実行されていません")
+        return False
+    if timings["last"]["start"] < timings["parallel"]["end"]:
+        print("エラー: 依存関係が守られていません")
+        return False
+    
+    return True
+
+async def test_indexed_joins():
+    """
+    説明文・編集提案生成のマイクロベンチマーク（シーン数に対して線形に増えることを確認）
+    """
+    print("\n=== 説明文・編集提案生成のベンチマーク ===")
+    import time
+    
+    timings = {}
+    for count in (1000, 10000, 100000):
+        scenes = [
+            {"scene_id": i + 1, "start_time": i * 5.0, "end_time": i * 5.0 + 5.0}
+            for i in range(count)
+        ]
+        transcriptions = [{"scene_id": i + 1, "text": "テスト"} for i in range(count)]
+        frame_analyses = [{"timestamp": i * 5.0 + 2.5, "analysis": "晴れ"} for i in range(count)]
+        
+        start = time.perf_counter()
+        descriptions = generate_descriptions(scenes, transcriptions, frame_analyses)
+        generate_editing_suggestions(scenes, descriptions)
+        timings[count] = time.perf_counter() - start
+        
+        print(f"{count}シーン: {timings[count]:.3f}秒")
+        
+        if "晴れ" not in descriptions[-1]["text"]:
+            print("エラー: フレーム分析結果が対応付けられていません")
+            return False
+    
+    # シーン数が10倍になったときの実行時間の比率（線形なら約10、二乗なら約100）
+    ratio = timings[100000] / timings[10000]
+    print(f"10000→100000シーンの実行時間比: {ratio:.1f}")
+    if ratio > 30:
+        print("エラー: 実行時間がシーン数に対して線形に増えていません")
+        return False
+    
+    return True
+
+async def test_scene_table():
+    """
+    SceneTableのテスト（辞書との相互変換と区間検索）
+    """
+    print("\n=== SceneTableのテスト ===")
+    
+    scenes = [
+        {"scene_id": 1, "start_time": 0.0, "end_time": 12.0},
+        {"scene_id": 2, "start_time": 12.0, "end_time": 30.5},
+        {"scene_id": 4, "start_time": 61.0, "end_time": 100.0}
+    ]
+    table = SceneTable.from_records(scenes)
+    
+    if table.to_list() != scenes or list(table) != scenes:
+        print("エラー: 辞書との相互変換で内容が変わりました")
+        return False
+    
+    # 境界の時間は前後両方のシーンに含まれる
+    if list(table.containing(12.0)) != [0, 1] or len(table.containing(50.0)) != 0:
+        print("エラー: 区間検索の結果が正しくありません")
+        return False
+    
+    if table.get(4) != Scene(4, 61.0, 100.0) or table.get(3) is not None:
+        print("エラー: シーンIDによる検索の結果が正しくありません")
+        return False
+    
+    # セッションのシーンインデックスはシーンが変更されるまで再利用し、シーンIDでも検索できる
+    session_manager = SessionManager()
+    session_manager.set_state("scenes", scenes)
+    scene_index = session_manager.get_scene_index()
+    if session_manager.get_scene_index() is not scene_index:
+        print("エラー: シーンインデックスが再利用されていません")
+        return False
+    if scene_index.get(4) != Scene(4, 61.0, 100.0) or scene_index.get(3) is not None:
+        print("エラー: シーンインデックスのシーンIDによる検索の結果が正しくありません")
+        return False
+    
+    # 説明文もシーンIDの対応表から取得し、説明文が追加されたら対応表を作り直す
+    descriptions = [{"scene_id": 1, "text": "登山口を出発"}]
+    session_manager.set_state("descriptions", descriptions)
+    first = session_manager.get_description(1)
+    descriptions.append({"scene_id": 4, "text": "山頂に到着"})
+    session_manager.set_state("descriptions", descriptions)
+    if first["text"] != "登山口を出発" or session_manager.get_description(4)["text"] != "山頂に到着" \
+            or session_manager.get_description(2) is not None:
+        print("エラー: シーンIDによる説明文の取得結果が正しくありません")
+        return False
+    
+    print(f"シーン数: {len(table)}")
+    return True
+
+async def test_text_index():
+    """
+    全文検索インデックスのテスト（日本語の部分一致と追加分の反映）
+    """
+    print("\n=== 全文検索インデックスのテスト ===")
+    
+    session_manager = SessionManager()
+    descriptions = []
+    session_manager.set_state("scenes", SceneTable.from_records([
+        Scene(1, 0.0, 10.0), Scene(2, 10.0, 20.0)
+    ]))
+    session_manager.set_state("descriptions", descriptions)
+    text_index = session_manager.get_text_index()
+    
+    # インデックス作成後に追加された結果も検索できる
+    descriptions.append({"scene_id": 1, "text": "山頂からの雲海が広がっています"})
+    session_manager.set_state("descriptions", descriptions)
+    descriptions.append({"scene_id": 2, "text": "天候：雪。稜線を歩いています"})
+    session_manager.set_state("descriptions", descriptions)
+    
+    results = {
+        keyword: [doc_key[1] for doc_key, score in text_index.search(keyword)]
+        for keyword in ("雲海", "雪", "稜線 歩いて", "晴れ")
+    }
+    print(f"検索結果: {results}")
+    
+    if results != {"雲海": [1], "雪": [2], "稜線 歩いて": [2], "晴れ": []}:
+        print("エラー: 検索結果が正しくありません")
+        return False
+    
+    return True
+
+async def test_vector_index():
+    """
+    ベクトルインデックスのテスト（表記の異なる言い換えの検索・int8量子化・削除）
+    """
+    print("\n=== ベクトルインデックスのテスト ===")
+    
+    documents = [
+        (("description", 1, 1), "山頂から雲の海が広がる絶景を眺めています"),
+        (("description", 2, 2), "樹林帯の登山道で休憩しています"),
+        (("description", 3, 3), "雪が降る中、アイゼンを装着しています"),
+        (("description", 4, 4), "岩場を三点支持で慎重に登っています")
+    ]
+    
+    for quantize in (False, True):
+        vector_index = VectorIndex(quantize=quantize)
+        vector_index.add_many(documents)
+        
+        results = {
+            query: vector_index.search(query, 1)[0][0][1]
+            for query in ("雲海", "休憩", "アイゼン", "岩を登る")
+        }
+        print(f"検索結果（int8: {quantize}）: {results}")
+        
+        if results != {"雲海": 1, "休憩": 2, "アイゼン": 3, "岩を登る": 4}:
+            print("エラー: 検索結果が正しくありません")
+            return False
+    
+    vector_index.remove(("description", 1, 1))
+    if len(vector_index) != 3 or any(doc_key[1] == 1 for doc_key, score in vector_index.search("雲海", 3)):
+        print("エラー: 削除した文書が検索されました")
+        return False
+    
+    return True
+
+async def test_frame_analysis_parsing():
+    """
+    フレーム分析の構造化フィールドの解析テスト（コードブロック・前後の説明文・JSONでない応答）
+    """
+    print("\n=== フレーム分析の解析テスト ===")
+    
+    fenced = parse_frame_analysis('分析結果です。\n```json\n{"天候状況": "雪", "時間帯": ["朝", "薄暗い"]}\n```')
+    plain = parse_frame_analysis("晴れた山道を歩いています")
+    print(f"解析結果: {fenced}, {plain}")
+    
+    if fenced != {"weather": "雪", "time_of_day": "朝、薄暗い"} or plain != {}:
+        print("エラー: 解析結果が正しくありません")
+        return False
+    
+    return True
+
+async def test_response_cache():
+    """
+    応答キャッシュのテスト（同時呼び出しの集約・内容変更時の再計算・TTL）
+    """
+    print("\n=== 応答キャッシュのテスト ===")
+    
+    now = [0.0]
+    cache = ResponseCache(max_entries=8, ttl=60.0, clock=lambda: now[0])
+    calls = []
+    
+    async def ask(content):
+        def compute():
+            import time
+            calls.append(content)
+            time.sleep(0.1)
+            return f"応答{len(calls)}"
+        key = ("get_emotional_tone", 1, content, "model")
+        return await asyncio.to_thread(cache.get_or_compute, key, compute)
+    
+    # 同じ質問が同時に届いてもモデルは1回だけ呼び出される
+    concurrent = await asyncio.gather(*(ask("説明文A") for _ in range(4)))
+    cached = await ask("説明文A")
+    changed = await ask("説明文B")
+    now[0] = 61.0
+    expired = await ask("説明文B")
+    print(f"応答: {concurrent}, {cached}, {changed}, {expired} / {cache.get_metrics()}")
+    
+    if concurrent != ["応答1"] * 4 or cached != "応答1" or changed != "応答2" or expired != "応答3":
+        print("エラー: キャッシュの応答が正しくありません")
+        return False
+    
+    if len(cache) != 1:
+        print("エラー: 内容が変わったシーンの古い応答が削除されていません")
+        return False
+    
+    return True
+
+async def test_property_precompute():
+    """
+    プロパティの事前計算のテスト（バッチ単位の呼び出しと、内容が変わったシーンの無効化）
+    """
+    print("\n=== プロパティの事前計算のテスト ===")
+    
+    import re
+    import json
+    
+    class BatchModel:
+        calls = 0
+        
+        async def generate_content_async(self, prompt):
+            BatchModel.calls += 1
+            scene_ids = re.findall(r"\[シーンID: (\d+)\]", prompt)
+            answer = {scene_id: {"emotional_tone": "平穏", "weather_conditions": "曇り"} for scene_id in scene_ids}
+            return type("Response", (), {"text": json.dumps(answer, ensure_ascii=False)})()
+    
+    session_manager = SessionManager()
+    session_manager.set_state("scenes", SceneTable.from_records([
+        Scene(scene_id, (scene_id - 1) * 10.0, scene_id * 10.0) for scene_id in range(1, 6)
+    ]))
+    session_manager.set_state("descriptions", [
+        {"scene_id": scene_id, "text": f"シーン{scene_id}の説明"} for scene_id in range(1, 6)
+    ])
+    
+    scene_properties = await precompute_scene_properties(session_manager, BatchModel(), batch_size=2)
+    print(f"呼び出し回数: {BatchModel.calls}, 計算したシーン: {sorted(scene_properties)}")
+    
+    if BatchModel.calls != 3 or sorted(scene_properties) != [1, 2, 3, 4, 5]:
+        print("エラー: 事前計算の結果が正しくありません")
+        return False
+    
+    # 説明文が変わったシーンの事前計算値は使用しない
+    if get_precomputed_property(session_manager, "emotional_tone", 1, "シーン1の説明") != "平穏":
+        print("エラー: 事前計算した値を取得できません")
+        return False
+    if get_precomputed_property(session_manager, "emotional_tone", 1, "変更後の説明") is not None:
+        print("エラー: 内容が変わったシーンの事前計算値が返されました")
+        return False
+    
+    return True
+
+async def test_library_index():
+    """
+    ライブラリインデックスのテスト（キーワード・天候・撮影日時・長さによる検索と再取り込み）
+    """
+    print("\n=== ライブラリインデックスのテスト ===")
+    
+    import tempfile
+    
+    def make_result(texts, weathers):
+        return {
+            "scenes": [
+                {"scene_id": i + 1, "start_time": i * 10.0, "end_time": i * 10.0 + (i + 1) * 5.0}
+                for i in range(len(texts))
+            ],
+            "descriptions": [
+                {"scene_id": i + 1, "text": f'{text} {{"天候状況": "{weather}"}}'}
+                for i, (text, weather) in enumerate(zip(texts, weathers))
+            ]
+        }
+    
+    with tempfile.TemporaryDirectory() as directory:
+        library = LibraryIndex(os.path.join(directory, "library.db"))
+        library.ingest("spring.mp4", make_result(["山頂から雲海を望む", "樹林帯を歩く"], ["晴れ", "曇り"]), recorded_at=1000.0)
+        library.ingest("winter.mp4", make_result(["雪の稜線を進む", "山頂で休憩する"], ["雪", "晴れ"]), recorded_at=2000.0)
+        
+        keyword = [(s["video_path"].endswith("spring.mp4"), s["scene_id"]) for s in library.search("雲海")]
+        single = [s["scene_id"] for s in library.search("雪")]
+        sunny = [s["scene_id"] for s in library.search("山頂", weather="晴")]
+        recent = [s["scene_id"] for s in library.search("山頂", recorded_after=1500.0)]
+        short = [s["scene_id"] for s in library.search(max_duration=5.0)]
+        print(f"検索結果: {keyword}, {single}, {sunny}, {recent}, {short}")
+        
+        if keyword != [(True, 1)] or single != [1] or sorted(sunny) != [1, 2] or recent != [2] or short != [1, 1]:
+            print("エラー: 検索結果が正しくありません")
+            return False
+        
+        # 同じ動画を取り込み直すと既存のシーンは置き換えられる
+        library.ingest("spring.mp4", make_result(["沢沿いを歩く"], ["雨"]), recorded_at=1000.0)
+        if library.search("雲海") or library.get_metrics() != {"videos": 2, "scenes": 3}:
+            print("エラー: 再取り込み後のシーンが正しくありません")
+            return False
+    
+    return True
+
+async def test_session_store():
+    """
+    SQLiteセッション状態のテスト（別インスタンスからの参照と、追加分だけの書き込み）
+    """
+    print("\n=== SQLiteセッション状態のテスト ===")
+    
+    import sqlite3
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "sessions.db")
+        writer = SessionManager("shared", state=SQLiteSessionState("shared", db_path))
+        # 別のプロセスのSessionManagerに相当する
+        state = SQLiteSessionState("shared", db_path)
+        reader = SessionManager("shared", state=state)
+        
+        scenes = SceneTable.from_records([Scene(1, 0.0, 10.0)])
+        descriptions = [{"scene_id": 1, "text": "山頂に到着"}]
+        writer.set_state("scenes", scenes)
+        writer.set_state("descriptions", descriptions)
+        first = reader.get_state("descriptions")
+        
+        scenes.append(Scene(2, 10.0, 20.0))
+        descriptions.append({"scene_id": 2, "text": "下山を開始"})
+        writer.set_state("scenes", scenes)
+        writer.set_state("descriptions", descriptions)
+        
+        shared_scenes = reader.get_state("scenes")
+        shared_descriptions = reader.get_state("descriptions")
+        print(f"参照結果: {shared_scenes}, {shared_descriptions}")
+        
+        if not isinstance(shared_scenes, SceneTable) or shared_scenes.to_list() != scenes.to_list():
+            print("エラー: シーンを参照できません")
+            return False
+        if shared_descriptions != descriptions or shared_descriptions is not first:
+            print("エラー: 追加された説明文が反映されていません")
+            return False
+        
+        # 同じリストへの追加では、各要素は1回だけ書き込まれる
+        conn = sqlite3.connect(db_path)
+        try:
+            (items,) = conn.execute("SELECT COUNT(*) FROM session_items WHERE key = 'descriptions'").fetchone()
+        finally:
+            conn.close()
+        if items != 2:
+            print(f"エラー: 説明文の要素が{items}件保存されています")
+            return False
+        
+        # close()は別のスレッドが開いた接続も閉じ、閉じた後も接続を開き直して使用できる
+        await asyncio.to_thread(state.get, "scenes")
+        connections = list(state._connections)
+        state.close()
+        try:
+            connections[0].execute("SELECT 1")
+            print("エラー: 別のスレッドの接続が閉じられていません")
+            return False
+        except sqlite3.ProgrammingError:
+            pass
+        if state._connections or state.get("descriptions") != descriptions:
+            print("エラー: 閉じた後に状態を参照できません")
+            return False
+        state.close()
+    
+    return True
+
+async def test_session_registry():
+    """
+    セッションレジストリのテスト（上限を超えた古いセッションの書き出し・読み込み直しとTTL、書き出したファイルの削除）
+    """
+    print("\n=== セッションレジストリのテスト ===")
+    
+    import tempfile
+    
+    now = [0.0]
+    descriptions = [{"scene_id": scene_id, "text": f"シーン{scene_id}の説明" * 20} for scene_id in range(200)]
+    
+    with tempfile.TemporaryDirectory() as directory:
+        probe = SessionManager()
+        probe.set_state("descriptions", descriptions)
+        # 2セッション分だけ保持できる上限にする
+        registry = SessionRegistry(
+            max_bytes=probe.estimate_size() * 2.5, ttl=100.0, spill_dir=directory, clock=lambda: now[0]
+        )
+        
+        session_ids = []
+        for _ in range(3):
+            with registry.use(registry.create().session_id) as session_manager:
+                session_manager.set_state("descriptions", list(descriptions))
+            session_ids.append(session_manager.session_id)
+            now[0] += 1.0
+        
+        metrics = registry.get_metrics()
+        print(f"統計情報: {metrics}")
+        if metrics["live_sessions"] != 2 or metrics["evictions"] != 1 or metrics["memory_bytes"] > registry.max_bytes:
+            print("エラー: 上限を超えたセッションが取り除かれていません")
+            return False
+        
+        # 書き出しは別のスレッドで行う。取り除いたセッションは書き出したファイルから読み込み直す
+        registry.flush()
+        if not os.path.exists(os.path.join(directory, f"{session_ids[0]}.pickle")):
+            print("エラー: 取り除いたセッションが書き出されていません")
+            return False
+        reloaded = registry.get(session_ids[0])
+        if reloaded is None or reloaded.get_state("descriptions") != descriptions:
+            print("エラー: 取り除いたセッションを読み込み直せません")
+            return False
+        
+        # TTLを過ぎたセッションは上限に関係なく取り除く
+        now[0] += 200.0
+        registry.get(session_ids[0])
+        if registry.get_metrics()["live_sessions"] != 1:
+            print("エラー: TTLを過ぎたセッションが取り除かれていません")
+            return False
+        
+        # 期限を過ぎたファイルと、合計サイズの上限を超えた分の古いファイルは削除する
+        registry.flush()
+        spilled = sorted(name for name in os.listdir(directory) if name.endswith(".pickle"))
+        old_path = os.path.join(directory, spilled[0])
+        os.utime(old_path, (0, 0))
+        registry.spill_ttl = 3600.0
+        registry.max_spill_bytes = os.path.getsize(os.path.join(directory, spilled[1]))
+        registry.expire_spills()
+        remaining = [name for name in os.listdir(directory) if name.endswith(".pickle")]
+        print(f"書き出したファイル: {len(spilled)} → {len(remaining)}")
+        if os.path.exists(old_path) or len(remaining) != 1:
+            print("エラー: 書き出したファイルが削除されていません")
+            return False
+        
+        # オンデマンド分析の停止は専用のスレッドで行い、取り除く側を待たせない
+        import time
+        import threading
+        closed = threading.Event()
+        
+        class SlowAnalyzer:
+            def close(self):
+                time.sleep(0.3)
+                closed.set()
+        
+        async with registry.use_async(registry.create().session_id) as session_manager:
+            session_manager.lazy_analyzer = SlowAnalyzer()
+            session_manager.set_state("descriptions", list(descriptions))
+        print(f"use_async()の終了後の統計情報: {registry.get_metrics()}")
+        if registry.get_metrics()["memory_bytes"] < session_manager.estimate_size():
+            print("エラー: use_async()の終了時にサイズが計測し直されていません")
+            return False
+        
+        start = time.perf_counter()
+        now[0] += 200.0
+        registry.create()
+        elapsed = time.perf_counter() - start
+        registry.flush()
+        print(f"オンデマンド分析中のセッションを取り除く時間: {elapsed:.3f}秒")
+        if elapsed >= 0.3 or not closed.is_set():
+            print("エラー: オンデマンド分析の停止を待っているか、停止されていません")
+            return False
+    
+    return True
+
+async def test_state_subscription():
+    """
+    状態の購読のテスト（追加分だけの通知、パスのパターン、まとめての通知）
+    """
+    print("\n=== 状態の購読のテスト ===")
+    
+    session_manager = SessionManager()
+    descriptions = [{"scene_id": 1, "text": "登山口を出発"}]
+    session_manager.set_state("descriptions", descriptions)
+    
+    with session_manager.subscribe("descriptions/*", "video_path") as subscription, \
+            session_manager.subscribe("descriptions/2") as single:
+        descriptions.append({"scene_id": 2, "text": "樹林帯を歩く"})
+        session_manager.set_state("descriptions", descriptions)
+        # 受け取る前の同じキーの変更は最新のものだけが残る
+        session_manager.set_state("video_path", "first.mp4")
+        session_manager.set_state("video_path", "second.mp4")
+        session_manager.set_state("transcriptions", [{"scene_id": 1, "text": "出発します"}])
+        
+        changes = await asyncio.wait_for(subscription.__anext__(), timeout=1.0)
+        single_changes = await asyncio.wait_for(single.__anext__(), timeout=1.0)
+    
+    paths = [(change["path"], change["value"]) for change in changes]
+    print(f"変更: {paths}")
+    
+    if paths != [("descriptions/2", descriptions[1]), ("video_path", "second.mp4")]:
+        print("エラー: 変更の通知が正しくありません")
+        return False
+    if [change["path"] for change in single_changes] != ["descriptions/2"]:
+        print("エラー: パスを指定した購読の通知が正しくありません")
+        return False
+    
+    return True
+
+async def test_checkpoint_resume():
+    """
+    チェックポイントからの再開のテスト（分析に失敗したシーンの代替の結果が保存されず、再開時に分析し直されることと、
+    完了の判定・大きな動画の識別を確認）
+    """
+    from ..utils.checkpoint import CheckpointStore, compute_content_hash
+    from ..utils.session_manager import run_checkpointed, is_analysis_complete
+    from ..tools.vision_analysis import analyze_frame_files_async
+    from ..models import FrameAnalysis
+    
+    print("\n=== チェックポイントからの再開のテスト ===")
+    
+    import time
+    import tempfile
+    import functools
+    
+    calls = []
+    
+    async def analyze():
+        calls.append(10.0)
+        return FrameAnalysis(10.0, "晴れた稜線")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        video_path = os.path.join(directory, "video.mp4")
+        with open(video_path, "wb") as f:
+            f.write(os.urandom(4096))
+        
+        # フレームを抽出できなかったシーンは代替の結果になる
+        checkpoint = CheckpointStore(video_path, params={}, root=directory)
+        failed = await run_checkpointed(
+            checkpoint, "frame_analyses", 1,
+            functools.partial(analyze_frame_files_async, None, 10.0, []), FrameAnalysis
+        )
+        print(f"失敗したシーンの結果: fallback={failed.fallback}")
+        if not failed.fallback or checkpoint.get_unit("frame_analyses", 1) is not None:
+            print("エラー: 代替の結果がチェックポイントに保存されています")
+            return False
+        
+        # 再開時は失敗したシーンだけを分析し直し、その結果を保存する
+        resumed = await run_checkpointed(
+            CheckpointStore(video_path, params={}, root=directory), "frame_analyses", 1, analyze, FrameAnalysis
+        )
+        reloaded = await run_checkpointed(
+            CheckpointStore(video_path, params={}, root=directory), "frame_analyses", 1, analyze, FrameAnalysis
+        )
+        print(f"分析した回数: {len(calls)}, 再開後の結果: {reloaded}")
+        
+        if len(calls) != 1 or resumed.analysis != "晴れた稜線" or reloaded.to_dict() != resumed.to_dict():
+            print("エラー: 失敗したシーンが再開時に分析し直されていません")
+            return False
+        
+        # 代替の結果が残っている分析は完了とみなさない（チェックポイントを削除しない）
+        session_manager = SessionManager()
+        session_manager.set_state("scenes", SceneTable.from_records([Scene(1, 0.0, 20.0)]))
+        session_manager.set_state("transcriptions", [{"scene_id": 1, "text": ""}])
+        session_manager.set_state("frame_analyses", [failed])
+        incomplete = is_analysis_complete(session_manager)
+        session_manager.set_state("frame_analyses", [resumed])
+        if incomplete or not is_analysis_complete(session_manager):
+            print("エラー: 分析の完了を正しく判定できません")
+            return False
+        
+        # 大きな動画でもファイル全体は読まずにチェックポイントを識別する
+        large_path = os.path.join(directory, "large.mp4")
+        with open(large_path, "wb") as f:
+            f.truncate(4 * 1024 * 1024 * 1024)
+        start = time.perf_counter()
+        large_key = compute_content_hash(large_path)
+        elapsed = time.perf_counter() - start
+        with open(large_path, "r+b") as f:
+            f.write(b"changed")
+        print(f"4GBの動画の識別にかかった時間: {elapsed:.3f}秒")
+        
+        if elapsed > 1.0 or compute_content_hash(large_path) == large_key:
+            print("エラー: チェックポイントの識別に時間がかかるか、内容の変更を検出できません")
+            return False
+    
+    return True
+
+async def test_job_queue():
+    """
+    ジョブキューのテスト（取得、待機中のジョブ数の上限、リースが切れたジョブの取得し直し）
+    """
+    from ..utils.job_queue import JobQueue, QueueFullError
+    
+    print("\n=== ジョブキューのテスト ===")
+    
+    import tempfile
+    
+    now = [1000.0]
+    
+    with tempfile.TemporaryDirectory() as directory:
+        queue = JobQueue(
+            os.path.join(directory, "jobs.db"), max_queued_jobs=2, lease_timeout=60.0, max_attempts=2,
+            clock=lambda: now[0]
+        )
+        
+        first_id = queue.enqueue("first.mp4")
+        now[0] += 1.0
+        second_id = queue.enqueue("second.mp4")
+        
+        # 待機中のジョブが上限に達している場合はQueueFullError（POST /jobsは429を返す）
+        try:
+            queue.enqueue("third.mp4")
+            print("エラー: 上限を超えてジョブを登録できました")
+            return False
+        except QueueFullError as e:
+            print(f"上限を超えた登録: {e}")
+        
+        # 古いジョブから取得する
+        job = queue.claim_next("worker-1")
+        if job["id"] != first_id or job["status"] != "running" or job["attempts"] != 1:
+            print(f"エラー: 最も古いジョブを取得できません: {job}")
+            return False
+        
+        # リースを延長している間は、ほかのワーカーは待機中のジョブだけを取得する
+        now[0] += 50.0
+        if not queue.heartbeat(first_id, "worker-1"):
+            print("エラー: リースを延長できません")
+            return False
+        now[0] += 50.0
+        if queue.claim_next("worker-2")["id"] != second_id or queue.claim_next("worker-2") is not None:
+            print("エラー: リースが有効なジョブが取得されました")
+            return False
+        
+        # ワーカーが異常終了してリースが切れたジョブは、別のワーカーが取得し直す
+        now[0] += 61.0
+        recovered = queue.claim_next("worker-3")
+        print(f"取得し直したジョブ: {recovered['id'] == first_id}, 実行回数: {recovered['attempts']}")
+        if recovered["id"] != first_id or recovered["worker_id"] != "worker-3" or queue.heartbeat(first_id, "worker-1"):
+            print("エラー: リースが切れたジョブを取得し直せません")
+            return False
+        
+        # 停止したワーカーが戻したジョブは実行回数に数えない
+        queue.release(first_id, "worker-3")
+        if queue.get_job(first_id)["status"] != "queued" or queue.claim_next("worker-3")["attempts"] != 2:
+            print("エラー: 戻したジョブを取得し直せません")
+            return False
+        
+        # 実行回数が上限に達したジョブは取得せずに失敗にする
+        now[0] += 61.0
+        queue.claim_next("worker-4")
+        metrics = queue.get_metrics()
+        print(f"統計情報: {metrics}")
+        if queue.get_job(first_id)["status"] != "failed" or metrics["running"] != 1:
+            print("エラー: 異常終了が続くジョブが失敗になっていません")
+            return False
+        
+        # 分析に失敗したジョブは、フォールバックの結果で完了にせず失敗にする
+        from ..utils.job_queue import run_job
+        queue.fail(second_id, "テストのため終了")
+        missing_id = queue.enqueue(os.path.join(directory, "missing.mp4"))
+        job = queue.claim_next("worker-5")
+        await asyncio.to_thread(run_job, queue, MountainVideoAnalyzerAgent(), job, "worker-5")
+        failed = queue.get_job(missing_id)
+        print(f"分析に失敗したジョブ: {failed['status']} ({failed['error']})")
+        if failed["status"] != "failed" or failed["result"] is not None:
+            print("エラー: 分析に失敗したジョブが完了になっています")
+            return False
+    
+    return True
+
+async def test_batch_processor():
+    """
+    バッチ処理のテスト（ディレクトリ・glob・マニフェストからのパスの収集、最新の結果のスキップ、
+    失敗した分析の判定）
+    """
+    from ..utils.batch_processor import BatchProcessor, collect_video_paths
+    from ..utils.session_manager import get_analysis_error
+    from ..models import FallbackFrameAnalysis, FrameAnalysis
+    
+    print("\n=== バッチ処理のテスト ===")
+    
+    import json
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as directory:
+        videos = os.path.join(directory, "videos")
+        os.makedirs(os.path.join(videos, "day2"))
+        paths = [
+            os.path.join(videos, "day1.mp4"),
+            os.path.join(videos, "day2", "summit.MOV"),
+            os.path.join(videos, "notes.txt")
+        ]
+        for path in paths:
+            with open(path, "wb") as f:
+                f.write(b"\0" * 16)
+        
+        manifest = os.path.join(directory, "nightly.txt")
+        with open(manifest, "w", encoding="utf-8") as f:
+            f.write("# 夜間バッチ\nvideos/day1.mp4\nextra.mp4\nvideos/notes.txt\n")
+        json_manifest = os.path.join(directory, "nightly.json")
+        with open(json_manifest, "w", encoding="utf-8") as f:
+            json.dump(["videos/day2/summit.MOV"], f)
+        
+        # ディレクトリ・glob・マニフェストからは動画の拡張子のファイルだけを収集し、重複は除く
+        collected = collect_video_paths([videos, os.path.join(videos, "*")], manifest)
+        print(f"収集したパス: {[os.path.relpath(path, directory) for path in collected]}")
+        if collected != [paths[0], paths[1], os.path.join(directory, "extra.mp4")]:
+            print("エラー: 動画のパスを正しく収集できません")
+            return False
+        if collect_video_paths([], json_manifest) != [os.path.join(directory, "videos/day2/summit.MOV")]:
+            print("エラー: JSON配列のマニフェストを読み込めません")
+            return False
+        
+        # 結果が動画より新しい場合はスキップし、存在しない動画は失敗として数える（分析は実行しない）
+        output_dir = os.path.join(directory, "results")
+        os.makedirs(output_dir)
+        for name in ("day1.json", "summit.json"):
+            with open(os.path.join(output_dir, name), "w", encoding="utf-8") as f:
+                f.write("{}")
+        
+        summary = await BatchProcessor(None, output_dir=output_dir).run(
+            [paths[0], paths[1], os.path.join(directory, "missing.mp4")]
+        )
+        print(f"集計結果: 処理済み {summary['processed']} / スキップ {summary['skipped']} / 失敗 {summary['failed']}")
+        if (summary["skipped"], summary["failed"], summary["processed"]) != (2, 1, 0):
+            print("エラー: 最新の結果がスキップされていません")
+            return False
+    
+    # 代替の結果を含む分析は失敗として扱う（結果を保存せずに次回再分析する）
+    session_manager = SessionManager()
+    session_manager.set_state("scenes", SceneTable.from_records([Scene(1, 0.0, 10.0), Scene(2, 10.0, 20.0)]))
+    session_manager.set_state("transcriptions", [{"scene_id": 1}, {"scene_id": 2}])
+    session_manager.set_state("frame_analyses", [FrameAnalysis(5.0, ""), FallbackFrameAnalysis(15.0, "")])
+    partial_error = get_analysis_error(session_manager)
+    session_manager.set_state("frame_analyses", [FrameAnalysis(5.0, ""), FrameAnalysis(15.0, "")])
+    complete_error = get_analysis_error(session_manager)
+    session_manager.set_state("analysis_error", "シーンを検出できませんでした")
+    print(f"失敗の判定: {partial_error}, {complete_error}, {get_analysis_error(session_manager)}")
+    
+    if partial_error is None or complete_error is not None or get_analysis_error(session_manager) is None:
+        print("エラー: 失敗した分析を判定できません")
+        return False
+    
+    return True
+
+async def test_graph_executor_validation():
+    """
+    エージェントグラフ実行器の依存関係の検証のテスト（存在しない名前・循環・実行順序との矛盾）
+    """
+    print("\n=== エージェントグラフ実行器の依存関係の検証のテスト ===")
+    
+    def build_tree():
+        return SequentialAgent(
+            name="root",
+            sub_agents=[
+                Agent(name="first"),
+                ParallelAgent(
+                    name="parallel",
+                    sub_agents=[Agent(name="left"), Agent(name="right")]
+                ),
+                Agent(name="last")
+            ]
+        )
+    
+    invalid_cases = {
+        "存在しない名前": {"last": ["missing"]},
+        "循環": {"left": ["right"], "right": ["left"]},
+        "自分自身への依存": {"left": ["left"]},
+        "後に実行されるエージェントへの依存": {"first": ["last"]}
+    }
+    for label, dependencies in invalid_cases.items():
+        try:
+            GraphExecutor({}, dependencies=dependencies, agent=build_tree())
+        except ValueError as e:
+            print(f"{label}: {e}")
+        else:
+            print(f"エラー: {label}の依存関係がValueErrorになりません")
+            return False
+    
+    # コンストラクターにツリーを渡さない場合も、待機し続けずにrun()でValueErrorになる
+    executor = GraphExecutor({}, dependencies={"first": ["left"]})
+    try:
+        await asyncio.wait_for(executor.run(build_tree(), SessionManager(), "dummy.mp4"), timeout=5)
+    except ValueError as e:
+        print(f"run()での検証: {e}")
+    else:
+        print("エラー: run()で依存関係が検証されていません")
+        return False
+    
+    # 並列ブランチ間の依存関係と、前のエージェントへの依存関係は有効
+    completed = []
+    
+    def record_handler(name):
+        async def handler(session_manager, video_path):
+            await asyncio.sleep(0.05 if name == "right" else 0)
+            completed.append(name)
+        return handler
+    
+    tree = build_tree()
+    executor = GraphExecutor(
+        {name: record_handler(name) for name in ("first", "left", "right", "last")},
+        dependencies={"left": ["right"], "last": ["first", "left"]},
+        agent=tree
+    )
+    await asyncio.wait_for(executor.run(tree, SessionManager(), "dummy.mp4"), timeout=5)
+    print(f"完了順: {completed}")
+    if completed != ["first", "right", "left", "last"]:
+        print("エラー: 並列ブランチ間の依存関係が守られていません")
+        return False
+    
+    # 既定のエージェントツリーとSTAGE_DEPENDENCIESは矛盾しない
+    from ..utils.session_manager import STAGE_DEPENDENCIES
+    GraphExecutor({}, STAGE_DEPENDENCIES, agent=MountainVideoAnalyzerAgent().get_agent())
+    
+    return True
+
+async def test_shared_duration_probe():
+    """
+    シーン検出に渡した動画の長さが使われ、FFprobeが実行されないことのテスト
+    （FFmpegの実行を差し替えて、シーン変更点を出力させる）
+    """
+    print("\n=== 動画の長さの共有のテスト ===")
+    from ..tools import scene_detection
+    from ..tools.scene_detection import iter_scenes_async
+    
+    commands = []
+    
+    async def fake_run_process_async(command, stderr_callback=None, **kwargs):
+        commands.append(command[0])
+        if stderr_callback is not None:
+            for time in (10.0, 20.0):
+                stderr_callback(f"[Parsed_showinfo_1] n:0 pts:0 pts_time:{time} duration:0")
+        if command[0] == "ffprobe":
+            return 0, '{"format": {"duration": "40.0"}}', ""
+        return 0, "", ""
+    
+    original = scene_detection.run_process_async
+    scene_detection.run_process_async = fake_run_process_async
+    try:
+        duration_task = asyncio.ensure_future(asyncio.sleep(0.05, result=30.0))
+        scenes = [scene async for scene in iter_scenes_async("dummy.mp4", 5.0, video_duration=duration_task)]
+        
+        shared_commands = list(commands)
+        
+        # 動画の長さを渡さない場合は、FFprobeで取得する
+        commands.clear()
+        probed_scenes = [scene async for scene in iter_scenes_async("dummy.mp4", 5.0)]
+    finally:
+        scene_detection.run_process_async = original
+    
+    print(f"シーン: {[(scene['start_time'], scene['end_time']) for scene in scenes]}")
+    print(f"実行したコマンド: {shared_commands} / {commands}")
+    if shared_commands != ["ffmpeg"]:
+        print("エラー: 動画の長さを渡したのにFFprobeが実行されています")
+        return False
+    if len(scenes) != 3 or scenes[-1]["end_time"] != 30.0:
+        print("エラー: 渡した動画の長さが最後のシーンに使われていません")
+        return False
+    if sorted(commands) != ["ffmpeg", "ffprobe"] or probed_scenes[-1]["end_time"] != 40.0:
+        print("エラー: 動画の長さを渡さない場合にFFprobeで取得されていません")
+        return False
+    
+    return True
+
+async def test_process_scheduler():
+    """
+    プロセススケジューラーのテスト（優先度順の割り当て・同時実行数の上限・メトリクス・-threadsの追加）
+    """
+    print("\n=== プロセススケジューラーのテスト ===")
+    import threading
+    import time
+    from ..tools.process_scheduler import ProcessScheduler, PRIORITY_SHORT, PRIORITY_MEDIUM, PRIORITY_LONG
+    from ..tools.process_runner import with_thread_limit
+    
+    jobs = [("long", PRIORITY_LONG), ("medium", PRIORITY_MEDIUM), ("short1", PRIORITY_SHORT), ("short2", PRIORITY_SHORT)]
+    expected_order = ["short1", "short2", "medium", "long"]
+    
+    def wait_for_queue(scheduler, depth):
+        # 待機中のジョブがキューに入るまで待つ（到着順を決めるため1つずつ入れる）
+        deadline = time.monotonic() + 5
+        while scheduler.get_metrics()["queue_depth"] < depth:
+            if time.monotonic() > deadline:
+                raise TimeoutError("ジョブがキューに入りません")
+            time.sleep(0.001)
+    
+    # スレッドからの呼び出し: 実行枠を塞いだ状態で優先度の異なるジョブを待たせ、割り当て順を確認する
+    scheduler = ProcessScheduler(max_concurrent=1, cpu_count=4)
+    order = []
+    
+    def run_thread_job(name, priority):
+        with scheduler.slot(priority) as threads:
+            order.append((name, threads))
+    
+    scheduler.acquire()
+    threads = []
+    for depth, (name, priority) in enumerate(jobs, 1):
+        thread = threading.Thread(target=run_thread_job, args=(name, priority))
+        thread.start()
+        threads.append(thread)
+        wait_for_queue(scheduler, depth)
+    scheduler.release()
+    for thread in threads:
+        thread.join(timeout=5)
+    
+    print(f"スレッドの割り当て順: {order}")
+    if [name for name, _ in order] != expected_order:
+        print("エラー: スレッドのジョブが優先度順に実行されていません")
+        return False
+    if any(count != 4 for _, count in order):
+        print("エラー: 実行枠のスレッド数がコア数と同時実行数から計算されていません")
+        return False
+    
+    # 非同期の呼び出し: 同様に割り当て順を確認する
+    scheduler = ProcessScheduler(max_concurrent=1, cpu_count=4)
+    order = []
+    
+    async def run_async_job(name, priority):
+        async with scheduler.async_slot(priority):
+            order.append(name)
+    
+    await scheduler.acquire_async()
+    tasks = []
+    for depth, (name, priority) in enumerate(jobs, 1):
+        tasks.append(asyncio.ensure_future(run_async_job(name, priority)))
+        await asyncio.sleep(0)
+        if scheduler.get_metrics()["queue_depth"] != depth:
+            print("エラー: 非同期のジョブがキューに入っていません")
+            return False
+    scheduler.release()
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout=5)
+    
+    print(f"非同期の割り当て順: {order}")
+    if order != expected_order:
+        print("エラー: 非同期のジョブが優先度順に実行されていません")
+        return False
+    
+    # 同時実行数の上限とメトリクス
+    scheduler = ProcessScheduler(max_concurrent=2, cpu_count=4)
+    running = 0
+    max_running = 0
+    gate = asyncio.Event()
+    
+    async def run_capped_job():
+        nonlocal running, max_running
+        async with scheduler.async_slot():
+            running += 1
+            max_running = max(max_running, running)
+            await gate.wait()
+            running -= 1
+    
+    tasks = [asyncio.ensure_future(run_capped_job()) for _ in range(6)]
+    await asyncio.sleep(0.05)
+    metrics = scheduler.get_metrics()
+    print(f"実行中のメトリクス: {metrics}")
+    if metrics["running"] != 2 or metrics["queue_depth"] != 4 or metrics["threads_per_process"] != 2:
+        print("エラー: 実行中のメトリクスが正しくありません")
+        return False
+    
+    gate.set()
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout=5)
+    metrics = scheduler.get_metrics()
+    print(f"完了後のメトリクス: {metrics}")
+    if max_running != 2:
+        print(f"エラー: 同時実行数が上限を超えています（{max_running}）")
+        return False
+    if metrics["running"] != 0 or metrics["queue_depth"] != 0 or metrics["total_jobs"] != 6:
+        print("エラー: 完了後のメトリクスが正しくありません")
+        return False
+    if not metrics["max_wait_time"] > 0 or not 0 < metrics["average_wait_time"] <= metrics["max_wait_time"]:
+        print("エラー: 待機時間が記録されていません")
+        return False
+    
+    # FFmpegのコマンドにだけ-threadsを追加する（指定済みの場合はそのまま）
+    command = ["ffmpeg", "-i", "input.mp4", "-f", "null", "-"]
+    limited = with_thread_limit(command, 2)
+    if limited != ["ffmpeg", "-threads", "2", "-i", "input.mp4", "-f", "null", "-"] or limited is command:
+        print(f"エラー: -threadsが正しく追加されていません: {limited}")
+        return False
+    if with_thread_limit(["ffmpeg", "-threads", "8", "-i", "input.mp4"], 2) != ["ffmpeg", "-threads", "8", "-i", "input.mp4"]:
+        print("エラー: 指定済みの-threadsが変更されています")
+        return False
+    if with_thread_limit(["ffprobe", "-i", "input.mp4"], 2) != ["ffprobe", "-i", "input.mp4"]:
+        print("エラー: FFmpeg以外のコマンドに-threadsが追加されています")
+        return False
+    
+    return True
+
+async def test_process_kill_on_cancel():
+    """
+    実行中のプロセスをキャンセルした場合に子プロセスが強制終了・回収され、
+    回収したリソースの統計が更新されることのテスト
+    """
+    print("\n=== プロセスのキャンセルのテスト ===")
+    import sys
+    import time
+    from ..tools.process_runner import run_process_async
+    from ..tools.process_scheduler import get_scheduler
+    from ..tools.cancellation import get_reclaimed_metrics
+    
+    # 子プロセスは自分のPIDを出力してから60秒待つ
+    command = [sys.executable, "-c", "import os, time; print(os.getpid(), flush=True); time.sleep(60)"]
+    pids = []
+    started = asyncio.Event()
+    
+    def collect_pid(line):
+        pids.append(int(line))
+        started.set()
+    
+    before = get_reclaimed_metrics()
+    running_before = get_scheduler().get_metrics()["running"]
+    
+    start = time.perf_counter()
+    task = asyncio.ensure_future(run_process_async(command, stdout_callback=collect_pid))
+    await asyncio.wait_for(started.wait(), timeout=10)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    
+    after = get_reclaimed_metrics()
+    print(f"キャンセルまでの時間: {elapsed:.2f}秒")
+    print(f"回収したリソース: {before} -> {after}")
+    
+    if not task.cancelled():
+        print("エラー: タスクがキャンセルされていません")
+        return False
+    if elapsed >= 10:
+        print("エラー: 子プロセスの終了を待っています")
+        return False
+    
+    # 回収済み（ゾンビとして残っていない）プロセスにはシグナルを送れない
+    try:
+        os.kill(pids[0], 0)
+    except ProcessLookupError:
+        pass
+    else:
+        print(f"エラー: 子プロセス {pids[0]} が回収されていません")
+        return False
+    
+    if after["processes"] != before["processes"] + 1 or after["running_slots"] != before["running_slots"] + 1:
+        print("エラー: 回収したリソースの統計が更新されていません")
+        return False
+    if get_scheduler().get_metrics()["running"] != running_before:
+        print("エラー: キャンセルされたプロセスの実行枠が返却されていません")
+        return False
+    
+    return True
+
 async def run_tests(video_path):
     """
     すべてのテストを実行
@@ -118,12 +1536,112 @@ async def run_tests(video_path):
     # 完全なパイプラインのテスト
     pipeline_success = await test_full_pipeline(video_path)
     
+    # オンデマンド分析のテスト
+    lazy_analysis_success = await test_lazy_analysis(video_path)
+    
+    # ストリーミング処理のテスト
+    streaming_events_success = await test_streaming_events(video_path)
+    
+    # ライブ分析のテスト
+    live_ingest_success = await test_live_ingest(video_path)
+    
+    # ストリーミング処理の停止のテスト
+    stream_cancellation_success = await test_stream_cancellation(video_path)
+    
+    # イベントバッファのテスト
+    event_buffer_success = await test_event_buffer(video_path)
+    
+    # ストリーミング分析の共有のテスト
+    stream_fanout_success = await test_stream_fanout(video_path)
+    
+    # エージェントグラフ実行器のテスト
+    graph_executor_success = await test_graph_executor()
+    
+    # 説明文・編集提案生成のベンチマーク
+    indexed_joins_success = await test_indexed_joins()
+    
+    # SceneTableのテスト
+    scene_table_success = await test_scene_table()
+    
+    # 全文検索インデックスのテスト
+    text_index_success = await test_text_index()
+    
+    # ベクトルインデックスのテスト
+    vector_index_success = await test_vector_index()
+    
+    # フレーム分析の解析テスト
+    frame_analysis_parsing_success = await test_frame_analysis_parsing()
+    
+    # 応答キャッシュのテスト
+    response_cache_success = await test_response_cache()
+    
+    # プロパティの事前計算のテスト
+    property_precompute_success = await test_property_precompute()
+    
+    # ライブラリインデックスのテスト
+    library_index_success = await test_library_index()
+    
+    # SQLiteセッション状態のテスト
+    session_store_success = await test_session_store()
+    
+    # セッションレジストリのテスト
+    session_registry_success = await test_session_registry()
+    
+    # 状態の購読のテスト
+    state_subscription_success = await test_state_subscription()
+    
+    # チェックポイントからの再開のテスト
+    checkpoint_resume_success = await test_checkpoint_resume()
+    
+    # ジョブキューのテスト
+    job_queue_success = await test_job_queue()
+    
+    # バッチ処理のテスト
+    batch_processor_success = await test_batch_processor()
+    
+    # エージェントグラフ実行器の依存関係の検証のテスト
+    graph_executor_validation_success = await test_graph_executor_validation()
+    
+    # 動画の長さの共有のテスト
+    shared_duration_probe_success = await test_shared_duration_probe()
+    
+    # プロセススケジューラーのテスト
+    process_scheduler_success = await test_process_scheduler()
+    
+    # プロセスのキャンセルのテスト
+    process_kill_on_cancel_success = await test_process_kill_on_cancel()
+    
     # テスト結果のサマリー
     print("\n=== テスト結果サマリー ===")
     print(f"シーン検出: {'成功' if scene_detection_success else '失敗'}")
     print(f"音声認識: {'成功' if transcription_success else '失敗'}")
     print(f"画像分析: {'成功' if vision_analysis_success else '失敗'}")
     print(f"完全なパイプライン: {'成功' if pipeline_success else '失敗'}")
+    print(f"オンデマンド分析: {'成功' if lazy_analysis_success else '失敗'}")
+    print(f"ストリーミング処理: {'成功' if streaming_events_success else '失敗'}")
+    print(f"ライブ分析: {'成功' if live_ingest_success else '失敗'}")
+    print(f"ストリーミング処理の停止: {'成功' if stream_cancellation_success else '失敗'}")
+    print(f"イベントバッファ: {'成功' if event_buffer_success else '失敗'}")
+    print(f"ストリーミング分析の共有: {'成功' if stream_fanout_success else '失敗'}")
+    print(f"エージェントグラフ実行器: {'成功' if graph_executor_success else '失敗'}")
+    print(f"説明文・編集提案生成: {'成功' if indexed_joins_success else '失敗'}")
+    print(f"SceneTable: {'成功' if scene_table_success else '失敗'}")
+    print(f"全文検索インデックス: {'成功' if text_index_success else '失敗'}")
+    print(f"ベクトルインデックス: {'成功' if vector_index_success else '失敗'}")
+    print(f"フレーム分析の解析: {'成功' if frame_analysis_parsing_success else '失敗'}")
+    print(f"応答キャッシュ: {'成功' if response_cache_success else '失敗'}")
+    print(f"プロパティの事前計算: {'成功' if property_precompute_success else '失敗'}")
+    print(f"ライブラリインデックス: {'成功' if library_index_success else '失敗'}")
+    print(f"SQLiteセッション状態: {'成功' if session_store_success else '失敗'}")
+    print(f"セッションレジストリ: {'成功' if session_registry_success else '失敗'}")
+    print(f"状態の購読: {'成功' if state_subscription_success else '失敗'}")
+    print(f"チェックポイントからの再開: {'成功' if checkpoint_resume_success else '失敗'}")
+    print(f"ジョブキュー: {'成功' if job_queue_success else '失敗'}")
+    print(f"バッチ処理: {'成功' if batch_processor_success else '失敗'}")
+    print(f"エージェントグラフ実行器の依存関係の検証: {'成功' if graph_executor_validation_success else '失敗'}")
+    print(f"動画の長さの共有: {'成功' if shared_duration_probe_success else '失敗'}")
+    print(f"プロセススケジューラー: {'成功' if process_scheduler_success else '失敗'}")
+    print(f"プロセスのキャンセル: {'成功' if process_kill_on_cancel_success else '失敗'}")
     
     # 一時ファイルを削除
     if os.path.exists(audio_path):
@@ -1,6 +1,9 @@
 """
 tools/__init__.pyファイル - ツールパッケージ初期化
 """
-from .scene_detection import detect_scenes
-from .transcription import transcribe_audio
-from .vision_analysis import analyze_frames
+from .scene_detection import detect_scenes, detect_scenes_async
+from .transcription import transcribe_audio, transcribe_audio_async
+from .vision_analysis import analyze_frames, analyze_frames_async
+from .process_runner import run_process, run_process_async
+from .process_scheduler import ProcessScheduler, get_scheduler
+from .cancellation import get_reclaimed_metrics
@@ -0,0 +1,38 @@
+"""
+キャンセルの統計 - 中断されたジョブから回収したリソースを記録する
+"""
+import threading
+from collections import Counter
+
+# 回収したリソースの種類
+RECLAIMED_KINDS = (
+    "streams",        # 停止・切断されたストリーミング分析
+    "processes",      # 強制終了したFFmpeg/FFprobeプロセス
+    "queued_slots",   # 実行枠を待っている間にキャンセルされたジョブ
+    "running_slots",  # 実行中にキャンセルされ、実行枠を返却したジョブ
+    "model_calls"     # 応答を待っている間に中断したモデル呼び出し
+)
+
+_reclaimed = Counter()
+_reclaimed_lock = threading.Lock()
+
+def record_reclaimed(kind, count=1):
+    """
+    中断されたジョブから回収したリソースを記録します。
+
+    Args:
+        kind: リソースの種類（RECLAIMED_KINDSのいずれか）
+        count: 回収した数
+    """
+    with _reclaimed_lock:
+        _reclaimed[kind] += count
+
+def get_reclaimed_metrics():
+    """
+    プロセス全体で回収したリソースの数を取得します。
+
+    Returns:
+        dict: リソースの種類ごとの回収した数
+    """
+    with _reclaimed_lock:
+        return {kind: _reclaimed[kind] for kind in RECLAIMED_KINDS}
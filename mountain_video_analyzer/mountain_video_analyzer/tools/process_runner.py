@@ -0,0 +1,171 @@
+"""
+プロセス実行ツール - スケジューラーの実行枠内でFFmpeg/FFprobeを実行
+"""
+import asyncio
+import logging
+import re
+import subprocess
+from .process_scheduler import get_scheduler, PRIORITY_LONG
+from .cancellation import record_reclaimed
+
+# FFmpegの進捗表示は'\r'で区切られるため、両方の改行で行を分割する
+LINE_SEPARATOR = re.compile(r"\r\n|\r|\n")
+
+def run_process(cmd, priority=PRIORITY_LONG):
+    """
+    共有スケジューラーの実行枠を確保してからコマンドを同期的に実行します。
+
+    Args:
+        cmd: 実行するコマンドのリスト
+        priority: ジョブの優先度
+
+    Returns:
+        tuple: (終了コード, 標準出力, 標準エラー出力)
+    """
+    with get_scheduler().slot(priority) as threads:
+        process = subprocess.Popen(
+            with_thread_limit(cmd, threads),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True
+        )
+        
+        stdout, stderr = process.communicate()
+
+    return process.returncode, stdout, stderr
+
+async def run_process_async(cmd, stdout_callback=None, stderr_callback=None, capture_output=True,
+                            priority=PRIORITY_LONG):
+    """
+    共有スケジューラーの実行枠を確保してからコマンドを非同期に実行し、
+    標準出力と標準エラー出力を逐次読み取ります。
+    呼び出し元のタスクがキャンセルされた場合は子プロセスを強制終了します。
+
+    Args:
+        cmd: 実行するコマンドのリスト
+        stdout_callback: 標準出力の各行を受け取る関数（同期関数または非同期関数）
+        stderr_callback: 標準エラー出力の各行を受け取る関数（同期関数または非同期関数）
+        capture_output: Trueの場合は出力全体を保持して返す
+        priority: ジョブの優先度
+
+    Returns:
+        tuple: (終了コード, 標準出力, 標準エラー出力)
+    """
+    async with get_scheduler().async_slot(priority) as threads:
+        return await execute_process_async(
+            with_thread_limit(cmd, threads), stdout_callback, stderr_callback, capture_output
+        )
+
+def with_thread_limit(cmd, threads):
+    """
+    FFmpegコマンドにスレッド数の指定を追加します。FFmpeg以外のコマンドはそのまま返します。
+
+    Args:
+        cmd: 実行するコマンドのリスト
+        threads: 割り当てるスレッド数
+
+    Returns:
+        list: スレッド数を指定したコマンド
+    """
+    if cmd and cmd[0] == 'ffmpeg' and '-threads' not in cmd:
+        return [cmd[0], '-threads', str(threads), *cmd[1:]]
+    return list(cmd)
+
+async def execute_process_async(cmd, stdout_callback=None, stderr_callback=None, capture_output=True):
+    """
+    コマンドを非同期に実行します（スケジューラーを経由しない）。
+
+    Args:
+        cmd: 実行するコマンドのリスト
+        stdout_callback: 標準出力の各行を受け取る関数（同期関数または非同期関数）
+        stderr_callback: 標準エラー出力の各行を受け取る関数（同期関数または非同期関数）
+        capture_output: Trueの場合は出力全体を保持して返す
+
+    Returns:
+        tuple: (終了コード, 標準出力, 標準エラー出力)
+    """
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+
+    try:
+        stdout_lines, stderr_lines = await asyncio.gather(
+            read_stream_lines(process.stdout, stdout_callback, capture_output),
+            read_stream_lines(process.stderr, stderr_callback, capture_output)
+        )
+        returncode = await process.wait()
+    except BaseException:
+        # キャンセルやコールバックの例外時は子プロセスを残さない
+        await terminate_process(process)
+        raise
+
+    return returncode, "\n".join(stdout_lines), "\n".join(stderr_lines)
+
+async def read_stream_lines(stream, callback=None, capture_output=True):
+    """
+    ストリームを行単位で読み取ります。
+
+    Args:
+        stream: asyncio.StreamReader
+        callback: 各行を受け取る関数（同期関数または非同期関数）
+        capture_output: Trueの場合は読み取った行を返す
+
+    Returns:
+        list: 読み取った行のリスト（capture_outputがFalseの場合は空）
+    """
+    lines = []
+    buffer = ""
+
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+
+        buffer += chunk.decode("utf-8", errors="replace")
+        parts = LINE_SEPARATOR.split(buffer)
+        buffer = parts.pop()
+
+        for line in parts:
+            await handle_line(line, lines, callback, capture_output)
+
+    if buffer:
+        await handle_line(buffer, lines, callback, capture_output)
+
+    return lines
+
+async def handle_line(line, lines, callback, capture_output):
+    """
+    読み取った1行をコールバックに渡し、必要に応じて保持します。
+
+    Args:
+        line: 読み取った行
+        lines: 行を保持するリスト
+        callback: 行を受け取る関数
+        capture_output: Trueの場合は行を保持する
+    """
+    if capture_output:
+        lines.append(line)
+
+    if callback is not None:
+        result = callback(line)
+        if asyncio.iscoroutine(result):
+            await result
+
+async def terminate_process(process):
+    """
+    子プロセスを強制終了し、終了を待ちます。
+
+    Args:
+        process: asyncio.subprocess.Process
+    """
+    if process.returncode is None:
+        try:
+            process.kill()
+            record_reclaimed("processes")
+        except ProcessLookupError:
+            pass
+        logging.info(f"子プロセス {process.pid} を終了しました")
+
+    await process.wait()
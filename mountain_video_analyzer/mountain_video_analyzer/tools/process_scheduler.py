@@ -0,0 +1,253 @@
+"""
+プロセススケジューラー - FFmpeg/FFprobeの同時実行数とスレッド数を一元管理
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from ..config import CONFIG
+from .cancellation import record_reclaimed
+
+# ジョブの優先度（値が小さいほど優先）
+PRIORITY_SHORT = 0    # フレーム抽出・FFprobeなどの短いジョブ
+PRIORITY_MEDIUM = 5   # シーン単位の音声抽出
+PRIORITY_LONG = 10    # 動画全体のデコード
+
+class SchedulerWaiter:
+    """
+    実行枠を待っているジョブ
+    """
+    __slots__ = ("priority", "seq", "enqueued_at", "event", "loop", "future", "granted", "cancelled")
+
+    def __init__(self, priority, seq, event=None, loop=None, future=None):
+        """
+        SchedulerWaiterの初期化
+
+        Args:
+            priority: ジョブの優先度
+            seq: 同じ優先度内での到着順
+            event: 同期呼び出し用のイベント
+            loop: 非同期呼び出し元のイベントループ
+            future: 非同期呼び出し用のFuture
+        """
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.event = event
+        self.loop = loop
+        self.future = future
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class ProcessScheduler:
+    """
+    外部プロセスの実行枠を管理するスケジューラー
+
+    同時に実行できるプロセス数を制限し、待機中のジョブは優先度順（同じ優先度では到着順）に
+    実行枠を割り当てます。スレッドからの同期呼び出しとasyncioからの非同期呼び出しの両方に対応します。
+    """
+    def __init__(self, max_concurrent=None, cpu_count=None):
+        """
+        ProcessSchedulerの初期化
+
+        Args:
+            max_concurrent: 同時に実行できるプロセス数（Noneの場合はCONFIGから取得）
+            cpu_count: 利用可能なコア数（Noneの場合はos.cpu_count()）
+        """
+        scheduler_config = CONFIG["scheduler"]
+        self.cpu_count = cpu_count or os.cpu_count() or 1
+        self.max_concurrent = max_concurrent or scheduler_config["max_concurrent_processes"] or self.cpu_count
+        self.threads_per_process = (
+            scheduler_config["threads_per_process"]
+            or max(1, self.cpu_count // self.max_concurrent)
+        )
+
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._running = 0
+
+        # メトリクス
+        self._total_jobs = 0
+        self._total_wait_time = 0.0
+        self._max_wait_time = 0.0
+
+    def acquire(self, priority=PRIORITY_LONG):
+        """
+        実行枠を取得するまでスレッドをブロックする
+
+        Args:
+            priority: ジョブの優先度
+        """
+        with self._lock:
+            if self._try_acquire_locked():
+                return
+            waiter = SchedulerWaiter(priority, next(self._seq), event=threading.Event())
+            heapq.heappush(self._waiters, waiter)
+
+        waiter.event.wait()
+
+    async def acquire_async(self, priority=PRIORITY_LONG):
+        """
+        実行枠を取得するまで待機する（イベントループはブロックしない）
+
+        Args:
+            priority: ジョブの優先度
+        """
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            if self._try_acquire_locked():
+                return
+            waiter = SchedulerWaiter(priority, next(self._seq), loop=loop, future=loop.create_future())
+            heapq.heappush(self._waiters, waiter)
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                waiter.cancelled = True
+            # 割り当て直後にキャンセルされた場合は枠を返却する
+            if granted:
+                self.release()
+            record_reclaimed("queued_slots")
+            raise
+
+    def release(self):
+        """
+        実行枠を返却し、待機中の最優先ジョブに割り当てる
+        """
+        with self._lock:
+            while self._waiters:
+                waiter = heapq.heappop(self._waiters)
+                if not waiter.cancelled and self._grant_locked(waiter):
+                    return
+            self._running -= 1
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_LONG):
+        """
+        実行枠を確保するコンテキストマネージャー
+
+        Args:
+            priority: ジョブの優先度
+
+        Yields:
+            int: プロセスに割り当てるスレッド数
+        """
+        self.acquire(priority)
+        try:
+            yield self.threads_per_process
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def async_slot(self, priority=PRIORITY_LONG):
+        """
+        実行枠を確保する非同期コンテキストマネージャー
+
+        Args:
+            priority: ジョブの優先度
+
+        Yields:
+            int: プロセスに割り当てるスレッド数
+        """
+        await self.acquire_async(priority)
+        try:
+            yield self.threads_per_process
+        except asyncio.CancelledError:
+            record_reclaimed("running_slots")
+            raise
+        finally:
+            self.release()
+
+    def get_metrics(self):
+        """
+        スケジューラーのメトリクスを取得する
+
+        Returns:
+            dict: キューの深さ、実行中のプロセス数、待機時間などの統計
+        """
+        with self._lock:
+            queue_depth = sum(1 for waiter in self._waiters if not waiter.cancelled)
+            return {
+                "queue_depth": queue_depth,
+                "running": self._running,
+                "max_concurrent": self.max_concurrent,
+                "threads_per_process": self.threads_per_process,
+                "total_jobs": self._total_jobs,
+                "average_wait_time": self._total_wait_time / self._total_jobs if self._total_jobs else 0.0,
+                "max_wait_time": self._max_wait_time
+            }
+
+    def _try_acquire_locked(self):
+        """
+        待機せずに実行枠を取得できる場合は取得する（ロック取得済みで呼び出す）
+
+        Returns:
+            bool: 取得できた場合はTrue
+        """
+        if self._running < self.max_concurrent and not any(not w.cancelled for w in self._waiters):
+            self._running += 1
+            self._record_wait(0.0)
+            return True
+        return False
+
+    def _grant_locked(self, waiter):
+        """
+        待機中のジョブに実行枠を引き渡す（ロック取得済みで呼び出す）
+
+        Args:
+            waiter: 実行枠を割り当てるジョブ
+
+        Returns:
+            bool: 引き渡せた場合はTrue（呼び出し元のイベントループが終了している場合はFalse）
+        """
+        if waiter.event is not None:
+            waiter.event.set()
+        else:
+            future = waiter.future
+            try:
+                waiter.loop.call_soon_threadsafe(
+                    lambda: future.done() or future.set_result(None)
+                )
+            except RuntimeError:
+                return False
+
+        waiter.granted = True
+        self._record_wait(time.monotonic() - waiter.enqueued_at)
+        return True
+
+    def _record_wait(self, wait_time):
+        """
+        待機時間をメトリクスに記録する（ロック取得済みで呼び出す）
+
+        Args:
+            wait_time: 待機時間（秒）
+        """
+        self._total_jobs += 1
+        self._total_wait_time += wait_time
+        self._max_wait_time = max(self._max_wait_time, wait_time)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """
+    プロセス全体で共有するスケジューラーを取得します。
+
+    Returns:
+        ProcessScheduler: 共有スケジューラー
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ProcessScheduler()
+        return _scheduler
@@ -2,10 +2,17 @@
 FFmpegを使用したシーン検出ツール
 """
 import os
-import subprocess
+import asyncio
+import inspect
 import json
 import tempfile
 import logging
+from .process_runner import run_process, run_process_async
+from .process_scheduler import PRIORITY_SHORT, PRIORITY_LONG
+from ..models.scene_data import Scene, SceneTable
+
+# シーン変更点を検出し、showinfoで標準エラー出力に書き出すフィルター
+SCENE_DETECTION_FILTER = "select='gt(scene,0.3)',showinfo"
 
 def detect_scenes(video_path, min_scene_length=5.0):
     """
@@ -16,7 +23,7 @@ def detect_scenes(video_path, min_scene_length=5.0):
         min_scene_length: 最小シーン長（秒）
         
     Returns:
-        dict: 検出されたシーンのリスト（開始時間、終了時間を含む）
+        dict: 検出されたシーンのテーブル（SceneTable）
     """
     # ログ出力
     logging.info(f"動画 {video_path} のシーン検出を開始します")
@@ -27,73 +34,21 @@ def detect_scenes(video_path, min_scene_length=5.0):
         os.close(fd)
         
         # FFmpegを使用してシーン検出を実行
-        cmd = [
-            'ffmpeg',
-            '-i', video_path,
-            '-filter:v', f'select=\'gt(scene,0.3)\',showinfo',
-            '-f', 'null',
-            '-'
-        ]
+        cmd = build_scene_detection_command(video_path)
         
         # コマンド実行と出力キャプチャ
-        process = subprocess.Popen(
-            cmd, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE,
-            universal_newlines=True
-        )
-        
-        stdout, stderr = process.communicate()
+        returncode, stdout, stderr = run_process(cmd, PRIORITY_LONG)
         
         # 'showinfo'フィルターの出力からシーン変更点を抽出
         scene_changes = []
         for line in stderr.split('\n'):
-            if 'pts_time' in line:
-                try:
-                    time_str = line.split('pts_time:')[1].split(' ')[0]
-                    time = float(time_str)
-                    scene_changes.append(time)
-                except (IndexError, ValueError) as e:
-                    logging.warning(f"時間の解析に失敗しました: {e}")
+            time = parse_scene_change(line)
+            if time is not None:
+                scene_changes.append(time)
         
         # シーンの開始時間と終了時間のペアを作成
-        scenes = []
         video_duration = get_video_duration(video_path)
-        
-        if not scene_changes:
-            # シーン変更点がない場合は動画全体を1つのシーンとして扱う
-            scenes.append({
-                "scene_id": 1,
-                "start_time": 0.0,
-                "end_time": video_duration
-            })
-        else:
-            # シーン変更点を基にシーンを構築
-            scene_changes.insert(0, 0.0)  # 最初のシーンの開始時間
-            
-            for i in range(len(scene_changes)):
-                if i < len(scene_changes) - 1:
-                    start_time = scene_changes[i]
-                    end_time = scene_changes[i + 1]
-                    
-                    # 最小シーン長より長いシーンのみ含める
-                    if end_time - start_time >= min_scene_length:
-                        scenes.append({
-                            "scene_id": i + 1,
-                            "start_time": start_time,
-                            "end_time": end_time
-                        })
-                else:
-                    # 最後のシーン
-                    start_time = scene_changes[i]
-                    end_time = video_duration
-                    
-                    if end_time - start_time >= min_scene_length:
-                        scenes.append({
-                            "scene_id": i + 1,
-                            "start_time": start_time,
-                            "end_time": end_time
-                        })
+        scenes = build_scenes(scene_changes, video_duration, min_scene_length)
         
         return {"scenes": scenes}
         
@@ -106,6 +61,187 @@ def detect_scenes(video_path, min_scene_length=5.0):
             if os.path.exists(temp_file):
                 os.remove(temp_file)
 
+async def detect_scenes_async(video_path, min_scene_length=5.0):
+    """
+    detect_scenesの非同期版。FFmpegをasyncioサブプロセスで実行し、
+    showinfoの出力を逐次解析します。
+    
+    Args:
+        video_path: 分析する動画のパス
+        min_scene_length: 最小シーン長（秒）
+        
+    Returns:
+        dict: 検出されたシーンのテーブル（SceneTable）
+    """
+    logging.info(f"動画 {video_path} のシーン検出を開始します")
+    
+    scene_changes = []
+    
+    def collect_scene_change(line):
+        time = parse_scene_change(line)
+        if time is not None:
+            scene_changes.append(time)
+    
+    try:
+        await run_process_async(
+            build_scene_detection_command(video_path),
+            stderr_callback=collect_scene_change,
+            capture_output=False,
+            priority=PRIORITY_LONG
+        )
+        
+        video_duration = await get_video_duration_async(video_path)
+        scenes = build_scenes(scene_changes, video_duration, min_scene_length)
+        
+        return {"scenes": scenes}
+    
+    except Exception as e:
+        logging.error(f"シーン検出中にエラーが発生しました: {e}")
+        return {"error": str(e)}
+
+async def iter_scenes_async(video_path, min_scene_length=5.0, video_duration=None):
+    """
+    シーン境界が検出されるたびにシーンを返す非同期ジェネレーター。
+    動画全体のデコード完了を待たずに、確定したシーンから順に処理を開始できます。
+    ジェネレーターが途中で閉じられた場合はFFmpegプロセスを終了します。
+    
+    Args:
+        video_path: 分析する動画のパス
+        min_scene_length: 最小シーン長（秒）
+        video_duration: 動画の長さ（秒）、またはそれを返すタスク。
+                        呼び出し側でも動画の長さを使う場合に渡すと、FFprobeの実行が1回で済みます
+                        （Noneの場合は最後のシーンを確定するときにFFprobeで取得）
+        
+    Yields:
+        Scene: 確定したシーン
+    """
+    logging.info(f"動画 {video_path} のシーン検出を開始します")
+    
+    boundaries = asyncio.Queue()
+    
+    def collect_scene_change(line):
+        time = parse_scene_change(line)
+        if time is not None:
+            boundaries.put_nowait(time)
+    
+    async def run_detection():
+        try:
+            await run_process_async(
+                build_scene_detection_command(video_path),
+                stderr_callback=collect_scene_change,
+                capture_output=False,
+                priority=PRIORITY_LONG
+            )
+        finally:
+            # 検出の終了を通知
+            boundaries.put_nowait(None)
+    
+    detection_task = asyncio.create_task(run_detection())
+    
+    try:
+        start_time = 0.0
+        index = 0
+        
+        while True:
+            end_time = await boundaries.get()
+            if end_time is None:
+                break
+            
+            # 最小シーン長より長いシーンのみ含める
+            if end_time - start_time >= min_scene_length:
+                yield Scene(index + 1, start_time, end_time)
+            
+            start_time = end_time
+            index += 1
+        
+        # 検出プロセスの例外をここで送出する
+        await detection_task
+        
+        # 動画の長さは最後のシーンにだけ必要なため、シーン検出と並行して取得できるようにここで待つ
+        if video_duration is None:
+            video_duration = await get_video_duration_async(video_path)
+        elif inspect.isawaitable(video_duration):
+            video_duration = await video_duration
+        
+        # 最後のシーン（シーン変更点がない場合は動画全体）
+        if index == 0 or video_duration - start_time >= min_scene_length:
+            yield Scene(index + 1, start_time, video_duration)
+    
+    finally:
+        if not detection_task.done():
+            detection_task.cancel()
+            await asyncio.gather(detection_task, return_exceptions=True)
+
+def build_scene_detection_command(video_path):
+    """
+    シーン検出用のFFmpegコマンドを作成します。
+    
+    Args:
+        video_path: 分析する動画のパス
+        
+    Returns:
+        list: FFmpegコマンド
+    """
+    return [
+        'ffmpeg',
+        '-i', video_path,
+        '-filter:v', SCENE_DETECTION_FILTER,
+        '-f', 'null',
+        '-'
+    ]
+
+def parse_scene_change(line):
+    """
+    showinfoフィルターの出力行からシーン変更点の時間を取得します。
+    
+    Args:
+        line: FFmpegの標準エラー出力の1行
+        
+    Returns:
+        float: シーン変更点の時間（秒）。該当しない行の場合はNone
+    """
+    if 'pts_time' not in line:
+        return None
+    
+    try:
+        time_str = line.split('pts_time:')[1].split(' ')[0]
+        return float(time_str)
+    except (IndexError, ValueError) as e:
+        logging.warning(f"時間の解析に失敗しました: {e}")
+        return None
+
+def build_scenes(scene_changes, video_duration, min_scene_length):
+    """
+    シーン変更点のリストからシーンを構築します。
+    
+    Args:
+        scene_changes: シーン変更点の時間のリスト
+        video_duration: 動画の長さ（秒）
+        min_scene_length: 最小シーン長（秒）
+        
+    Returns:
+        SceneTable: シーンのテーブル
+    """
+    scenes = SceneTable(len(scene_changes) + 1)
+    
+    if not scene_changes:
+        # シーン変更点がない場合は動画全体を1つのシーンとして扱う
+        scenes.append(Scene(1, 0.0, video_duration))
+        return scenes
+    
+    # シーン変更点を基にシーンを構築
+    boundaries = [0.0] + list(scene_changes) + [video_duration]
+    
+    for i in range(len(boundaries) - 1):
+        start_time = boundaries[i]
+        end_time = boundaries[i + 1]
+        
+        # 最小シーン長より長いシーンのみ含める
+        if end_time - start_time >= min_scene_length:
+            scenes.append(Scene(i + 1, start_time, end_time))
+    
+    return scenes
+
 def get_video_duration(video_path):
     """
     動画の長さを取得します。
@@ -116,26 +252,62 @@ def get_video_duration(video_path):
     Returns:
         float: 動画の長さ（秒）
     """
-    cmd = [
+    cmd = build_duration_command(video_path)
+    
+    returncode, stdout, stderr = run_process(cmd, PRIORITY_SHORT)
+    
+    if stderr:
+        logging.warning(f"動画の長さ取得中に警告: {stderr}")
+    
+    return parse_duration(stdout)
+
+async def get_video_duration_async(video_path):
+    """
+    get_video_durationの非同期版
+    
+    Args:
+        video_path: 動画ファイルのパス
+        
+    Returns:
+        float: 動画の長さ（秒）
+    """
+    returncode, stdout, stderr = await run_process_async(
+        build_duration_command(video_path), priority=PRIORITY_SHORT
+    )
+    
+    if stderr:
+        logging.warning(f"動画の長さ取得中に警告: {stderr}")
+    
+    return parse_duration(stdout)
+
+def build_duration_command(video_path):
+    """
+    動画の長さを取得するFFprobeコマンドを作成します。
+    
+    Args:
+        video_path: 動画ファイルのパス
+        
+    Returns:
+        list: FFprobeコマンド
+    """
+    return [
         'ffprobe', 
         '-v', 'error', 
         '-show_entries', 'format=duration', 
         '-of', 'json', 
         video_path
     ]
+
+def parse_duration(stdout):
+    """
+    FFprobeのJSON出力から動画の長さを取得します。
     
-    process = subprocess.Popen(
-        cmd, 
-        stdout=subprocess.PIPE, 
-        stderr=subprocess.PIPE,
-        universal_newlines=True
-    )
-    
-    stdout, stderr = process.communicate()
-    
-    if stderr:
-        logging.warning(f"動画の長さ取得中に警告: {stderr}")
-    
+    Args:
+        stdout: FFprobeの標準出力
+        
+    Returns:
+        float: 動画の長さ（秒）
+    """
     try:
         data = json.loads(stdout)
         return float(data['format']['duration'])
@@ -3,9 +3,13 @@
 """
 import os
 import tempfile
-import subprocess
 import json
+import wave
+import asyncio
 import logging
+from .process_runner import run_process, run_process_async
+from .process_scheduler import PRIORITY_MEDIUM, PRIORITY_LONG
+from ..models.segment import TranscriptSegment
 
 def transcribe_audio(video_path, scenes=None):
     """
@@ -32,6 +36,30 @@ def transcribe_audio(video_path, scenes=None):
         logging.error(f"音声認識中にエラーが発生しました: {e}")
         return {"error": str(e)}
 
+async def transcribe_audio_async(video_path, scenes=None):
+    """
+    transcribe_audioの非同期版。音声抽出はasyncioサブプロセスで、
+    音声認識はエグゼキューターで実行します。
+    
+    Args:
+        video_path: 動画ファイルのパス
+        scenes: シーンのリスト。指定された場合、シーンごとに書き起こしを行う
+        
+    Returns:
+        dict: 書き起こし結果
+    """
+    logging.info(f"動画 {video_path} の音声認識を開始します")
+    
+    try:
+        if scenes is None:
+            return await transcribe_whole_video_async(video_path)
+        else:
+            return await transcribe_by_scenes_async(video_path, scenes)
+    
+    except Exception as e:
+        logging.error(f"音声認識中にエラーが発生しました: {e}")
+        return {"error": str(e)}
+
 def transcribe_whole_video(video_path):
     """
     動画全体の音声を書き起こします。
@@ -59,6 +87,31 @@ def transcribe_whole_video(video_path):
         if os.path.exists(temp_audio_path):
             os.remove(temp_audio_path)
 
+async def transcribe_whole_video_async(video_path):
+    """
+    transcribe_whole_videoの非同期版
+    
+    Args:
+        video_path: 動画ファイルのパス
+        
+    Returns:
+        dict: 書き起こし結果
+    """
+    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_audio:
+        temp_audio_path = temp_audio.name
+    
+    try:
+        await extract_audio_async(video_path, temp_audio_path)
+        
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, analyze_audio, temp_audio_path)
+        
+        return {"transcription": result}
+    
+    finally:
+        if os.path.exists(temp_audio_path):
+            os.remove(temp_audio_path)
+
 def transcribe_by_scenes(video_path, scenes):
     """
     シーンごとに音声を書き起こします。
@@ -73,34 +126,125 @@ def transcribe_by_scenes(video_path, scenes):
     scene_transcriptions = []
     
     for scene in scenes:
-        scene_id = scene["scene_id"]
-        start_time = scene["start_time"]
-        end_time = scene["end_time"]
-        
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_audio:
-            temp_audio_path = temp_audio.name
-        
-        try:
-            # シーンの音声を抽出
-            extract_audio_segment(video_path, temp_audio_path, start_time, end_time)
-            
-            # 音声認識を実行
-            result = analyze_audio(temp_audio_path)
-            
-            scene_transcriptions.append({
-                "scene_id": scene_id,
-                "start_time": start_time,
-                "end_time": end_time,
-                "text": result
-            })
-        
-        finally:
-            # 一時ファイルを削除
-            if os.path.exists(temp_audio_path):
-                os.remove(temp_audio_path)
+        scene_transcriptions.append(transcribe_scene(video_path, scene))
     
     return {"scene_transcriptions": scene_transcriptions}
 
+async def transcribe_by_scenes_async(video_path, scenes):
+    """
+    transcribe_by_scenesの非同期版
+    
+    Args:
+        video_path: 動画ファイルのパス
+        scenes: シーンのリスト
+        
+    Returns:
+        dict: シーンごとの書き起こし結果
+    """
+    scene_transcriptions = []
+    
+    for scene in scenes:
+        scene_transcriptions.append(await transcribe_scene_async(video_path, scene))
+    
+    return {"scene_transcriptions": scene_transcriptions}
+
+def transcribe_scene(video_path, scene):
+    """
+    1つのシーンの音声を書き起こします。
+    
+    Args:
+        video_path: 動画ファイルのパス
+        scene: シーン情報（scene_id, start_time, end_timeを含む）
+        
+    Returns:
+        TranscriptSegment: シーンの書き起こし結果
+    """
+    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_audio:
+        temp_audio_path = temp_audio.name
+    
+    try:
+        # シーンの音声を抽出
+        extract_audio_segment(video_path, temp_audio_path, scene["start_time"], scene["end_time"])
+        
+        # 音声認識を実行
+        result = analyze_audio(temp_audio_path)
+        
+        return TranscriptSegment(scene["scene_id"], scene["start_time"], scene["end_time"], result)
+    
+    finally:
+        # 一時ファイルを削除
+        if os.path.exists(temp_audio_path):
+            os.remove(temp_audio_path)
+
+async def transcribe_scene_async(video_path, scene):
+    """
+    transcribe_sceneの非同期版
+    
+    Args:
+        video_path: 動画ファイルのパス
+        scene: シーン情報（scene_id, start_time, end_timeを含む）
+        
+    Returns:
+        TranscriptSegment: シーンの書き起こし結果
+    """
+    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_audio:
+        temp_audio_path = temp_audio.name
+    
+    try:
+        await extract_audio_segment_async(video_path, temp_audio_path, scene["start_time"], scene["end_time"])
+        
+        # 音声認識はCPU負荷が高いためエグゼキューターで実行
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, analyze_audio, temp_audio_path)
+        
+        return TranscriptSegment(scene["scene_id"], scene["start_time"], scene["end_time"], result)
+    
+    finally:
+        if os.path.exists(temp_audio_path):
+            os.remove(temp_audio_path)
+
+async def transcribe_samples_async(scene, samples, sample_rate=16000):
+    """
+    抽出済みの音声サンプルから1つのシーンを書き起こします（ライブ入力用）。
+    
+    Args:
+        scene: シーン情報（scene_id, start_time, end_timeを含む）
+        samples: 16ビットモノラルPCMのバイト列
+        sample_rate: サンプルレート
+        
+    Returns:
+        TranscriptSegment: シーンの書き起こし結果
+    """
+    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_audio:
+        temp_audio_path = temp_audio.name
+    
+    try:
+        write_wav(temp_audio_path, samples, sample_rate)
+        
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, analyze_audio, temp_audio_path)
+        
+        return TranscriptSegment(scene["scene_id"], scene["start_time"], scene["end_time"], result)
+    
+    finally:
+        if os.path.exists(temp_audio_path):
+            os.remove(temp_audio_path)
+
+def write_wav(output_path, samples, sample_rate=16000):
+    """
+    16ビットモノラルPCMのバイト列をWAVファイルとして保存します。
+    
+    Args:
+        output_path: 出力する音声ファイルのパス
+        samples: 16ビットモノラルPCMのバイト列
+        sample_rate: サンプルレート
+    """
+    with wave.open(output_path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples)
+
 def extract_audio(video_path, output_path):
     """
     動画から音声を抽出します。
@@ -109,7 +253,75 @@ def extract_audio(video_path, output_path):
         video_path: 動画ファイルのパス
         output_path: 出力する音声ファイルのパス
     """
-    cmd = [
+    cmd = build_extract_audio_command(video_path, output_path)
+    
+    returncode, stdout, stderr = run_process(cmd, PRIORITY_LONG)
+    
+    if returncode != 0:
+        raise Exception(f"音声抽出に失敗しました: {stderr}")
+
+def extract_audio_segment(video_path, output_path, start_time, end_time):
+    """
+    動画の指定された区間から音声を抽出します。
+    
+    Args:
+        video_path: 動画ファイルのパス
+        output_path: 出力する音声ファイルのパス
+        start_time: 開始時間（秒）
+        end_time: 終了時間（秒）
+    """
+    cmd = build_extract_audio_segment_command(video_path, output_path, start_time, end_time)
+    
+    returncode, stdout, stderr = run_process(cmd, PRIORITY_MEDIUM)
+    
+    if returncode != 0:
+        raise Exception(f"音声セグメント抽出に失敗しました: {stderr}")
+
+async def extract_audio_async(video_path, output_path):
+    """
+    extract_audioの非同期版
+    
+    Args:
+        video_path: 動画ファイルのパス
+        output_path: 出力する音声ファイルのパス
+    """
+    returncode, stdout, stderr = await run_process_async(
+        build_extract_audio_command(video_path, output_path), priority=PRIORITY_LONG
+    )
+    
+    if returncode != 0:
+        raise Exception(f"音声抽出に失敗しました: {stderr}")
+
+async def extract_audio_segment_async(video_path, output_path, start_time, end_time):
+    """
+    extract_audio_segmentの非同期版
+    
+    Args:
+        video_path: 動画ファイルのパス
+        output_path: 出力する音声ファイルのパス
+        start_time: 開始時間（秒）
+        end_time: 終了時間（秒）
+    """
+    returncode, stdout, stderr = await run_process_async(
+        build_extract_audio_segment_command(video_path, output_path, start_time, end_time),
+        priority=PRIORITY_MEDIUM
+    )
+    
+    if returncode != 0:
+        raise Exception(f"音声セグメント抽出に失敗しました: {stderr}")
+
+def build_extract_audio_command(video_path, output_path):
+    """
+    動画全体の音声を抽出するFFmpegコマンドを作成します。
+    
+    Args:
+        video_path: 動画ファイルのパス
+        output_path: 出力する音声ファイルのパス
+        
+    Returns:
+        list: FFmpegコマンド
+    """
+    return [
         'ffmpeg',
         '-i', video_path,
         '-vn',  # 映像を無効化
@@ -119,32 +331,23 @@ def extract_audio(video_path, output_path):
         '-y',  # 既存のファイルを上書き
         output_path
     ]
-    
-    process = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        universal_newlines=True
-    )
-    
-    stdout, stderr = process.communicate()
-    
-    if process.returncode != 0:
-        raise Exception(f"音声抽出に失敗しました: {stderr}")
 
-def extract_audio_segment(video_path, output_path, start_time, end_time):
+def build_extract_audio_segment_command(video_path, output_path, start_time, end_time):
     """
-    動画の指定された区間から音声を抽出します。
+    指定区間の音声を抽出するFFmpegコマンドを作成します。
     
     Args:
         video_path: 動画ファイルのパス
         output_path: 出力する音声ファイルのパス
         start_time: 開始時間（秒）
         end_time: 終了時間（秒）
+        
+    Returns:
+        list: FFmpegコマンド
     """
     duration = end_time - start_time
     
-    cmd = [
+    return [
         'ffmpeg',
         '-ss', str(start_time),  # 開始時間
         '-i', video_path,
@@ -156,18 +359,6 @@ def extract_audio_segment(video_path, output_path, start_time, end_time):
         '-y',  # 既存のファイルを上書き
         output_path
     ]
-    
-    process = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        universal_newlines=True
-    )
-    
-    stdout, stderr = process.communicate()
-    
-    if process.returncode != 0:
-        raise Exception(f"音声セグメント抽出に失敗しました: {stderr}")
 
 def analyze_audio(audio_path):
     """
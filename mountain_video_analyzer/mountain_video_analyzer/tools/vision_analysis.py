@@ -2,11 +2,30 @@
 Gemini 1.5 Flashを使用した画像分析ツール
 """
 import os
-import subprocess
+import re
+import json
 import tempfile
+import asyncio
 import logging
 import google.generativeai as genai
 from ..config import CONFIG, GEMINI_API_KEY
+from .process_runner import run_process, run_process_async
+from .process_scheduler import PRIORITY_SHORT
+from .cancellation import record_reclaimed
+from ..models.segment import FrameAnalysis, FallbackFrameAnalysis
+
+# フレーム分析のプロンプト
+FRAME_ANALYSIS_PROMPT = """
+                    この登山動画のフレームを分析し、以下の情報を抽出してください：
+                    1. 場所の特徴（山の種類、地形、標高など）
+                    2. 活動内容（登山、休憩、景色の鑑賞など）
+                    3. 天候状況（晴れ、曇り、雨など）
+                    4. 時間帯（朝、昼、夕方、夜など）
+                    5. 特筆すべき風景や自然の特徴
+                    6. 登山者の状況や装備
+                    
+                    JSON形式で回答してください。
+                    """
 
 def analyze_frames(video_path, timestamps):
     """
@@ -19,72 +38,47 @@ def analyze_frames(video_path, timestamps):
     Returns:
         dict: フレーム分析結果
     """
-    frames_per_scene = CONFIG["analysis"]["frames_per_scene"]
-    
     logging.info(f"動画 {video_path} のフレーム分析を開始します")
     
     try:
         # Geminiモデルを初期化
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel(
-            model_name=CONFIG["models"]["vision"]
-        )
+        model = create_vision_model()
         
         # 一時ディレクトリを作成
         with tempfile.TemporaryDirectory() as temp_dir:
             frame_analyses = []
             
             for timestamp in timestamps:
-                frame_paths = []
-                
-                # 指定されたタイムスタンプの前後からフレームを抽出
-                for i in range(frames_per_scene):
-                    # タイムスタンプに対して均等に分散したフレームを抽出
-                    offset = i * (1.0 / frames_per_scene) - 0.5
-                    frame_time = max(0, timestamp + offset)
-                    
-                    frame_path = os.path.join(temp_dir, f"frame_{timestamp}_{i}.jpg")
-                    
-                    # FFmpegを使用してフレームを抽出
-                    extract_frame(video_path, frame_path, frame_time)
-                    
-                    frame_paths.append(frame_path)
-                
-                # 抽出したフレームを分析
-                frame_contents = []
-                for frame_path in frame_paths:
-                    if os.path.exists(frame_path) and os.path.getsize(frame_path) > 0:
-                        with open(frame_path, "rb") as f:
-                            frame_contents.append({"mime_type": "image/jpeg", "data": f.read()})
-                
-                # Geminiモデルを使用してフレームを分析
-                if frame_contents:
-                    prompt = """
-                    この登山動画のフレームを分析し、以下の情報を抽出してください：
-                    1. 場所の特徴（山の種類、地形、標高など）
-                    2. 活動内容（登山、休憩、景色の鑑賞など）
-                    3. 天候状況（晴れ、曇り、雨など）
-                    4. 時間帯（朝、昼、夕方、夜など）
-                    5. 特筆すべき風景や自然の特徴
-                    6. 登山者の状況や装備
-                    
-                    JSON形式で回答してください。
-                    """
-                    
-                    try:
-                        response = model.generate_content([prompt, *frame_contents])
-                        analysis_text = response.text
-                    except Exception as e:
-                        logging.error(f"Gemini APIエラー: {e}")
-                        analysis_text = generate_mock_analysis(timestamp)
-                else:
-                    analysis_text = generate_mock_analysis(timestamp)
-                
-                # 分析結果を整形
-                frame_analyses.append({
-                    "timestamp": timestamp,
-                    "analysis": analysis_text
-                })
+                frame_analyses.append(analyze_timestamp(model, video_path, timestamp, temp_dir))
+            
+            return {"frame_analyses": frame_analyses}
+    
+    except Exception as e:
+        logging.error(f"フレーム分析中にエラーが発生しました: {e}")
+        return {"error": str(e)}
+
+async def analyze_frames_async(video_path, timestamps):
+    """
+    analyze_framesの非同期版。フレーム抽出はasyncioサブプロセスで、
+    Geminiの呼び出しは非同期APIで実行します。
+    
+    Args:
+        video_path: 動画ファイルのパス
+        timestamps: 分析するタイムスタンプのリスト
+        
+    Returns:
+        dict: フレーム分析結果
+    """
+    logging.info(f"動画 {video_path} のフレーム分析を開始します")
+    
+    try:
+        model = create_vision_model()
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            frame_analyses = []
+            
+            for timestamp in timestamps:
+                frame_analyses.append(await analyze_timestamp_async(model, video_path, timestamp, temp_dir))
             
             return {"frame_analyses": frame_analyses}
     
@@ -92,6 +86,254 @@ def analyze_frames(video_path, timestamps):
         logging.error(f"フレーム分析中にエラーが発生しました: {e}")
         return {"error": str(e)}
 
+def create_vision_model():
+    """
+    フレーム分析用のGeminiモデルを作成します。
+    
+    Returns:
+        GenerativeModel: Geminiモデル
+    """
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai.GenerativeModel(
+        model_name=CONFIG["models"]["vision"]
+    )
+
+def analyze_timestamp(model, video_path, timestamp, temp_dir):
+    """
+    1つのタイムスタンプ周辺のフレームを抽出して分析します。
+    
+    Args:
+        model: Geminiモデル
+        video_path: 動画ファイルのパス
+        timestamp: 分析するタイムスタンプ
+        temp_dir: フレーム画像を保存する一時ディレクトリ
+        
+    Returns:
+        FrameAnalysis: フレーム分析結果
+    """
+    frame_paths = []
+    
+    # 指定されたタイムスタンプの前後からフレームを抽出
+    for i, frame_time in enumerate(get_frame_times(timestamp)):
+        frame_path = os.path.join(temp_dir, f"frame_{timestamp}_{i}.jpg")
+        
+        # FFmpegを使用してフレームを抽出
+        extract_frame(video_path, frame_path, frame_time)
+        
+        frame_paths.append(frame_path)
+    
+    # 抽出したフレームを分析
+    frame_contents = load_frame_contents(frame_paths)
+    
+    # Geminiモデルを使用してフレームを分析
+    if frame_contents:
+        try:
+            response = model.generate_content([FRAME_ANALYSIS_PROMPT, *frame_contents])
+            analysis_text = response.text
+        except Exception as e:
+            logging.error(f"Gemini APIエラー: {e}")
+            return generate_fallback_analysis(timestamp)
+    else:
+        return generate_fallback_analysis(timestamp)
+    
+    # 分析結果を整形
+    return FrameAnalysis(timestamp, analysis_text, **parse_frame_analysis(analysis_text))
+
+async def analyze_timestamp_async(model, video_path, timestamp, temp_dir):
+    """
+    analyze_timestampの非同期版
+    
+    Args:
+        model: Geminiモデル
+        video_path: 動画ファイルのパス
+        timestamp: 分析するタイムスタンプ
+        temp_dir: フレーム画像を保存する一時ディレクトリ
+        
+    Returns:
+        FrameAnalysis: フレーム分析結果
+    """
+    frame_paths = []
+    
+    for i, frame_time in enumerate(get_frame_times(timestamp)):
+        frame_path = os.path.join(temp_dir, f"frame_{timestamp}_{i}.jpg")
+        await extract_frame_async(video_path, frame_path, frame_time)
+        frame_paths.append(frame_path)
+    
+    return await analyze_frame_files_async(model, timestamp, frame_paths)
+
+async def analyze_frame_files_async(model, timestamp, frame_paths):
+    """
+    抽出済みのフレーム画像を分析します。存在しない画像は無視します。
+    
+    Args:
+        model: Geminiモデル
+        timestamp: フレームのタイムスタンプ
+        frame_paths: フレーム画像のパスのリスト
+        
+    Returns:
+        FrameAnalysis: フレーム分析結果
+    """
+    frame_contents = load_frame_contents(frame_paths)
+    
+    if frame_contents:
+        try:
+            response = await model.generate_content_async([FRAME_ANALYSIS_PROMPT, *frame_contents])
+            analysis_text = response.text
+        except asyncio.CancelledError:
+            # 分析が中断された場合は応答を待たずにリクエストを破棄する
+            record_reclaimed("model_calls")
+            raise
+        except Exception as e:
+            logging.error(f"Gemini APIエラー: {e}")
+            return generate_fallback_analysis(timestamp)
+    else:
+        return generate_fallback_analysis(timestamp)
+    
+    return FrameAnalysis(timestamp, analysis_text, **parse_frame_analysis(analysis_text))
+
+# 応答のJSONのキーに含まれる語と、対応するフィールド（先に一致したものを採用）
+FRAME_PROPERTY_KEYWORDS = [
+    ("location", ("場所",)),
+    ("activity", ("活動",)),
+    ("weather", ("天候", "天気")),
+    ("time_of_day", ("時間帯",)),
+    ("scenery", ("風景", "自然")),
+    ("climber", ("登山者", "装備"))
+]
+
+# 応答を囲むMarkdownのコードブロック
+CODE_FENCE_PATTERN = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+
+def parse_frame_analysis(text):
+    """
+    フレーム分析の応答テキストをJSONとして解析し、構造化フィールドに変換します。
+    
+    応答がコードブロックで囲まれている場合や、前後に説明文がある場合も
+    最初のJSONオブジェクトを取り出して解析します。
+    
+    Args:
+        text: モデルの応答テキスト
+        
+    Returns:
+        dict: フィールド名をキー、文字列を値とする辞書（解析できない場合は空）
+    """
+    data = extract_json_object(text)
+    if data is None:
+        return {}
+    
+    properties = {}
+    for key, value in data.items():
+        for name, keywords in FRAME_PROPERTY_KEYWORDS:
+            if name not in properties and any(keyword in key for keyword in keywords):
+                properties[name] = format_property_value(value)
+                break
+    
+    return properties
+
+def extract_json_object(text):
+    """
+    モデルの応答テキストから最初のJSONオブジェクトを取り出します。
+    
+    応答がコードブロックで囲まれている場合や、前後に説明文がある場合にも対応します。
+    
+    Args:
+        text: モデルの応答テキスト
+        
+    Returns:
+        dict: JSONオブジェクト（取り出せない場合はNone）
+    """
+    if not text:
+        return None
+    
+    fenced = CODE_FENCE_PATTERN.search(text)
+    if fenced:
+        text = fenced.group(1)
+    
+    start = text.find("{")
+    end = text.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    
+    return data if isinstance(data, dict) else None
+
+def ensure_parsed(analysis):
+    """
+    フレーム分析結果を、構造化フィールドを持つFrameAnalysisに変換します。
+    
+    解析済みのフィールドを持たない結果（変更前に保存されたセッションやチェックポイント）は
+    分析テキストをその場で解析します。
+    
+    Args:
+        analysis: フレーム分析結果（辞書またはFrameAnalysis）
+        
+    Returns:
+        FrameAnalysis: フレーム分析結果
+    """
+    analysis = FrameAnalysis.from_dict(analysis)
+    if analysis.parsed:
+        return analysis
+    
+    return FrameAnalysis(
+        analysis["timestamp"],
+        analysis["analysis"],
+        **parse_frame_analysis(analysis["analysis"])
+    )
+
+def format_property_value(value):
+    """
+    JSONの値を1つの文字列に変換します。
+    
+    Args:
+        value: JSONの値（文字列・数値・リスト・オブジェクト）
+        
+    Returns:
+        str: 文字列
+    """
+    if isinstance(value, list):
+        return "、".join(format_property_value(item) for item in value)
+    if isinstance(value, dict):
+        return "、".join(f"{key}: {format_property_value(item)}" for key, item in value.items())
+    return str(value).strip()
+
+def get_frame_times(timestamp):
+    """
+    タイムスタンプの前後から均等に分散したフレームの時間を求めます。
+    
+    Args:
+        timestamp: 基準となるタイムスタンプ
+        
+    Returns:
+        list: フレームを抽出する時間のリスト
+    """
+    frames_per_scene = CONFIG["analysis"]["frames_per_scene"]
+    
+    return [
+        max(0, timestamp + i * (1.0 / frames_per_scene) - 0.5)
+        for i in range(frames_per_scene)
+    ]
+
+def load_frame_contents(frame_paths):
+    """
+    抽出済みのフレーム画像をGeminiに渡す形式で読み込みます。
+    
+    Args:
+        frame_paths: フレーム画像のパスのリスト
+        
+    Returns:
+        list: 画像データのリスト
+    """
+    frame_contents = []
+    for frame_path in frame_paths:
+        if os.path.exists(frame_path) and os.path.getsize(frame_path) > 0:
+            with open(frame_path, "rb") as f:
+                frame_contents.append({"mime_type": "image/jpeg", "data": f.read()})
+    return frame_contents
+
 def extract_frame(video_path, output_path, timestamp):
     """
     指定された時間のフレームを抽出します。
@@ -102,31 +344,73 @@ def extract_frame(video_path, output_path, timestamp):
         timestamp: 抽出する時間（秒）
     """
     try:
-        cmd = [
-            'ffmpeg',
-            '-ss', str(timestamp),  # 開始時間
-            '-i', video_path,
-            '-frames:v', '1',  # 1フレームだけ抽出
-            '-q:v', '2',  # 高品質
-            '-y',  # 既存のファイルを上書き
-            output_path
-        ]
-        
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True
-        )
+        cmd = build_extract_frame_command(video_path, output_path, timestamp)
         
-        stdout, stderr = process.communicate()
+        returncode, stdout, stderr = run_process(cmd, PRIORITY_SHORT)
         
-        if process.returncode != 0:
+        if returncode != 0:
             logging.warning(f"フレーム抽出に失敗しました: {stderr}")
     
     except Exception as e:
         logging.error(f"フレーム抽出中にエラーが発生しました: {e}")
 
+async def extract_frame_async(video_path, output_path, timestamp):
+    """
+    extract_frameの非同期版
+    
+    Args:
+        video_path: 動画ファイルのパス
+        output_path: 出力するフレーム画像のパス
+        timestamp: 抽出する時間（秒）
+    """
+    try:
+        returncode, stdout, stderr = await run_process_async(
+            build_extract_frame_command(video_path, output_path, timestamp),
+            priority=PRIORITY_SHORT
+        )
+        
+        if returncode != 0:
+            logging.warning(f"フレーム抽出に失敗しました: {stderr}")
+    
+    except Exception as e:
+        logging.error(f"フレーム抽出中にエラーが発生しました: {e}")
+
+def build_extract_frame_command(video_path, output_path, timestamp):
+    """
+    フレーム抽出用のFFmpegコマンドを作成します。
+    
+    Args:
+        video_path: 動画ファイルのパス
+        output_path: 出力するフレーム画像のパス
+        timestamp: 抽出する時間（秒）
+        
+    Returns:
+        list: FFmpegコマンド
+    """
+    return [
+        'ffmpeg',
+        '-ss', str(timestamp),  # 開始時間
+        '-i', video_path,
+        '-frames:v', '1',  # 1フレームだけ抽出
+        '-q:v', '2',  # 高品質
+        '-y',  # 既存のファイルを上書き
+        output_path
+    ]
+
+def generate_fallback_analysis(timestamp):
+    """
+    フレームを分析できなかった場合の代替の分析結果を作成します。
+    チェックポイントには保存されないため、再実行時に分析し直されます。
+    
+    Args:
+        timestamp: タイムスタンプ
+        
+    Returns:
+        FallbackFrameAnalysis: 代替のフレーム分析結果
+    """
+    analysis_text = generate_mock_analysis(timestamp)
+    return FallbackFrameAnalysis(timestamp, analysis_text, **parse_frame_analysis(analysis_text))
+
 def generate_mock_analysis(timestamp):
     """
     モック分析結果を生成します（APIエラー時のフォールバック）。
@@ -4,14 +4,21 @@ ADK Webアプリケーション - 登山動画シーン説明ジェネレータ
 import os
 import asyncio
 from fastapi import FastAPI, UploadFile, File, Form, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import uvicorn
 import tempfile
 import shutil
 from ..agents.main_agent import MountainVideoAnalyzerAgent
-from ..utils.session_manager import process_video, process_video_streaming
+from ..utils.session_manager import process_video
+from ..utils.job_queue import JobQueue, QueueFullError, start_workers, stop_workers
+from ..utils.session_registry import SessionRegistry
+from ..utils.streaming_processor import StreamingProcessor
+from ..utils.event_stream import STREAM_FORMATS
+from ..utils.stream_jobs import StreamJob, StreamJobRegistry, get_stream_job_key
+from ..tools.process_scheduler import get_scheduler
+from ..tools.cancellation import get_reclaimed_metrics
 
 # ADK Webアプリケーションを作成
 def create_web_app():
@@ -31,6 +38,15 @@ def create_web_app():
     # アップロードディレクトリの作成
     os.makedirs("uploads", exist_ok=True)
     
+    # ジョブキュー（分析はワーカープロセスが実行する）
+    job_queue = JobQueue()
+    
+    # 分析済みのセッション（メモリ使用量の上限を超えると古いものから書き出す）
+    sessions = SessionRegistry()
+    
+    # 実行中のストリーミング分析（同じ動画を複数のクライアントが開いても分析は1回だけ実行する）
+    stream_jobs = StreamJobRegistry()
+    
     # ルートページ
     @app.get("/", response_class=HTMLResponse)
     async def index(request: Request):
@@ -54,14 +70,83 @@ def create_web_app():
     # 動画分析エンドポイント
     @app.post("/analyze")
     async def analyze_video(filepath: str = Form(...)):
+        session_id = (await asyncio.to_thread(sessions.create)).session_id
+        try:
+            # 動画を分析（分析中のセッションはレジストリから取り除かれない）
+            async with sessions.use_async(session_id) as session_manager:
+                result = await process_video(main_agent, filepath, session_manager=session_manager)
+            return {**result, "session_id": session_id}
+        except Exception as e:
+            await asyncio.to_thread(sessions.remove, session_id)
+            return JSONResponse(status_code=500, content={"error": str(e)})
+    
+    # セッションレジストリの統計情報エンドポイント
+    @app.get("/sessions")
+    async def get_session_metrics():
+        return sessions.get_metrics()
+    
+    # 分析済みのセッションの結果取得エンドポイント
+    @app.get("/sessions/{session_id}")
+    async def get_session(session_id: str):
+        session_manager = await asyncio.to_thread(sessions.get, session_id)
+        if session_manager is None:
+            return JSONResponse(status_code=404, content={"error": f"セッション {session_id} が見つかりません"})
+        return {**session_manager.get_result(), "session_id": session_id}
+    
+    # プロセスの実行枠と、中断された分析から回収したリソースの統計情報エンドポイント
+    @app.get("/metrics")
+    async def get_metrics():
+        return {
+            "scheduler": get_scheduler().get_metrics(),
+            "reclaimed": get_reclaimed_metrics(),
+            "stream_jobs": stream_jobs.get_metrics()
+        }
+    
+    # ジョブ登録エンドポイント
+    @app.post("/jobs")
+    async def create_job(filepath: str = Form(...)):
         try:
-            # 動画を分析
-            result = await process_video(main_agent, filepath)
-            return result
+            job_id = await asyncio.to_thread(job_queue.enqueue, filepath)
+            return JSONResponse(status_code=202, content={"job_id": job_id, "status": "queued"})
+        except QueueFullError as e:
+            return JSONResponse(status_code=429, content={"error": str(e)})
         except Exception as e:
             return JSONResponse(status_code=500, content={"error": str(e)})
     
-    # ストリーミング分析エンドポイント
+    # ジョブ状態取得エンドポイント
+    @app.get("/jobs/{job_id}")
+    async def get_job(job_id: str):
+        job = await asyncio.to_thread(job_queue.get_job, job_id)
+        if job is None:
+            return JSONResponse(status_code=404, content={"error": f"ジョブ {job_id} が見つかりません"})
+        return job
+    
+    async def attach_stream(filepath, last_event_id=None):
+        """
+        動画のストリーミング分析を購読する。同じ内容の動画と分析パラメータの分析が実行中であれば
+        新しく開始せずに購読し、それまでのイベントを先に受け取る。イベントはクライアントごとの上限付き
+        バッファに入るため、クライアントへの送信が遅くても分析は待たされない
+        
+        Returns:
+            tuple: (StreamJob, EventBuffer)
+        """
+        key = await asyncio.to_thread(get_stream_job_key, filepath)
+        
+        def create(key):
+            session_id = sessions.create().session_id
+            job = StreamJob(key, session_id, StreamingProcessor(main_agent))
+            
+            async def run():
+                # 分析中のセッションはレジストリから取り除かれない
+                async with sessions.use_async(session_id) as session_manager:
+                    await job.processor.start_streaming(filepath, job.send, session_manager=session_manager)
+            
+            job.start(run())
+            return job
+        
+        return stream_jobs.attach(key, create, last_event_id)
+    
+    # ストリーミング分析エンドポイント（WebSocket）
     @app.websocket("/analyze-stream")
     async def analyze_video_stream(websocket):
         await websocket.accept()
@@ -69,24 +154,80 @@ def create_web_app():
         # WebSocketからファイルパスを受信
         filepath = await websocket.receive_text()
         
-        # コールバック関数
-        async def callback(data):
-            await websocket.send_json(data)
+        job, buffer = await attach_stream(filepath)
+        
+        async def send_events():
+            async for event in buffer:
+                await websocket.send_json(event)
+        
+        async def watch_client():
+            # "stop"を受信したら購読を終了する（ほかに購読者がいなければ分析も中断し、cancelledを送信して終了する）。
+            # 切断されたら戻る
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                if message.get("text") == "stop":
+                    job.stop(buffer)
+        
+        sender = asyncio.ensure_future(send_events())
+        watcher = asyncio.ensure_future(watch_client())
         
         try:
-            # 動画をストリーミング分析
-            await process_video_streaming(main_agent, filepath, callback)
-        except Exception as e:
-            await websocket.send_json({"error": str(e)})
+            # すべてのイベントを送信するか、クライアントが切断するまで待つ
+            await asyncio.wait({sender, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            disconnected = watcher.done() or sender.exception() is not None
         finally:
+            for pending in (sender, watcher):
+                pending.cancel()
+            await asyncio.gather(sender, watcher, return_exceptions=True)
+            # 最後の購読者が切断された場合は分析を中断する
+            await job.detach(buffer)
+        
+        if not disconnected:
             await websocket.close()
     
+    # ストリーミング分析エンドポイント（Server-Sent Events / NDJSON）
+    @app.get("/analyze-events")
+    async def analyze_video_events(request: Request, filepath: str, format: str = None):
+        # EventSourceはAcceptにtext/event-streamを指定するため、形式の指定がなければSSEで返す
+        if format is None:
+            format = "sse" if "text/event-stream" in request.headers.get("accept", "") else "ndjson"
+        if format not in STREAM_FORMATS:
+            return JSONResponse(status_code=400, content={"error": f"未対応の形式です: {format}"})
+        
+        formatter, media_type = STREAM_FORMATS[format]
+        # EventSourceは再接続時に受け取り済みの最後のevent_idをLast-Event-IDで送る
+        last_event_id = request.headers.get("last-event-id")
+        last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+        job, buffer = await attach_stream(filepath, last_event_id)
+        
+        async def body():
+            try:
+                async for event in buffer:
+                    yield formatter(event)
+            finally:
+                # 最後の購読者が切断して送信が中断された場合は分析も中断する
+                await job.detach(buffer)
+        
+        return StreamingResponse(
+            body(), media_type=media_type,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
     return app
 
 # サーバーを起動
-def start_server(host="0.0.0.0", port=8000):
-    app = create_web_app()
-    uvicorn.run(app, host=host, port=port)
+def start_server(host="0.0.0.0", port=8000, workers=None):
+    # ジョブを処理するワーカープロセスを起動
+    worker_processes, stop_event = start_workers(workers)
+    
+    try:
+        app = create_web_app()
+        uvicorn.run(app, host=host, port=port)
+    finally:
+        # 実行中のジョブの完了を待ち、終わらないジョブは待機中に戻してから停止する
+        stop_workers(worker_processes, stop_event)
 
 if __name__ == "__main__":
     start_server()
@@ -2,10 +2,24 @@
 utils/__init__.pyファイル - ユーティリティパッケージ初期化
 """
 from .session import Session, SessionState
+from .session_store import SQLiteSessionState, create_session_state
 from .runner import Runner, RunnerEvent
 from .function_tool import FunctionTool
 from .session_manager import SessionManager, process_video, process_video_streaming
+from .session_registry import SessionRegistry
+from .graph_executor import GraphExecutor
+from .checkpoint import CheckpointStore, open_checkpoint
+from .scene_index import SceneIndex, build_id_index
+from .text_index import TextIndex
+from .vector_index import VectorIndex, HashingEncoder
+from .response_cache import ResponseCache
+from .property_precompute import precompute_scene_properties
+from .batch_processor import BatchProcessor, collect_video_paths
+from .job_queue import JobQueue, QueueFullError
+from .library_index import LibraryIndex
+from .live_ingest import LiveAnalyzer
 from .streaming_processor import StreamingProcessor
+from .stream_jobs import StreamJob, StreamJobRegistry
 from .property_query_system import PropertyQuerySystem
 from .error_handler import ErrorHandler, log_exception, async_log_exception
 from .performance_optimizer import PerformanceOptimizer
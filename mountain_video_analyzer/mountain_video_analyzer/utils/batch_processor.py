@@ -0,0 +1,252 @@
+"""
+バッチ処理 - 複数の動画をワーカープールで分析
+"""
+import os
+import glob
+import json
+import time
+import hashlib
+import asyncio
+import logging
+from ..config import CONFIG
+from .session_manager import SessionManager, process_video, get_analysis_error
+
+def collect_video_paths(inputs, manifest=None):
+    """
+    ファイル、ディレクトリ、globパターン、マニフェストから動画ファイルのパスを収集します。
+    ディレクトリ・globパターン・マニフェストからは、動画の拡張子（CONFIG["batch"]["video_extensions"]）の
+    ファイルだけを収集します（ファイルを直接指定した場合は拡張子に関係なく収集します）。
+
+    Args:
+        inputs: ファイル・ディレクトリ・globパターンのリスト
+        manifest: 動画パスを列挙したマニフェストファイルのパス（1行1パスのテキスト、またはJSON配列）
+
+    Returns:
+        list: 重複を除いた動画ファイルのパスのリスト（入力順）
+    """
+    extensions = CONFIG["batch"]["video_extensions"]
+    candidates = []
+
+    for item in inputs or []:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if has_video_extension(name, extensions):
+                        candidates.append(os.path.join(root, name))
+        elif any(char in item for char in "*?["):
+            candidates.extend(
+                path for path in sorted(glob.glob(item, recursive=True))
+                if has_video_extension(path, extensions)
+            )
+        else:
+            candidates.append(item)
+
+    if manifest:
+        candidates.extend(path for path in read_manifest(manifest) if has_video_extension(path, extensions))
+
+    video_paths = []
+    seen = set()
+    for path in candidates:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            video_paths.append(path)
+
+    return video_paths
+
+def has_video_extension(path, extensions):
+    """
+    ファイルの拡張子が動画の拡張子かどうかを判定します（大文字・小文字を区別しない）。
+
+    Args:
+        path: ファイルのパス
+        extensions: 動画の拡張子のリスト
+
+    Returns:
+        bool: 動画の拡張子の場合True
+    """
+    return os.path.splitext(path)[1].lower() in extensions
+
+def read_manifest(manifest):
+    """
+    マニフェストファイルから動画パスを読み込みます。相対パスはマニフェストの場所を基準に解決します。
+
+    Args:
+        manifest: マニフェストファイルのパス
+
+    Returns:
+        list: 動画ファイルのパスのリスト
+    """
+    with open(manifest, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    if content.lstrip().startswith("["):
+        entries = json.loads(content)
+    else:
+        entries = [
+            line.strip() for line in content.splitlines()
+            if line.strip() and not line.strip().startswith("#")
+        ]
+
+    base_dir = os.path.dirname(os.path.abspath(manifest))
+    return [
+        entry if os.path.isabs(entry) else os.path.join(base_dir, entry)
+        for entry in entries
+    ]
+
+def get_output_paths(video_paths, output_dir=None):
+    """
+    各動画の結果を保存するJSONファイルのパスを決定します。
+
+    Args:
+        video_paths: 動画ファイルのパスのリスト
+        output_dir: 出力ディレクトリ（Noneの場合は動画と同じディレクトリ）
+
+    Returns:
+        dict: 動画パスをキー、出力パスを値とする辞書
+    """
+    output_paths = {}
+    used = set()
+
+    for video_path in video_paths:
+        stem = os.path.splitext(os.path.basename(video_path))[0]
+        directory = output_dir or os.path.dirname(video_path)
+        output_path = os.path.join(directory, f"{stem}.json")
+
+        # 別ディレクトリにある同名の動画は出力先が衝突しないようにする
+        if output_path in used:
+            digest = hashlib.sha1(os.path.abspath(video_path).encode("utf-8")).hexdigest()[:8]
+            output_path = os.path.join(directory, f"{stem}-{digest}.json")
+
+        used.add(output_path)
+        output_paths[video_path] = output_path
+
+    return output_paths
+
+def is_up_to_date(video_path, output_path):
+    """
+    出力ファイルが動画より新しいか確認します。
+
+    Args:
+        video_path: 動画ファイルのパス
+        output_path: 出力ファイルのパス
+
+    Returns:
+        bool: 出力ファイルが存在し、動画より新しい場合はTrue
+    """
+    if not os.path.exists(output_path):
+        return False
+    return os.path.getmtime(output_path) >= os.path.getmtime(video_path)
+
+class BatchProcessor:
+    """
+    複数の動画を上限付きのワーカープールで分析するクラス
+    """
+    def __init__(self, main_agent, output_dir=None, workers=None, force=False):
+        """
+        BatchProcessorの初期化
+
+        Args:
+            main_agent: メインエージェント
+            output_dir: 結果を保存するディレクトリ（Noneの場合は動画と同じディレクトリ）
+            workers: 同時に分析する動画数（Noneの場合はCONFIGから取得）
+            force: Trueの場合は出力が最新でも再分析する
+        """
+        self.main_agent = main_agent
+        self.output_dir = output_dir
+        self.workers = workers or CONFIG["batch"]["workers"]
+        self.force = force
+
+    async def run(self, video_paths):
+        """
+        動画を分析し、動画ごとにJSONファイルへ結果を保存します。
+
+        Args:
+            video_paths: 動画ファイルのパスのリスト
+
+        Returns:
+            dict: スループットの集計結果
+        """
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+        output_paths = get_output_paths(video_paths, self.output_dir)
+        queue = asyncio.Queue()
+        summary = {
+            "total": len(video_paths),
+            "processed": 0,
+            "skipped": 0,
+            "failed": 0,
+            "video_seconds": 0.0,
+            "failures": []
+        }
+
+        for video_path in video_paths:
+            if not os.path.exists(video_path):
+                logging.error(f"動画ファイル {video_path} が見つかりません")
+                summary["failed"] += 1
+                summary["failures"].append({"video_path": video_path, "error": "ファイルが見つかりません"})
+            elif not self.force and is_up_to_date(video_path, output_paths[video_path]):
+                logging.info(f"動画 {video_path} の結果は最新のためスキップします")
+                summary["skipped"] += 1
+            else:
+                queue.put_nowait(video_path)
+
+        async def worker():
+            while True:
+                try:
+                    video_path = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self.process_one(video_path, output_paths[video_path], summary)
+
+        start_time = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(self.workers)))
+        elapsed = time.monotonic() - start_time
+
+        summary["elapsed"] = elapsed
+        summary["videos_per_hour"] = summary["processed"] / elapsed * 3600 if elapsed > 0 else 0.0
+        summary["realtime_factor"] = summary["video_seconds"] / elapsed if elapsed > 0 else 0.0
+
+        return summary
+
+    async def process_one(self, video_path, output_path, summary):
+        """
+        1本の動画を分析して結果を保存します。分析に失敗した場合（フォールバックの結果を含む場合）は
+        保存せずに失敗として数え、次回の実行で再分析します。
+
+        Args:
+            video_path: 動画ファイルのパス
+            output_path: 出力ファイルのパス
+            summary: 集計結果（更新される）
+        """
+        session_manager = SessionManager()
+        try:
+            logging.info(f"動画 {video_path} を分析します")
+            result = await process_video(self.main_agent, video_path, session_manager=session_manager)
+            
+            # フォールバックの結果は保存しない（保存すると次回以降「最新」としてスキップされるため）
+            error = get_analysis_error(session_manager)
+            if error:
+                raise RuntimeError(error)
+
+            # 途中で中断されても壊れたJSONが残らないように一時ファイル経由で保存
+            temp_path = f"{output_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, output_path)
+
+            # 動画の長さはFFprobeで取得し直さず、分析済みの最後のシーンの終了時刻を使う
+            scenes = session_manager.get_state("scenes", [])
+            summary["processed"] += 1
+            summary["video_seconds"] += scenes[-1]["end_time"] if len(scenes) else 0.0
+            logging.info(f"結果を {output_path} に保存しました")
+
+        except Exception as e:
+            logging.error(f"動画 {video_path} の分析中にエラーが発生しました: {e}")
+            summary["failed"] += 1
+            summary["failures"].append({"video_path": video_path, "error": str(e)})
+        finally:
+            # "lazy"モードの分析用のスレッドを残さない
+            await asyncio.to_thread(session_manager.close)
@@ -0,0 +1,202 @@
+"""
+チェックポイント - 分析の途中結果を保存し、再実行時に再開する
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from ..config import CONFIG
+from ..models import to_builtin
+
+# 内容のハッシュに使用するブロックの数と大きさ（大きな動画でも全体は読まない）
+SAMPLE_BLOCKS = 16
+SAMPLE_BLOCK_SIZE = 64 * 1024
+
+def compute_content_hash(video_path):
+    """
+    動画ファイルのサイズ・更新時刻と、先頭・末尾を含む等間隔のブロックの内容から
+    SHA-256ハッシュを計算します。ファイル全体は読まないため、大きな動画でもすぐに計算できます。
+
+    Args:
+        video_path: 動画ファイルのパス
+
+    Returns:
+        str: 16進数のハッシュ値
+    """
+    stat = os.stat(video_path)
+    digest = hashlib.sha256(f"{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+
+    with open(video_path, "rb") as f:
+        if stat.st_size <= SAMPLE_BLOCKS * SAMPLE_BLOCK_SIZE:
+            digest.update(f.read())
+        else:
+            for i in range(SAMPLE_BLOCKS):
+                f.seek((stat.st_size - SAMPLE_BLOCK_SIZE) * i // (SAMPLE_BLOCKS - 1))
+                digest.update(f.read(SAMPLE_BLOCK_SIZE))
+
+    return digest.hexdigest()
+
+def get_analysis_params():
+    """
+    分析結果に影響する設定を取得します。これらが変わった場合は別のチェックポイントになります。
+
+    Returns:
+        dict: 分析パラメータ
+    """
+    return {
+        "min_scene_length": CONFIG["scene_detection"]["min_scene_length"],
+        "transcription": CONFIG["transcription"],
+        "frames_per_scene": CONFIG["analysis"]["frames_per_scene"],
+        "vision_model": CONFIG["models"]["vision"]
+    }
+
+class CheckpointStore:
+    """
+    1つの動画と分析パラメータの組に対するチェックポイント
+
+    ステージ全体の結果はJSONファイルに、シーン単位の結果はJSON Lines形式で
+    完了するたびに追記します。途中でプロセスが終了しても、それまでに完了した単位は失われません。
+    """
+    def __init__(self, video_path, params=None, root=None):
+        """
+        CheckpointStoreの初期化
+
+        Args:
+            video_path: 動画ファイルのパス
+            params: 分析パラメータ（Noneの場合はget_analysis_params()）
+            root: チェックポイントを保存するディレクトリ（Noneの場合はCONFIGから取得）
+        """
+        params = params if params is not None else get_analysis_params()
+        root = root or CONFIG["checkpoint"]["dir"]
+
+        key = hashlib.sha256(
+            (compute_content_hash(video_path) + json.dumps(params, sort_keys=True)).encode("utf-8")
+        ).hexdigest()
+
+        self.directory = os.path.join(root, key)
+        self._lock = threading.Lock()
+        self._units = {}
+        os.makedirs(self.directory, exist_ok=True)
+
+    def load(self, stage):
+        """
+        ステージ全体の結果を読み込む
+
+        Args:
+            stage: ステージ名
+
+        Returns:
+            保存された結果（存在しない場合はNone）
+        """
+        path = os.path.join(self.directory, f"{stage}.json")
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, stage, value):
+        """
+        ステージ全体の結果を保存する
+
+        Args:
+            stage: ステージ名
+            value: 保存する結果
+        """
+        path = os.path.join(self.directory, f"{stage}.json")
+        temp_path = f"{path}.tmp"
+
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False, default=to_builtin)
+        os.replace(temp_path, path)
+
+    def load_units(self, stage):
+        """
+        シーン単位の結果を読み込む
+
+        Args:
+            stage: ステージ名
+
+        Returns:
+            dict: 単位IDをキー、結果を値とする辞書
+        """
+        path = os.path.join(self.directory, f"{stage}.jsonl")
+        units = {}
+
+        if not os.path.exists(path):
+            return units
+
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み途中で終了した最終行は無視する
+                    logging.warning(f"チェックポイント {path} の不完全な行を無視します")
+                    continue
+                units[entry["unit"]] = entry["data"]
+
+        return units
+
+    def get_unit(self, stage, unit_id):
+        """
+        シーン単位の結果を1件取得する。ファイルは最初の呼び出し時にのみ読み込む
+
+        Args:
+            stage: ステージ名
+            unit_id: 単位ID（シーンIDなど）
+
+        Returns:
+            保存された結果（存在しない場合はNone）
+        """
+        with self._lock:
+            if stage not in self._units:
+                self._units[stage] = self.load_units(stage)
+            return self._units[stage].get(unit_id)
+
+    def append_unit(self, stage, unit_id, data):
+        """
+        シーン単位の結果を追記する
+
+        Args:
+            stage: ステージ名
+            unit_id: 単位ID（シーンIDなど）
+            data: 保存する結果
+        """
+        path = os.path.join(self.directory, f"{stage}.jsonl")
+        line = json.dumps({"unit": unit_id, "data": data}, ensure_ascii=False, default=to_builtin)
+
+        with self._lock:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            if stage in self._units:
+                self._units[stage][unit_id] = data
+
+    def clear(self):
+        """
+        チェックポイントを削除する
+        """
+        with self._lock:
+            self._units = {}
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def open_checkpoint(video_path):
+    """
+    設定で有効になっている場合に動画のチェックポイントを開きます。
+
+    Args:
+        video_path: 動画ファイルのパス
+
+    Returns:
+        CheckpointStore: チェックポイント（無効な場合や開けない場合はNone）
+    """
+    if not CONFIG["checkpoint"]["enabled"]:
+        return None
+
+    try:
+        return CheckpointStore(video_path)
+    except OSError as e:
+        logging.warning(f"チェックポイントを開けませんでした: {e}")
+        return None
@@ -0,0 +1,142 @@
+"""
+イベントストリーム - ストリーミング分析のイベントをクライアントごとの上限付きバッファを通して送る
+"""
+import json
+import asyncio
+from collections import deque
+
+# 受け取ったらストリームを終了するイベントの種類
+TERMINAL_EVENTS = ("complete", "cancelled", "error")
+# 新しいものが届くと古いものが不要になるイベントの種類
+SUPERSEDED_EVENTS = ("progress",)
+
+class EventBuffer:
+    """
+    クライアントごとのイベントバッファ
+
+    put()は待たずに戻るため、クライアントへの送信が遅くても分析は待たされません。
+    未送信のprogressイベントは最新のものだけを残します。シーンや結果のイベントは破棄しないため、
+    未送信のイベントは進捗を除いてシーン数に比例する件数までしか増えません。
+    complete・cancelled・errorを返した後に反復が終了します。
+    """
+    def __init__(self, session_id=None):
+        """
+        EventBufferの初期化
+
+        Args:
+            session_id: バッファを使うセッションのID（ログ用）
+        """
+        self.session_id = session_id
+        self.delivered = 0
+        self.coalesced = 0
+
+        self._events = deque()
+        self._closed = False
+        self._finished = False
+        self._updated = asyncio.Event()
+
+    def put(self, event):
+        """
+        イベントを追加する
+
+        Args:
+            event: イベントの辞書
+        """
+        if self._closed:
+            return
+
+        if event.get("type") in SUPERSEDED_EVENTS:
+            for pending in self._events:
+                if pending.get("type") == event["type"]:
+                    self._events.remove(pending)
+                    self.coalesced += 1
+                    break
+
+        if event.get("type") in TERMINAL_EVENTS:
+            self._closed = True
+
+        self._events.append(event)
+        self._updated.set()
+
+    async def send(self, event):
+        """
+        put()の非同期版（process_video_streamingなどのコールバックとして渡す）
+
+        Args:
+            event: イベントの辞書
+        """
+        self.put(event)
+
+    def close(self):
+        """
+        イベントの追加を終了する。未送信のイベントを返した後に反復が終了する
+        """
+        self._closed = True
+        self._updated.set()
+
+    def get_metrics(self):
+        """
+        バッファの統計情報を取得する
+
+        Returns:
+            dict: 送信したイベント数・まとめたイベント数・未送信のイベント数
+        """
+        return {
+            "delivered": self.delivered,
+            "coalesced": self.coalesced,
+            "pending": len(self._events)
+        }
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            if self._finished:
+                raise StopAsyncIteration
+
+            if self._events:
+                event = self._events.popleft()
+                self.delivered += 1
+                if event.get("type") in TERMINAL_EVENTS:
+                    self._finished = True
+                return event
+
+            if self._closed:
+                raise StopAsyncIteration
+
+            self._updated.clear()
+            await self._updated.wait()
+
+def format_sse(event):
+    """
+    イベントをServer-Sent Eventsの形式に変換します。
+
+    Args:
+        event: イベントの辞書
+
+    Returns:
+        str: "event:"と"data:"の行（event_idがある場合は"id:"の行も）と空行
+    """
+    data = json.dumps(event, ensure_ascii=False)
+    # 再接続時にEventSourceがLast-Event-IDとして送り返す
+    event_id = f"id: {event['event_id']}\n" if "event_id" in event else ""
+    return f"{event_id}event: {event.get('type', 'message')}\ndata: {data}\n\n"
+
+def format_ndjson(event):
+    """
+    イベントを改行区切りのJSON（NDJSON）の1行に変換します。
+
+    Args:
+        event: イベントの辞書
+
+    Returns:
+        str: JSONと改行
+    """
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+# ストリーミングレスポンスの形式と、(変換する関数, メディアタイプ)の対応
+STREAM_FORMATS = {
+    "sse": (format_sse, "text/event-stream"),
+    "ndjson": (format_ndjson, "application/x-ndjson")
+}
@@ -0,0 +1,269 @@
+"""
+エージェントグラフ実行器 - SequentialAgent/ParallelAgentのツリーを並行実行する
+"""
+import asyncio
+import functools
+import logging
+import time
+from ..agents.sequential_agent import SequentialAgent
+from ..agents.parallel_agent import ParallelAgent
+
+class GraphExecutor:
+    """
+    SequentialAgent/ParallelAgentで構成されたエージェントツリーを走査し、
+    各リーフエージェントに対応するハンドラーを実行するクラス
+
+    SequentialAgentのサブエージェントは順番に、ParallelAgentのサブエージェントは
+    asyncioで並行に実行されます。同期ハンドラーはエグゼキューターで実行されるため、
+    イベントループをブロックしません。
+    """
+    def __init__(self, handlers, dependencies=None, executor=None, progress_callback=None, agent=None):
+        """
+        GraphExecutorの初期化
+
+        agentを渡した場合は、依存関係がツリーと矛盾しないことをここで検証します。
+
+        Args:
+            handlers: エージェント名をキー、ハンドラー関数を値とする辞書
+                      ハンドラーは (session_manager, video_path) を受け取る同期関数または非同期関数
+            dependencies: エージェント名をキー、先に完了している必要があるエージェント名のリストを値とする辞書
+            executor: 同期ハンドラーを実行するエグゼキューター（Noneの場合はイベントループのデフォルト）
+            progress_callback: リーフの完了ごとに進捗（0.0〜1.0）とメッセージを受け取る関数
+            agent: 実行するルートエージェント（Noneの場合はrun()に渡されたときに検証する）
+
+        Raises:
+            ValueError: 依存関係にツリーに存在しない名前・循環・ツリーの実行順序との矛盾がある場合
+        """
+        self.handlers = handlers
+        self.dependencies = dependencies or {}
+        self.executor = executor
+        self.progress_callback = progress_callback
+        self.agent = agent
+        self.timings = {}
+        self._completed = {}
+        self._started_at = 0.0
+
+        if agent is not None:
+            self.validate(agent)
+
+    async def run(self, agent, session_manager, video_path):
+        """
+        エージェントツリーを実行する
+
+        Args:
+            agent: ルートエージェント
+            session_manager: セッションマネージャー
+            video_path: 動画ファイルのパス
+
+        Returns:
+            dict: ノード名をキーとした実行時間の記録
+
+        Raises:
+            ValueError: 依存関係がツリーと矛盾する場合（validate()を参照）
+        """
+        # コンストラクターで検証済みのツリー以外は、待機し続けないように実行前に検証する
+        if agent is not self.agent:
+            self.validate(agent)
+
+        self.timings = {}
+        self._completed = {
+            name: asyncio.Event() for name in self._collect_leaf_names(agent)
+        }
+        self._started_at = time.perf_counter()
+
+        await self._run_node(agent, session_manager, video_path)
+
+        session_manager.set_state("node_timings", self.timings)
+        return self.timings
+
+    async def _run_node(self, node, session_manager, video_path):
+        """
+        ノードを種類に応じて実行し、実行時間を記録する
+
+        Args:
+            node: 実行するノード
+            session_manager: セッションマネージャー
+            video_path: 動画ファイルのパス
+        """
+        start = time.perf_counter()
+
+        if isinstance(node, SequentialAgent):
+            for sub_agent in node.sub_agents:
+                await self._run_node(sub_agent, session_manager, video_path)
+        elif isinstance(node, ParallelAgent):
+            tasks = [
+                asyncio.create_task(self._run_node(sub_agent, session_manager, video_path))
+                for sub_agent in node.sub_agents
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # 1つのブランチが失敗した場合は残りのブランチを取り消す
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+        else:
+            await self._run_leaf(node, session_manager, video_path)
+
+        self._record_timing(node.name, start)
+
+    async def _run_leaf(self, node, session_manager, video_path):
+        """
+        リーフエージェントのハンドラーを依存関係の完了後に実行する
+
+        Args:
+            node: リーフエージェント
+            session_manager: セッションマネージャー
+            video_path: 動画ファイルのパス
+        """
+        # 依存先はvalidate()でツリーに存在することを確認済み
+        for dependency in self.dependencies.get(node.name, []):
+            await self._completed[dependency].wait()
+
+        handler = self.handlers.get(node.name)
+        try:
+            if handler is None:
+                logging.warning(f"ノード {node.name} のハンドラーが登録されていません")
+            elif asyncio.iscoroutinefunction(handler):
+                await handler(session_manager, video_path)
+            else:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(
+                    self.executor,
+                    functools.partial(handler, session_manager, video_path)
+                )
+        finally:
+            self._completed[node.name].set()
+
+        if self.progress_callback:
+            completed = sum(1 for event in self._completed.values() if event.is_set())
+            self.progress_callback(completed / len(self._completed), f"{node.name} が完了しました")
+
+    def validate(self, agent):
+        """
+        依存関係がエージェントツリーで満たせることを検証する
+
+        SequentialAgentでは前のサブエージェントのリーフがすべて完了してから次のサブエージェントが
+        始まるため、依存関係の辺とこの順序の辺を合わせたグラフに循環があると、実行が終わらなくなります。
+
+        Args:
+            agent: ルートエージェント
+
+        Raises:
+            ValueError: ツリーに存在しない名前・依存関係の循環・ツリーの実行順序との矛盾がある場合
+        """
+        leaf_names = dict.fromkeys(self._collect_leaf_names(agent))
+
+        # 依存先を先に完了させる必要があるため、辺は「依存先 -> 依存元」の向きにする
+        dependency_edges = {name: set() for name in leaf_names}
+        for name, dependencies in self.dependencies.items():
+            unknown = [n for n in [name, *dependencies] if n not in leaf_names]
+            if unknown:
+                raise ValueError(
+                    f"依存関係 {name} -> {dependencies} にツリーに存在しないエージェントがあります: {unknown}"
+                )
+            for dependency in dependencies:
+                dependency_edges[dependency].add(name)
+
+        cycle = self._find_cycle(dependency_edges)
+        if cycle:
+            raise ValueError(f"依存関係が循環しています: {' -> '.join(cycle)}")
+
+        edges = {name: set(targets) for name, targets in dependency_edges.items()}
+        self._add_order_edges(agent, edges)
+        cycle = self._find_cycle(edges)
+        if cycle:
+            raise ValueError(
+                f"依存関係がツリーの実行順序と矛盾しています（後に実行されるエージェントに依存しています）: "
+                f"{' -> '.join(cycle)}"
+            )
+
+    def _add_order_edges(self, node, edges):
+        """
+        SequentialAgentの実行順序（前のサブエージェントの各リーフ -> 次のサブエージェントの各リーフ）の辺を追加する
+
+        Args:
+            node: 走査を開始するノード
+            edges: リーフ名をキー、後に実行されるリーフ名の集合を値とする辞書（更新される）
+        """
+        if not isinstance(node, (SequentialAgent, ParallelAgent)):
+            return
+
+        for sub_agent in node.sub_agents:
+            self._add_order_edges(sub_agent, edges)
+
+        if isinstance(node, SequentialAgent):
+            # 隣り合うサブエージェントの間だけに辺を張れば、推移的に順序が表せる
+            groups = [self._collect_leaf_names(sub_agent) for sub_agent in node.sub_agents]
+            for before, after in zip(groups, groups[1:]):
+                for name in before:
+                    edges[name].update(after)
+
+    @staticmethod
+    def _find_cycle(edges):
+        """
+        有向グラフの循環を探す
+
+        Args:
+            edges: ノード名をキー、辺の先のノード名の集合を値とする辞書
+
+        Returns:
+            list: 循環するノード名のリスト（先頭のノードを末尾にも含む。循環がない場合は空のリスト）
+        """
+        visiting, visited = set(), set()
+
+        for root in edges:
+            if root in visited:
+                continue
+            # 再帰の深さがツリーの大きさに依存しないよう、スタックで深さ優先探索する
+            path = [root]
+            stack = [iter(sorted(edges[root]))]
+            visiting.add(root)
+            while stack:
+                target = next(stack[-1], None)
+                if target is None:
+                    stack.pop()
+                    finished = path.pop()
+                    visiting.discard(finished)
+                    visited.add(finished)
+                elif target in visiting:
+                    return path[path.index(target):] + [target]
+                elif target not in visited:
+                    visiting.add(target)
+                    path.append(target)
+                    stack.append(iter(sorted(edges[target])))
+        return []
+
+    def _record_timing(self, name, start):
+        """
+        ノードの実行時間を記録する
+
+        Args:
+            name: ノード名
+            start: 開始時刻（perf_counterの値）
+        """
+        end = time.perf_counter()
+        self.timings[name] = {
+            "start": start - self._started_at,
+            "end": end - self._started_at,
+            "duration": end - start
+        }
+        logging.info(f"ノード {name} の実行時間: {end - start:.4f} 秒")
+
+    def _collect_leaf_names(self, node):
+        """
+        ツリー内のリーフエージェント名を収集する
+
+        Args:
+            node: 走査を開始するノード
+
+        Returns:
+            list: リーフエージェント名のリスト
+        """
+        if isinstance(node, (SequentialAgent, ParallelAgent)):
+            names = []
+            for sub_agent in node.sub_agents:
+                names.extend(self._collect_leaf_names(sub_agent))
+            return names
+        return [node.name]
@@ -0,0 +1,441 @@
+"""
+ジョブキュー - SQLiteを使用した永続ジョブキューとワーカー
+"""
+import os
+import json
+import time
+import uuid
+import signal
+import sqlite3
+import asyncio
+import logging
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from ..config import CONFIG
+from ..agents.main_agent import MountainVideoAnalyzerAgent
+from .session_manager import SessionManager, process_video, get_analysis_error
+
+class QueueFullError(Exception):
+    """
+    待機中のジョブ数が上限に達している場合に送出される例外
+    """
+
+class JobQueue:
+    """
+    SQLiteに保存される動画分析ジョブのキュー
+
+    WALモードで開くため、Webサーバーと複数のワーカープロセスから同時に利用できます。
+    ジョブの状態は queued → running → completed / failed の順に遷移します。
+    実行中のジョブにはリース（lease_until）があり、ワーカーはheartbeat()で延長し続けます。
+    ワーカーが異常終了してリースが切れたジョブは、別のワーカーが取得し直します
+    （max_attempts回取得しても完了しないジョブは失敗にします）。
+    """
+    def __init__(self, db_path=None, max_queued_jobs=None, lease_timeout=None, max_attempts=None, clock=time.time):
+        """
+        JobQueueの初期化
+
+        Args:
+            db_path: データベースファイルのパス（Noneの場合はCONFIGから取得）
+            max_queued_jobs: 待機できるジョブ数の上限（Noneの場合はCONFIGから取得）
+            lease_timeout: 実行中のジョブのリースの秒数（Noneの場合はCONFIGから取得）
+            max_attempts: 1つのジョブを取得できる回数の上限（Noneの場合はCONFIGから取得）
+            clock: 現在時刻を返す関数
+        """
+        jobs_config = CONFIG["jobs"]
+        self.db_path = db_path or jobs_config["db_path"]
+        self.max_queued_jobs = max_queued_jobs or jobs_config["max_queued_jobs"]
+        self.lease_timeout = lease_timeout or jobs_config["lease_timeout"]
+        self.max_attempts = max_attempts or jobs_config["max_attempts"]
+        self.clock = clock
+
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    video_path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0.0,
+                    message TEXT,
+                    result TEXT,
+                    error TEXT,
+                    worker_id TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    lease_until REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            # リースの列がない既存のデータベースに列を追加する
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "lease_until" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL")
+            if "attempts" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def enqueue(self, video_path):
+        """
+        ジョブをキューに追加する
+
+        Args:
+            video_path: 分析する動画ファイルのパス
+
+        Returns:
+            str: ジョブID
+
+        Raises:
+            QueueFullError: 待機中のジョブ数が上限に達している場合
+        """
+        job_id = str(uuid.uuid4())
+
+        with self._connect(immediate=True) as conn:
+            (queued,) = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()
+            if queued >= self.max_queued_jobs:
+                raise QueueFullError(f"待機中のジョブが上限（{self.max_queued_jobs}件）に達しています")
+
+            conn.execute(
+                "INSERT INTO jobs (id, video_path, status, created_at) VALUES (?, ?, 'queued', ?)",
+                (job_id, video_path, self.clock())
+            )
+
+        return job_id
+
+    def claim_next(self, worker_id):
+        """
+        最も古い待機中のジョブ、またはリースが切れた実行中のジョブを取得し、実行中にする
+
+        Args:
+            worker_id: ジョブを実行するワーカーのID
+
+        Returns:
+            dict: ジョブ情報（取得できるジョブがない場合はNone）
+        """
+        with self._connect(immediate=True) as conn:
+            while True:
+                now = self.clock()
+                row = conn.execute(
+                    "SELECT id, status, attempts FROM jobs "
+                    "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    return None
+
+                job_id, status, attempts = row
+                if status == "running":
+                    logging.warning(f"ジョブ {job_id} のリースが切れたため取得し直します（{attempts}回目の実行が中断）")
+
+                # 取得するたびにワーカーが異常終了するジョブは、ほかのジョブを妨げないよう失敗にする
+                if attempts >= self.max_attempts:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                        (f"ワーカーが{attempts}回異常終了したため中止しました", now, job_id)
+                    )
+                    continue
+
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?, started_at = ?, lease_until = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (worker_id, now, now + self.lease_timeout, job_id)
+                )
+                break
+
+        return self.get_job(job_id)
+
+    def heartbeat(self, job_id, worker_id):
+        """
+        実行中のジョブのリースを延長する
+
+        Args:
+            job_id: ジョブID
+            worker_id: ジョブを実行しているワーカーのID
+
+        Returns:
+            bool: 延長できた場合True（リースが切れて別のワーカーが取得した場合などはFalse）
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (self.clock() + self.lease_timeout, job_id, worker_id)
+            )
+            return cursor.rowcount > 0
+
+    def release(self, job_id, worker_id):
+        """
+        実行中のジョブを待機中に戻す（ワーカーの停止時に、ほかのワーカーがすぐに取得できるようにする）
+
+        Args:
+            job_id: ジョブID
+            worker_id: ジョブを実行しているワーカーのID
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL, lease_until = NULL, "
+                "attempts = MAX(attempts - 1, 0) WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (job_id, worker_id)
+            )
+
+    def update_progress(self, job_id, progress, message=None):
+        """
+        ジョブの進捗を更新する
+
+        Args:
+            job_id: ジョブID
+            progress: 進捗（0.0〜1.0）
+            message: 進捗メッセージ
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ?, message = ? WHERE id = ?",
+                (progress, message, job_id)
+            )
+
+    def complete(self, job_id, result):
+        """
+        ジョブを完了にする
+
+        Args:
+            job_id: ジョブID
+            result: 分析結果
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'completed', progress = 1.0, result = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ?",
+                (json.dumps(result, ensure_ascii=False), self.clock(), job_id)
+            )
+
+    def fail(self, job_id, error):
+        """
+        ジョブを失敗にする
+
+        Args:
+            job_id: ジョブID
+            error: エラーメッセージ
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                (str(error), self.clock(), job_id)
+            )
+
+    def get_job(self, job_id):
+        """
+        ジョブ情報を取得する
+
+        Args:
+            job_id: ジョブID
+
+        Returns:
+            dict: ジョブ情報（存在しない場合はNone）
+        """
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def get_metrics(self):
+        """
+        状態ごとのジョブ数を取得する
+
+        Returns:
+            dict: 状態をキー、ジョブ数を値とする辞書
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+
+        metrics = {"queued": 0, "running": 0, "completed": 0, "failed": 0}
+        metrics.update(dict(rows))
+        return metrics
+
+    @contextmanager
+    def _connect(self, immediate=False):
+        """
+        トランザクション内の接続を提供する。ブロックの終了時にコミット（例外時はロールバック）して閉じる
+
+        Args:
+            immediate: Trueの場合は書き込みロックを先に取得する
+                       （複数のワーカーが同じジョブを取得しないようにするため）
+
+        Yields:
+            sqlite3.Connection: 接続
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+def run_worker(db_path=None, poll_interval=None, worker_id=None, stop_event=None):
+    """
+    キューからジョブを取得して分析を実行し続けるワーカー
+
+    実行中はリースを定期的に延長します。stop_eventが設定されると実行中のジョブを終えてから終了します。
+    SIGTERM・SIGINTを受け取った場合は実行中のジョブを中断し、待機中に戻してから終了します。
+
+    Args:
+        db_path: ジョブキューのデータベースファイルのパス
+        poll_interval: 待機中のジョブがない場合のポーリング間隔（秒）
+        worker_id: ワーカーID（Noneの場合は自動生成）
+        stop_event: 設定されたら終了するイベント（multiprocessing.Eventなど）
+    """
+    queue = JobQueue(db_path)
+    poll_interval = poll_interval or CONFIG["jobs"]["poll_interval"]
+    worker_id = worker_id or f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    stop_event = stop_event or threading.Event()
+    main_agent = MountainVideoAnalyzerAgent()
+
+    # SIGTERMでも実行中のジョブを待機中に戻せるよう、例外として受け取る
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, handle_termination)
+
+    logging.info(f"ワーカー {worker_id} を開始しました")
+
+    while not stop_event.is_set():
+        job = queue.claim_next(worker_id)
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+
+        run_job(queue, main_agent, job, worker_id)
+
+    logging.info(f"ワーカー {worker_id} を終了しました")
+
+def run_job(queue, main_agent, job, worker_id):
+    """
+    取得したジョブを実行する。実行中はリースを延長し、中断された場合はジョブを待機中に戻す。
+    分析に失敗した場合（フォールバックの結果を含む場合）はジョブを失敗にする
+
+    Args:
+        queue: JobQueue
+        main_agent: メインエージェント
+        job: claim_next()が返したジョブ情報
+        worker_id: ワーカーID
+    """
+    job_id = job["id"]
+    logging.info(f"ワーカー {worker_id} がジョブ {job_id} を開始しました")
+
+    finished = threading.Event()
+
+    def keep_lease():
+        while not finished.wait(queue.lease_timeout / 3):
+            if not queue.heartbeat(job_id, worker_id):
+                logging.warning(f"ジョブ {job_id} のリースを延長できませんでした")
+
+    heartbeat = threading.Thread(target=keep_lease, daemon=True)
+    heartbeat.start()
+
+    def report_progress(progress, message=None):
+        queue.update_progress(job_id, progress, message)
+
+    session_manager = SessionManager()
+    try:
+        result = asyncio.run(process_video(
+            main_agent, job["video_path"], progress_callback=report_progress, session_manager=session_manager
+        ))
+
+        # 分析に失敗した場合はフォールバックの結果で完了にせず、失敗にする
+        error = get_analysis_error(session_manager)
+        if error:
+            raise RuntimeError(error)
+
+        queue.complete(job_id, result)
+        logging.info(f"ジョブ {job_id} が完了しました")
+    except Exception as e:
+        logging.error(f"ジョブ {job_id} の実行中にエラーが発生しました: {e}")
+        queue.fail(job_id, e)
+    except BaseException:
+        # 停止のシグナルで中断された場合は、ほかのワーカーが続きを実行できるように戻す
+        logging.warning(f"ジョブ {job_id} を中断し、待機中に戻します")
+        queue.release(job_id, worker_id)
+        raise
+    finally:
+        finished.set()
+        heartbeat.join()
+        # "lazy"モードの分析用のスレッドを残さない
+        session_manager.close()
+
+def handle_termination(signum, frame):
+    """
+    SIGTERMをKeyboardInterruptとして送出する（実行中のジョブを待機中に戻してから終了するため）
+    """
+    raise KeyboardInterrupt
+
+def run_worker_process(db_path, stop_event):
+    """
+    ワーカープロセスのエントリーポイント。Ctrl+Cはサーバーのプロセスと同時に届くため無視し、
+    stop_eventで停止する（SIGTERMによる中断はトレースバックなしで終了する）
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        run_worker(db_path, stop_event=stop_event)
+    except KeyboardInterrupt:
+        pass
+
+def start_workers(count=None, db_path=None):
+    """
+    ワーカープロセスを起動する
+
+    Args:
+        count: 起動するワーカー数（Noneの場合はCONFIGから取得）
+        db_path: ジョブキューのデータベースファイルのパス
+
+    Returns:
+        tuple: (起動したmultiprocessing.Processのリスト, 停止を通知するmultiprocessing.Event)
+    """
+    count = CONFIG["jobs"]["workers"] if count is None else count
+    stop_event = multiprocessing.Event()
+    processes = []
+
+    for _ in range(count):
+        process = multiprocessing.Process(target=run_worker_process, args=(db_path, stop_event), daemon=True)
+        process.start()
+        processes.append(process)
+
+    return processes, stop_event
+
+def stop_workers(processes, stop_event, timeout=None):
+    """
+    ワーカープロセスを停止する。実行中のジョブをtimeout秒まで待ち、終わらないワーカーには
+    SIGTERMを送る（中断したジョブは待機中に戻され、次に起動したワーカーが実行する）
+
+    Args:
+        processes: start_workers()が返したプロセスのリスト
+        stop_event: start_workers()が返したイベント
+        timeout: 実行中のジョブの完了を待つ秒数（Noneの場合はCONFIGから取得）
+    """
+    timeout = CONFIG["jobs"]["shutdown_timeout"] if timeout is None else timeout
+    stop_event.set()
+
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join()
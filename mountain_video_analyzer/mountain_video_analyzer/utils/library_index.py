@@ -0,0 +1,294 @@
+"""
+ライブラリインデックス - 分析済みの全動画のシーンをSQLiteに保存し、横断的に検索する
+"""
+import os
+import time
+import sqlite3
+import logging
+from contextlib import contextmanager
+from ..config import CONFIG
+from ..tools.vision_analysis import parse_frame_analysis
+from .text_index import WORD_PATTERN, normalize_text
+
+def build_fts_columns(text):
+    """
+    全文検索テーブルに格納するトークン列を作成します。
+
+    FTS5のtrigramトークナイザーは3文字未満の語（「雲海」「雪」）を検索できないため、
+    語ごとの文字bigramと文字unigramを空白区切りで格納し、検索語をbigramのフレーズに変換して検索します。
+
+    Args:
+        text: 文書のテキスト
+
+    Returns:
+        tuple: (bigramの列, unigramの列)
+    """
+    grams = []
+    chars = []
+    for word in WORD_PATTERN.findall(normalize_text(text or "")):
+        grams.extend(word[i:i + 2] for i in range(len(word) - 1))
+        chars.extend(word)
+    return " ".join(grams), " ".join(chars)
+
+def build_fts_query(keyword):
+    """
+    キーワードをFTS5の検索式に変換します。空白で区切った語はすべて含むシーンのみ一致します。
+
+    Args:
+        keyword: 検索キーワード
+
+    Returns:
+        str: 検索式（検索語がない場合はNone）
+    """
+    terms = []
+    for word in WORD_PATTERN.findall(normalize_text(keyword or "")):
+        if len(word) == 1:
+            terms.append(f'chars:"{word}"')
+        else:
+            # 連続するbigramのフレーズは部分文字列としての一致になる
+            grams = " ".join(word[i:i + 2] for i in range(len(word) - 1))
+            terms.append(f'grams:"{grams}"')
+    return " AND ".join(terms) if terms else None
+
+class LibraryIndex:
+    """
+    分析済みの動画とシーンのインデックス
+
+    動画ごとの撮影日時と、シーンの時間・長さ・天候をテーブルに、説明文を全文検索テーブル（FTS5）に
+    保存します。キーワード・撮影期間・天候・シーンの長さを組み合わせて、すべての動画を横断して検索できます。
+    JobQueueと同じくWALモードで開くため、複数のプロセスから同時に利用できます。
+    """
+    def __init__(self, db_path=None):
+        """
+        LibraryIndexの初期化
+
+        Args:
+            db_path: データベースファイルのパス（Noneの場合はCONFIGから取得）
+        """
+        self.db_path = db_path or CONFIG["library"]["db_path"]
+
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS videos (
+                    id INTEGER PRIMARY KEY,
+                    video_path TEXT NOT NULL UNIQUE,
+                    recorded_at REAL NOT NULL,
+                    duration REAL NOT NULL,
+                    scene_count INTEGER NOT NULL,
+                    ingested_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS scenes (
+                    id INTEGER PRIMARY KEY,
+                    video_id INTEGER NOT NULL REFERENCES videos (id),
+                    scene_id INTEGER NOT NULL,
+                    start_time REAL NOT NULL,
+                    end_time REAL NOT NULL,
+                    duration REAL NOT NULL,
+                    weather TEXT,
+                    description TEXT
+                )
+            """)
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS scene_fts USING fts5 (
+                    grams, chars, tokenize = 'unicode61 remove_diacritics 0'
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS videos_recorded_at ON videos (recorded_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS scenes_video ON scenes (video_id, scene_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS scenes_duration ON scenes (duration)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def ingest(self, video_path, result, recorded_at=None):
+        """
+        process_videoの結果を1つのトランザクションで保存する。同じ動画の既存のシーンは置き換える
+
+        Args:
+            video_path: 動画ファイルのパス
+            result: process_videoの結果（scenesとdescriptionsを含む辞書）
+            recorded_at: 撮影日時（UNIX時間、Noneの場合は動画ファイルの更新日時）
+
+        Returns:
+            int: 保存したシーン数
+        """
+        video_path = os.path.abspath(video_path)
+        if recorded_at is None:
+            recorded_at = os.path.getmtime(video_path) if os.path.exists(video_path) else time.time()
+
+        descriptions = {
+            description["scene_id"]: description["text"]
+            for description in result.get("descriptions", [])
+        }
+        rows = []
+        for scene in result.get("scenes", []):
+            description = descriptions.get(scene["scene_id"])
+            # 説明文には画像分析の応答（JSON）が含まれるため、天候状況を取り出して絞り込みに使う
+            weather = parse_frame_analysis(description).get("weather")
+            rows.append((
+                scene["scene_id"], scene["start_time"], scene["end_time"],
+                scene["end_time"] - scene["start_time"], weather, description
+            ))
+
+        duration = max((row[2] for row in rows), default=0.0)
+
+        with self._connect(immediate=True) as conn:
+            video = conn.execute("SELECT id FROM videos WHERE video_path = ?", (video_path,)).fetchone()
+            if video is not None:
+                video_id = video[0]
+                conn.execute(
+                    "DELETE FROM scene_fts WHERE rowid IN (SELECT id FROM scenes WHERE video_id = ?)",
+                    (video_id,)
+                )
+                conn.execute("DELETE FROM scenes WHERE video_id = ?", (video_id,))
+                conn.execute(
+                    "UPDATE videos SET recorded_at = ?, duration = ?, scene_count = ?, ingested_at = ? WHERE id = ?",
+                    (recorded_at, duration, len(rows), time.time(), video_id)
+                )
+            else:
+                video_id = conn.execute(
+                    "INSERT INTO videos (video_path, recorded_at, duration, scene_count, ingested_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (video_path, recorded_at, duration, len(rows), time.time())
+                ).lastrowid
+
+            (next_id,) = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM scenes").fetchone()
+            ids = range(next_id, next_id + len(rows))
+
+            conn.executemany(
+                "INSERT INTO scenes (id, video_id, scene_id, start_time, end_time, duration, weather, description) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(row_id, video_id, *row) for row_id, row in zip(ids, rows)]
+            )
+            conn.executemany(
+                "INSERT INTO scene_fts (rowid, grams, chars) VALUES (?, ?, ?)",
+                [(row_id, *build_fts_columns(row[5])) for row_id, row in zip(ids, rows)]
+            )
+
+        logging.info(f"動画 {video_path} の {len(rows)} シーンをライブラリに保存しました")
+        return len(rows)
+
+    def search(self, keyword=None, recorded_after=None, recorded_before=None, weather=None,
+               min_duration=None, max_duration=None, limit=None):
+        """
+        条件に一致するシーンを検索する
+
+        Args:
+            keyword: 説明文に含まれるキーワード（空白区切りの語はすべて含むシーンのみ一致）
+            recorded_after: 撮影日時の下限（UNIX時間）
+            recorded_before: 撮影日時の上限（UNIX時間）
+            weather: 天候状況に含まれる語（「晴」「雪」など）
+            min_duration: シーンの長さの下限（秒）
+            max_duration: シーンの長さの上限（秒）
+            limit: 返すシーン数の上限（Noneの場合はCONFIGから取得）
+
+        Returns:
+            list: シーンの辞書のリスト（キーワードがある場合は関連度順、ない場合は撮影日時の新しい順）
+        """
+        query = [
+            "SELECT v.video_path, v.recorded_at, s.scene_id, s.start_time, s.end_time,",
+            "s.duration, s.weather, s.description FROM scenes s JOIN videos v ON v.id = s.video_id"
+        ]
+        conditions = []
+        params = []
+
+        fts_query = build_fts_query(keyword)
+        if fts_query is not None:
+            query.append("JOIN scene_fts ON scene_fts.rowid = s.id")
+            conditions.append("scene_fts MATCH ?")
+            params.append(fts_query)
+
+        for condition, value in (
+            ("v.recorded_at >= ?", recorded_after),
+            ("v.recorded_at < ?", recorded_before),
+            ("s.duration >= ?", min_duration),
+            ("s.duration <= ?", max_duration)
+        ):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+
+        if weather:
+            conditions.append("s.weather LIKE ? ESCAPE '\\'")
+            escaped = weather.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+
+        if conditions:
+            query.append("WHERE " + " AND ".join(conditions))
+
+        if fts_query is not None:
+            query.append("ORDER BY scene_fts.rank")
+        else:
+            query.append("ORDER BY v.recorded_at DESC, s.video_id, s.scene_id")
+
+        query.append("LIMIT ?")
+        params.append(limit or CONFIG["library"]["max_results"])
+
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(" ".join(query), params).fetchall()
+
+        return [dict(row) for row in rows]
+
+    def get_metrics(self):
+        """
+        保存されている動画数とシーン数を取得する
+
+        Returns:
+            dict: 動画数とシーン数
+        """
+        with self._connect() as conn:
+            (videos,) = conn.execute("SELECT COUNT(*) FROM videos").fetchone()
+            (scenes,) = conn.execute("SELECT COUNT(*) FROM scenes").fetchone()
+
+        return {"videos": videos, "scenes": scenes}
+
+    @contextmanager
+    def _connect(self, immediate=False):
+        """
+        トランザクション内の接続を提供する。ブロックの終了時にコミット（例外時はロールバック）して閉じる
+
+        Args:
+            immediate: Trueの場合は書き込みロックを先に取得する
+
+        Yields:
+            sqlite3.Connection: 接続
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            # WALモードではコミットごとの同期を省略しても破損せず、取り込みが速くなる
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+def ingest_result(video_path, result, db_path=None):
+    """
+    設定で有効な場合に、process_videoの結果をライブラリに保存します。
+    保存に失敗しても分析結果には影響しません。
+
+    Args:
+        video_path: 動画ファイルのパス
+        result: process_videoの結果
+        db_path: データベースファイルのパス（Noneの場合はCONFIGから取得）
+    """
+    if not CONFIG["library"]["enabled"]:
+        return
+
+    try:
+        LibraryIndex(db_path).ingest(video_path, result)
+    except (sqlite3.Error, OSError) as e:
+        logging.error(f"ライブラリへの保存中にエラーが発生しました: {e}")
@@ -0,0 +1,539 @@
+"""
+ライブ入力分析 - 書き込み中の動画ファイルや標準入力のストリームを追従しながら分析する
+"""
+import os
+import re
+import sys
+import asyncio
+import logging
+import tempfile
+from ..config import CONFIG
+from ..models import Scene, SceneTable
+from ..tools.process_runner import with_thread_limit, read_stream_lines, terminate_process
+from ..tools.process_scheduler import get_scheduler, PRIORITY_LONG
+from ..tools.scene_detection import parse_scene_change, SCENE_DETECTION_FILTER
+from ..tools.transcription import transcribe_samples_async
+from ..tools.vision_analysis import analyze_frame_files_async, create_vision_model, get_frame_times
+from .session_manager import generate_descriptions, generate_editing_suggestions
+
+# 標準入力から読み取る場合のソース
+STDIN_SOURCE = "-"
+# 音声認識に渡す音声の形式（16kHz・16ビット・モノラル）
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 2
+# FFmpegの進捗表示（"time=00:01:02.34"）から処理済みの時間を取得する
+STATS_TIME_PATTERN = re.compile(r"time=(\d+):(\d+):(\d+(?:\.\d+)?)")
+
+def build_live_analysis_command(frame_dir, frame_rate):
+    """
+    標準入力の動画を1回だけデコードし、シーン変更点・フレーム画像・音声を同時に出力する
+    FFmpegコマンドを作成します。シーン変更点はshowinfoの出力として標準エラー出力に、
+    音声は16ビットモノラルPCMとして標準出力に書き出します。
+
+    Args:
+        frame_dir: フレーム画像を書き出すディレクトリ
+        frame_rate: フレーム画像のレート（枚/秒）
+
+    Returns:
+        list: FFmpegコマンド
+    """
+    return [
+        'ffmpeg',
+        '-i', 'pipe:0',
+        # シーン検出
+        '-map', '0:v:0',
+        '-filter:v', SCENE_DETECTION_FILTER,
+        '-f', 'null', '-',
+        # 画像分析用のフレーム
+        '-map', '0:v:0',
+        '-vf', f'fps={frame_rate}',
+        '-q:v', '2',
+        '-f', 'image2', os.path.join(frame_dir, 'frame_%08d.jpg'),
+        # 音声認識用の音声（音声トラックがない場合は出力しない）
+        '-map', '0:a:0?',
+        '-acodec', 'pcm_s16le',
+        '-ar', str(SAMPLE_RATE),
+        '-ac', '1',
+        '-f', 's16le', 'pipe:1'
+    ]
+
+def parse_stats_time(line):
+    """
+    FFmpegの進捗表示の行から処理済みの時間を取得します。
+
+    Args:
+        line: FFmpegの標準エラー出力の1行
+
+    Returns:
+        float: 処理済みの時間（秒）。該当しない行の場合はNone
+    """
+    match = STATS_TIME_PATTERN.search(line)
+    if match is None:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+async def iter_source_chunks(source, chunk_size=None, poll_interval=None, idle_timeout=None, stopped=None):
+    """
+    入力を一定サイズのチャンクごとに返す非同期ジェネレーター。
+    ファイルの場合は末尾に達しても追記を待ち、idle_timeout秒追記がなければ終了します。
+    標準入力（"-"）やファイルオブジェクトの場合は終端まで読み取ります。
+
+    Args:
+        source: ファイルのパス、"-"（標準入力）、またはバイナリのファイルオブジェクト
+        chunk_size: 読み取る単位（バイト、Noneの場合はCONFIGから取得）
+        poll_interval: 追記を確認する間隔（秒、Noneの場合はCONFIGから取得）
+        idle_timeout: 入力の終了とみなすまでの秒数（Noneの場合はCONFIGから取得）
+        stopped: 呼び出すとTrueを返す場合に読み取りを終了する関数
+
+    Yields:
+        bytes: 読み取ったチャンク
+    """
+    live_config = CONFIG["live"]
+    chunk_size = chunk_size or live_config["chunk_size"]
+    poll_interval = poll_interval if poll_interval is not None else live_config["poll_interval"]
+    idle_timeout = idle_timeout if idle_timeout is not None else live_config["idle_timeout"]
+    stopped = stopped or (lambda: False)
+
+    if not isinstance(source, str) or source == STDIN_SOURCE:
+        stream = sys.stdin.buffer if source == STDIN_SOURCE else source
+        read = getattr(stream, "read1", stream.read)
+        while not stopped():
+            chunk = await asyncio.to_thread(read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    with open(source, "rb") as f:
+        idle_since = loop.time()
+        while not stopped():
+            # 標準入力と同じく、読み取りでイベントループを待たせない
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if chunk:
+                idle_since = loop.time()
+                yield chunk
+                continue
+
+            # 書き込み中のファイルの末尾に達した場合は追記を待つ
+            if loop.time() - idle_since >= idle_timeout:
+                break
+            await asyncio.sleep(poll_interval)
+
+class AudioWindow:
+    """
+    ライブ入力の音声（16ビットモノラルPCM）のうち、まだ必要な直近の区間だけを保持するバッファ
+
+    入力の先頭からの時間で区間を取り出し、分析済みの区間はtrim()で破棄します。
+    """
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        """
+        AudioWindowの初期化
+
+        Args:
+            sample_rate: サンプルレート
+        """
+        self.sample_rate = sample_rate
+        self.bytes_per_second = sample_rate * BYTES_PER_SAMPLE
+        self.closed = False
+        self._buffer = bytearray()
+        # バッファの先頭の、入力の先頭からのバイト位置
+        self._offset = 0
+        self._updated = asyncio.Event()
+
+    @property
+    def start_time(self):
+        """保持している区間の開始時間（秒）"""
+        return self._offset / self.bytes_per_second
+
+    @property
+    def end_time(self):
+        """受け取った音声の終了時間（秒）"""
+        return (self._offset + len(self._buffer)) / self.bytes_per_second
+
+    def append(self, data):
+        """
+        音声を追加する
+
+        Args:
+            data: PCMのバイト列
+        """
+        self._buffer.extend(data)
+        self._notify()
+
+    def close(self):
+        """
+        音声の終了を通知する
+        """
+        self.closed = True
+        self._notify()
+
+    async def wait_until(self, time, timeout=None):
+        """
+        指定した時間までの音声を受け取るか、音声が終了するまで待つ
+
+        Args:
+            time: 待つ時間（秒）
+            timeout: 待つ上限（秒）
+
+        Returns:
+            bool: 指定した時間までの音声を受け取った場合True
+        """
+        async def wait():
+            while not self.closed and self.end_time < time:
+                await self._updated.wait()
+
+        try:
+            await asyncio.wait_for(wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.end_time >= time
+
+    def slice(self, start_time, end_time):
+        """
+        区間の音声を取り出す（破棄済み・未受信の部分は含まない）
+
+        Args:
+            start_time: 開始時間（秒）
+            end_time: 終了時間（秒）
+
+        Returns:
+            bytes: PCMのバイト列
+        """
+        start = max(self._position(start_time) - self._offset, 0)
+        end = max(self._position(end_time) - self._offset, start)
+        return bytes(self._buffer[start:end])
+
+    def trim(self, time):
+        """
+        指定した時間より前の音声を破棄する
+
+        Args:
+            time: 時間（秒）
+        """
+        size = min(self._position(time) - self._offset, len(self._buffer))
+        if size > 0:
+            del self._buffer[:size]
+            self._offset += size
+
+    def _position(self, time):
+        """
+        時間に対応するバイト位置（サンプルの境界に揃える）
+        """
+        return int(max(time, 0.0) * self.sample_rate) * BYTES_PER_SAMPLE
+
+    def _notify(self):
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    def __len__(self):
+        return len(self._buffer)
+
+class LiveAnalyzer:
+    """
+    書き込み中の動画ファイル、または標準入力から受け取る動画（フラグメント化MP4・MPEG-TS）のライブ分析
+
+    入力をチャンクごとにFFmpegの標準入力へ渡し、1回のデコードでシーン変更点・フレーム画像・音声を
+    取り出します。シーン変更点が検出されるか、変更点がないままmax_scene_length秒経過するとシーンを確定し、
+    確定したシーンから順に音声認識・画像分析・説明文生成を行ってセッションに追加します。
+    そのため、分析結果が入力の最新の位置から遅れる時間はおおよそmax_scene_lengthと1シーンの分析時間までに収まります。
+
+    音声とフレーム画像は分析が終わっていないシーンの分だけを保持し、分析待ちのシーンが
+    CONFIG["pipeline"]["queue_size"]に達した場合は入力の読み取りを止めるため、
+    入力がどれだけ長くても使用するメモリとディスクは一定です（セッションに追加する分析結果を除く）。
+    """
+    def __init__(self, session_manager, source, model=None):
+        """
+        LiveAnalyzerの初期化
+
+        Args:
+            session_manager: 結果を保存するセッションマネージャー
+            source: ファイルのパス、"-"（標準入力）、またはバイナリのファイルオブジェクト
+            model: フレーム分析用のGeminiモデル（Noneの場合は作成する）
+        """
+        live_config = CONFIG["live"]
+        self.session_manager = session_manager
+        self.source = source
+        self.model = model
+        self.min_scene_length = CONFIG["scene_detection"]["min_scene_length"]
+        self.max_scene_length = live_config["max_scene_length"]
+        self.frame_rate = live_config["frame_rate"]
+        self.audio_timeout = live_config["audio_timeout"]
+        self.worker_count = CONFIG["pipeline"]["workers"]
+
+        self.audio = AudioWindow()
+        self.scenes = SceneTable()
+        self.transcriptions = []
+        self.frame_analyses = []
+        self.descriptions = []
+
+        self.bytes_read = 0
+        self.live_edge = 0.0
+        self.finalized_until = 0.0
+        self.max_lag = 0.0
+        self._open_start = 0.0
+        # 確定済みで分析が終わっていないシーンの開始時間
+        self._pending_starts = {}
+        self._frame_dir = None
+        self._trimmed_frames = 0
+        self._stopped = False
+
+    def stop(self):
+        """
+        入力の読み取りを終了する。受け取り済みの入力の分析が終わるとrun()が終了する
+        """
+        self._stopped = True
+
+    async def run(self, progress_callback=None):
+        """
+        入力の終了（またはstop()）まで分析する
+
+        Args:
+            progress_callback: 分析済みの時間（秒）とメッセージを受け取る関数
+        """
+        scene_queue = asyncio.Queue(maxsize=CONFIG["pipeline"]["queue_size"])
+        events = asyncio.Queue()
+        model = self.model or create_vision_model()
+
+        self.session_manager.set_state("video_path", self.source if isinstance(self.source, str) else STDIN_SOURCE)
+        for key, value in (("scenes", self.scenes), ("transcriptions", self.transcriptions),
+                           ("frame_analyses", self.frame_analyses), ("descriptions", self.descriptions)):
+            self.session_manager.set_state(key, value)
+
+        logging.info(f"ライブ入力 {self.session_manager.get_state('video_path')} の分析を開始します")
+
+        with tempfile.TemporaryDirectory() as frame_dir:
+            self._frame_dir = frame_dir
+
+            # デコードは入力が終わるまで続くため、長いジョブとして実行枠を確保する
+            async with get_scheduler().async_slot(PRIORITY_LONG) as threads:
+                process = await asyncio.create_subprocess_exec(
+                    *with_thread_limit(build_live_analysis_command(frame_dir, self.frame_rate), threads),
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+
+                tasks = [
+                    asyncio.create_task(self._feed(process, scene_queue)),
+                    asyncio.create_task(self._decode(process, events)),
+                    asyncio.create_task(self._segment(events, scene_queue))
+                ]
+                tasks.extend(
+                    asyncio.create_task(self._consume(model, scene_queue, progress_callback))
+                    for _ in range(self.worker_count)
+                )
+
+                try:
+                    await asyncio.gather(*tasks)
+                except BaseException:
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    raise
+                finally:
+                    await terminate_process(process)
+
+        # ワーカーの完了順ではなくシーン順に並べ替える
+        self.transcriptions.sort(key=lambda item: item["scene_id"])
+        self.frame_analyses.sort(key=lambda item: item["timestamp"])
+        self.descriptions.sort(key=lambda item: item["scene_id"])
+
+        self.session_manager.set_state("transcriptions", self.transcriptions)
+        self.session_manager.set_state("frame_analyses", self.frame_analyses)
+        self.session_manager.set_state("descriptions", self.descriptions)
+        self.session_manager.set_state(
+            "editing_suggestions", generate_editing_suggestions(self.scenes, self.descriptions)
+        )
+
+        logging.info(f"ライブ入力の分析が完了しました（{len(self.scenes)} シーン、{self.live_edge:.1f} 秒）")
+
+    def get_metrics(self):
+        """
+        ライブ分析の統計情報を取得する
+
+        Returns:
+            dict: 読み取ったバイト数・入力の最新の位置・確定済みの位置・保持している音声の長さ・
+                  分析の遅れ（最新の位置と分析が終わったシーンの終了時間の差）の最大値など
+        """
+        return {
+            "bytes_read": self.bytes_read,
+            "live_edge": self.live_edge,
+            "finalized_until": self.finalized_until,
+            "scenes": len(self.scenes),
+            "pending_scenes": len(self._pending_starts),
+            "buffered_audio_seconds": self.audio.end_time - self.audio.start_time,
+            "max_lag": self.max_lag
+        }
+
+    async def _feed(self, process, scene_queue):
+        """
+        入力をFFmpegの標準入力に書き込む。分析待ちのシーンが上限に達している間は読み取りを止める
+        """
+        poll_interval = CONFIG["live"]["poll_interval"]
+
+        try:
+            async for chunk in iter_source_chunks(self.source, stopped=lambda: self._stopped):
+                while scene_queue.full() and not self._stopped:
+                    await asyncio.sleep(poll_interval)
+
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+                self.bytes_read += len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # FFmpegが先に終了した（終了コードは_decodeで記録する）
+            logging.warning("FFmpegが入力の途中で終了しました")
+        finally:
+            if not process.stdin.is_closing():
+                process.stdin.close()
+
+    async def _decode(self, process, events):
+        """
+        FFmpegの出力を読み取り、シーン変更点と処理済みの時間をeventsに、音声をAudioWindowに渡す
+        """
+        def handle_line(line):
+            time = parse_scene_change(line)
+            if time is not None:
+                events.put_nowait(("boundary", time))
+                return
+            time = parse_stats_time(line)
+            if time is not None:
+                events.put_nowait(("edge", time))
+
+        async def read_audio():
+            while True:
+                data = await process.stdout.read(65536)
+                if not data:
+                    break
+                self.audio.append(data)
+                events.put_nowait(("edge", self.audio.end_time))
+
+        try:
+            await asyncio.gather(
+                read_stream_lines(process.stderr, handle_line, capture_output=False),
+                read_audio()
+            )
+            returncode = await process.wait()
+            if returncode != 0:
+                logging.error(f"ライブ入力のデコードに失敗しました（終了コード: {returncode}）")
+        finally:
+            self.audio.close()
+            events.put_nowait(None)
+
+    async def _segment(self, events, scene_queue):
+        """
+        シーン変更点と処理済みの時間からシーンを確定し、分析キューに投入する
+        """
+        scene_id = 0
+
+        async def finalize(end_time):
+            nonlocal scene_id
+            scene_id += 1
+            scene = Scene(scene_id, self._open_start, end_time)
+            self._pending_starts[scene_id] = scene["start_time"]
+            self._open_start = end_time
+            self.finalized_until = end_time
+
+            self.scenes.append(scene)
+            self.session_manager.set_state("scenes", self.scenes)
+            await scene_queue.put(scene)
+
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+
+            kind, time = event
+            self.live_edge = max(self.live_edge, time)
+
+            # 最小シーン長に満たない変更点は無視し、次のシーンに含める
+            if kind == "boundary" and time - self._open_start >= self.min_scene_length:
+                await finalize(time)
+
+            # 変更点がないまま長く続くシーンは一定の長さで確定し、分析の遅れを抑える
+            while self.live_edge - self._open_start >= self.max_scene_length:
+                await finalize(self._open_start + self.max_scene_length)
+
+        # 入力の終了時に最後のシーンを確定する
+        # （変更点がない場合は入力全体を1つのシーンとし、最小シーン長に満たない末尾は含めない）
+        if self.live_edge > self._open_start and (
+            not self.scenes or self.live_edge - self._open_start >= self.min_scene_length
+        ):
+            await finalize(self.live_edge)
+
+        # ワーカーに終了を通知
+        for _ in range(self.worker_count):
+            await scene_queue.put(None)
+
+    async def _consume(self, model, scene_queue, progress_callback=None):
+        """
+        確定したシーンの音声認識と画像分析を行い、説明文を生成してセッションに追加する
+        """
+        while True:
+            scene = await scene_queue.get()
+            if scene is None:
+                break
+
+            await self.audio.wait_until(scene["end_time"], self.audio_timeout)
+            samples = self.audio.slice(scene["start_time"], scene["end_time"])
+            timestamp = (scene["start_time"] + scene["end_time"]) / 2
+
+            transcript, analysis = await asyncio.gather(
+                transcribe_samples_async(scene, samples, self.audio.sample_rate),
+                analyze_frame_files_async(model, timestamp, self._get_frame_paths(timestamp)),
+                return_exceptions=True
+            )
+
+            if isinstance(transcript, Exception):
+                logging.error(f"シーン {scene['scene_id']} の音声認識中にエラーが発生しました: {transcript}")
+                transcript = None
+            else:
+                self.transcriptions.append(transcript)
+                self.session_manager.set_state("transcriptions", self.transcriptions)
+            if isinstance(analysis, Exception):
+                logging.error(f"シーン {scene['scene_id']} のフレーム分析中にエラーが発生しました: {analysis}")
+                analysis = None
+            else:
+                self.frame_analyses.append(analysis)
+                self.session_manager.set_state("frame_analyses", self.frame_analyses)
+
+            self.descriptions.extend(generate_descriptions(
+                [scene],
+                [transcript] if transcript is not None else [],
+                [analysis] if analysis is not None else []
+            ))
+            self.session_manager.set_state("descriptions", self.descriptions)
+
+            del self._pending_starts[scene["scene_id"]]
+            self.max_lag = max(self.max_lag, self.live_edge - scene["end_time"])
+            self._trim()
+
+            if progress_callback:
+                progress_callback(scene["end_time"], f"シーン {scene['scene_id']} の分析が完了しました")
+
+    def _get_frame_paths(self, timestamp):
+        """
+        タイムスタンプの前後のフレーム画像のパス（FFmpegのfpsフィルターの出力番号から求める）
+        """
+        indexes = sorted({int(frame_time * self.frame_rate) + 1 for frame_time in get_frame_times(timestamp)})
+        return [self._frame_path(index) for index in indexes]
+
+    def _frame_path(self, index):
+        return os.path.join(self._frame_dir, f"frame_{index:08d}.jpg")
+
+    def _trim(self):
+        """
+        分析が終わっていないシーンより前の音声とフレーム画像を破棄する
+        """
+        keep_from = min(self._pending_starts.values(), default=self._open_start)
+        self.audio.trim(keep_from)
+
+        # get_frame_timesはシーンの中央の0.5秒前からフレームを使用するため、1秒分の余裕を残す
+        last_index = int(max(keep_from - 1.0, 0.0) * self.frame_rate)
+        for index in range(self._trimmed_frames + 1, last_index + 1):
+            try:
+                os.remove(self._frame_path(index))
+            except FileNotFoundError:
+                pass
+        self._trimmed_frames = max(self._trimmed_frames, last_index)
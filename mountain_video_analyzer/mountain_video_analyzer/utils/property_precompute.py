@@ -0,0 +1,205 @@
+"""
+プロパティの事前計算 - 分析後に全シーンの感情的なトーンと天候状況をまとめて求める
+"""
+import json
+import asyncio
+import logging
+import google.generativeai as genai
+from ..config import CONFIG, GEMINI_API_KEY
+from ..models.segment import FRAME_PROPERTY_LABELS
+from ..tools.vision_analysis import ensure_parsed, extract_json_object
+from ..tools.cancellation import record_reclaimed
+from .scene_index import build_id_index
+from .response_cache import content_hash
+
+# 事前計算するプロパティ（PropertyQuerySystemのツールの応答のキー）
+PRECOMPUTED_PROPERTIES = ("emotional_tone", "weather_conditions")
+
+BATCH_PROMPT = """
+以下の登山動画の各シーンについて、感情的なトーンと天候状況を分析してください。
+
+- emotional_tone: 説明文から、感情（興奮、平穏、緊張、喜び、驚きなど）と強度（1-5のスケール）を特定してください。
+- weather_conditions: フレーム分析から、天候（晴れ、曇り、雨、雪など）、気温（推定）、視界（良好、普通、不良）などを特定してください。
+
+説明文またはフレーム分析がないシーンでは、その項目を省略してください。
+シーンIDをキーとし、"emotional_tone"と"weather_conditions"を持つJSONオブジェクトで回答してください。
+"""
+
+def join_analysis_text(scene_analyses):
+    """
+    シーンのフレーム分析の応答テキストを1つの文字列にまとめます。
+
+    Args:
+        scene_analyses: フレーム分析結果のリスト
+
+    Returns:
+        str: 応答テキストを空白で連結した文字列
+    """
+    return " ".join(analysis["analysis"] or "" for analysis in scene_analyses)
+
+def get_local_weather_conditions(scene_analyses):
+    """
+    フレーム分析の解析済みフィールドから天候状況と時間帯を取得します。
+
+    Args:
+        scene_analyses: 構造化フィールドを持つFrameAnalysisのリスト
+
+    Returns:
+        dict: 項目名をキー、値のリストを値とする辞書（解析済みの値がない場合は空）
+    """
+    weather_conditions = {}
+    for name in ("weather", "time_of_day"):
+        values = unique_values(analysis[name] for analysis in scene_analyses)
+        if values:
+            weather_conditions[FRAME_PROPERTY_LABELS[name]] = values
+    return weather_conditions
+
+def unique_values(values):
+    """
+    Noneを除いた値を、出現順を保ったまま重複なく取得します。
+
+    Args:
+        values: 値のイテラブル
+
+    Returns:
+        list: 値のリスト
+    """
+    return list(dict.fromkeys(value for value in values if value is not None))
+
+def collect_precompute_inputs(session_manager):
+    """
+    モデルに問い合わせる必要があるシーンの入力を集めます。
+    天候状況はフレーム分析から解析できなかったシーンのみを対象にします。
+
+    Args:
+        session_manager: セッションマネージャー
+
+    Returns:
+        list: シーンID・説明文・フレーム分析テキストを持つ辞書のリスト
+    """
+    descriptions = build_id_index(session_manager.get_state("descriptions", []))
+    inputs = []
+
+    for scene in session_manager.get_state("scenes", []):
+        scene_id = scene["scene_id"]
+        description = descriptions.get(scene_id)
+        scene_analyses = [
+            ensure_parsed(analysis)
+            for analysis in session_manager.get_frame_analyses_for_scene(scene_id)
+        ]
+
+        item = {
+            "scene_id": scene_id,
+            "emotional_tone": description["text"] if description and description["text"] else None,
+            "weather_conditions": None
+        }
+        if scene_analyses and not get_local_weather_conditions(scene_analyses):
+            item["weather_conditions"] = join_analysis_text(scene_analyses)
+
+        if item["emotional_tone"] is not None or item["weather_conditions"] is not None:
+            inputs.append(item)
+
+    return inputs
+
+def build_batch_prompt(batch):
+    """
+    複数シーンをまとめて問い合わせるプロンプトを作成します。
+
+    Args:
+        batch: collect_precompute_inputsが返す辞書のリスト
+
+    Returns:
+        str: プロンプト
+    """
+    sections = [BATCH_PROMPT]
+    for item in batch:
+        sections.append(f"[シーンID: {item['scene_id']}]")
+        if item["emotional_tone"] is not None:
+            sections.append(f"説明文: {item['emotional_tone']}")
+        if item["weather_conditions"] is not None:
+            sections.append(f"フレーム分析: {item['weather_conditions']}")
+    return "\n".join(sections)
+
+async def precompute_scene_properties(session_manager, model=None, batch_size=None, concurrency=None):
+    """
+    全シーンの感情的なトーンと天候状況を、数回のモデル呼び出しでまとめて計算します。
+
+    結果は"scene_properties"としてセッションに保存され、PropertyQuerySystemのツールは
+    説明文・フレーム分析の内容が計算時と同じ場合にモデルを呼び出さずにこの値を返します。
+    失敗したバッチのシーンは保存されず、ツールの呼び出し時に個別に計算されます。
+
+    Args:
+        session_manager: セッションマネージャー
+        model: 使用するGeminiモデル（Noneの場合は対話用のモデルを作成）
+        batch_size: 1回の呼び出しで問い合わせるシーン数（Noneの場合はCONFIGから取得）
+        concurrency: 同時に実行する呼び出し数（Noneの場合はCONFIGから取得）
+
+    Returns:
+        dict: シーンIDをキー、プロパティと元の内容のハッシュを値とする辞書
+    """
+    precompute_config = CONFIG["precompute"]
+    batch_size = batch_size or precompute_config["batch_size"]
+    semaphore = asyncio.Semaphore(concurrency or precompute_config["concurrency"])
+
+    if model is None:
+        genai.configure(api_key=GEMINI_API_KEY)
+        model = genai.GenerativeModel(model_name=CONFIG["models"]["interactive"])
+
+    inputs = collect_precompute_inputs(session_manager)
+    batches = [inputs[i:i + batch_size] for i in range(0, len(inputs), batch_size)]
+    scene_properties = {}
+
+    async def run_batch(batch):
+        async with semaphore:
+            try:
+                response = await model.generate_content_async(build_batch_prompt(batch))
+            except asyncio.CancelledError:
+                record_reclaimed("model_calls")
+                raise
+            except Exception as e:
+                logging.error(f"プロパティの事前計算中にエラーが発生しました: {e}")
+                return
+
+        data = extract_json_object(response.text)
+        if data is None:
+            logging.warning(f"プロパティの事前計算の応答を解析できませんでした（{len(batch)}シーン）")
+            return
+
+        for item in batch:
+            answer = data.get(str(item["scene_id"]))
+            if not isinstance(answer, dict):
+                continue
+
+            properties = {}
+            for name in PRECOMPUTED_PROPERTIES:
+                if item[name] is not None and answer.get(name) is not None:
+                    value = answer[name]
+                    properties[name] = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+                    properties[f"{name}_hash"] = content_hash(item[name])
+
+            if properties:
+                scene_properties[item["scene_id"]] = properties
+
+    logging.info(f"{len(inputs)}シーンのプロパティを{len(batches)}回の呼び出しで事前計算します")
+    await asyncio.gather(*(run_batch(batch) for batch in batches))
+
+    session_manager.set_state("scene_properties", scene_properties)
+    return scene_properties
+
+def get_precomputed_property(session_manager, name, scene_id, content):
+    """
+    事前計算したプロパティを取得します。
+
+    Args:
+        session_manager: セッションマネージャー
+        name: プロパティ名（"emotional_tone"または"weather_conditions"）
+        scene_id: シーンID
+        content: プロパティの元になった現在の説明文またはフレーム分析テキスト
+
+    Returns:
+        str: プロパティの値（未計算、または計算後に内容が変わった場合はNone）
+    """
+    properties = session_manager.get_state("scene_properties", {}).get(scene_id)
+    if not properties or properties.get(f"{name}_hash") != content_hash(content):
+        return None
+    return properties.get(name)
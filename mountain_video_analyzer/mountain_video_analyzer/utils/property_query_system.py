@@ -4,6 +4,13 @@
 from ..agents.agent import Agent
 from ..utils.function_tool import FunctionTool
 from ..config import CONFIG, GEMINI_API_KEY
+from ..models.segment import FRAME_PROPERTY_LABELS
+from ..tools.vision_analysis import ensure_parsed
+from .response_cache import ResponseCache, content_hash
+from .session_manager import TEXT_INDEX_FIELDS
+from .property_precompute import (
+    get_local_weather_conditions, get_precomputed_property, join_analysis_text, unique_values
+)
 import google.generativeai as genai
 
 class PropertyQuerySystem:
@@ -21,10 +28,14 @@ class PropertyQuerySystem:
         
         # Geminiモデルを初期化
         genai.configure(api_key=GEMINI_API_KEY)
+        self.model_name = CONFIG["models"]["interactive"]
         self.model = genai.GenerativeModel(
-            model_name=CONFIG["models"]["interactive"]
+            model_name=self.model_name
         )
         
+        # 同じシーン・同じ内容への質問ではLLMの応答を再利用する
+        self.response_cache = ResponseCache()
+        
         # 対話型プロパティ照会エージェントを作成
         self.agent = Agent(
             name="property_query_agent",
@@ -37,9 +48,12 @@ class PropertyQuerySystem:
             """,
             tools=[
                 FunctionTool(self.get_scene_by_time),
+                FunctionTool(self.get_scenes_by_times),
                 FunctionTool(self.search_scenes_by_keyword),
+                FunctionTool(self.search_scenes_semantic),
                 FunctionTool(self.get_emotional_tone),
-                FunctionTool(self.get_weather_conditions)
+                FunctionTool(self.get_weather_conditions),
+                FunctionTool(self.get_scene_properties)
             ]
         )
     
@@ -56,18 +70,42 @@ class PropertyQuerySystem:
         if not self.session_manager:
             return {"error": "セッションが初期化されていません"}
         
-        scenes = self.session_manager.get_state("scenes", [])
-        
-        for scene in scenes:
-            if scene["start_time"] <= time <= scene["end_time"]:
-                return {"scene": scene}
+        # シーンの境界配列を二分探索する（インデックスはシーンが変更されるまで再利用される）
+        scene = self.session_manager.get_scene_index().scene_at(time)
+        if scene is not None:
+            return {"scene": scene.to_dict()}
         
         return {"error": f"時間 {time} 秒のシーンが見つかりません"}
     
+    def get_scenes_by_times(self, times: list) -> dict:
+        """
+        複数の時間のシーン情報をまとめて取得
+        
+        Args:
+            times: 動画内の時間（秒）のリスト
+            
+        Returns:
+            dict: 時間ごとのシーン情報（見つからない場合はNone）
+        """
+        if not self.session_manager:
+            return {"error": "セッションが初期化されていません"}
+        
+        scenes = self.session_manager.get_scene_index().scenes_at_times(times)
+        
+        return {
+            "scenes": [
+                {"time": time, "scene": scene.to_dict() if scene is not None else None}
+                for time, scene in zip(times, scenes)
+            ]
+        }
+    
     def search_scenes_by_keyword(self, keyword: str) -> dict:
         """
         キーワードに一致するシーンを検索
         
+        説明文・書き起こし・フレーム分析の全文検索インデックスを使用し、
+        一致したシーンを関連度の高い順に返します。
+        
         Args:
             keyword: 検索キーワード
             
@@ -77,35 +115,83 @@ class PropertyQuerySystem:
         if not self.session_manager:
             return {"error": "セッションが初期化されていません"}
         
-        scenes = self.session_manager.get_state("scenes", [])
-        descriptions = self.session_manager.get_state("descriptions", [])
+        text_index = self.session_manager.get_text_index()
+        
+        # 文書ごとのスコアをシーンごとに合算する
+        scene_scores = {}
+        for (field, scene_id, item_key), score in text_index.search(keyword):
+            match = scene_scores.setdefault(scene_id, {"score": 0.0, "matched_fields": []})
+            match["score"] += score
+            if field not in match["matched_fields"]:
+                match["matched_fields"].append(field)
         
+        ranked = sorted(scene_scores.items(), key=lambda item: item[1]["score"], reverse=True)
+        scenes = self.session_manager.get_scene_index()
         matching_scenes = []
         
-        for scene in scenes:
-            scene_id = scene["scene_id"]
-            
-            # 対応する説明文を検索
-            scene_description = None
-            for desc in descriptions:
-                if desc["scene_id"] == scene_id:
-                    scene_description = desc["text"]
-                    break
-            
-            # キーワードが説明文に含まれているか確認
-            if scene_description and keyword.lower() in scene_description.lower():
-                matching_scenes.append({
-                    "scene_id": scene_id,
-                    "start_time": scene["start_time"],
-                    "end_time": scene["end_time"],
-                    "description": scene_description
-                })
+        for scene_id, match in ranked[:CONFIG["search"]["max_results"]]:
+            scene = scenes.get(scene_id)
+            description = text_index.documents.get(("description", scene_id, scene_id))
+            matching_scenes.append({
+                "scene_id": scene_id,
+                "start_time": scene["start_time"] if scene else None,
+                "end_time": scene["end_time"] if scene else None,
+                "description": description["text"] if description else None,
+                "score": round(match["score"], 4),
+                "matched_fields": match["matched_fields"]
+            })
         
         return {
             "matching_scenes": matching_scenes,
-            "total_matches": len(matching_scenes)
+            "total_matches": len(scene_scores)
         }
     
+    def search_scenes_semantic(self, query: str) -> dict:
+        """
+        質問文に意味の近いシーンを検索
+        
+        説明文・書き起こし・フレーム分析の埋め込みベクトルとの類似度で検索するため、
+        キーワードと表記が完全に一致しない言い換え（「雲海」と「雲の海」など）にも一致します。
+        検索はローカルで実行され、ネットワーク接続は不要です。
+        
+        Args:
+            query: 検索したい内容
+            
+        Returns:
+            dict: 類似度の高い順のシーンのリスト
+        """
+        if not self.session_manager:
+            return {"error": "セッションが初期化されていません"}
+        
+        vector_index = self.session_manager.get_vector_index()
+        max_results = CONFIG["semantic_search"]["max_results"]
+        
+        # 1シーンに複数の文書があるため多めに取得し、シーンごとに最も類似度の高い文書を採用する
+        scene_matches = {}
+        for (field, scene_id, item_key), score in vector_index.search(query, max_results * len(TEXT_INDEX_FIELDS) * 2):
+            if score <= 0:
+                break
+            match = scene_matches.setdefault(scene_id, {"score": score, "matched_fields": []})
+            if field not in match["matched_fields"]:
+                match["matched_fields"].append(field)
+        
+        scenes = self.session_manager.get_scene_index()
+        matching_scenes = []
+        
+        for scene_id, match in list(scene_matches.items())[:max_results]:
+            scene = scenes.get(scene_id)
+            description = self.session_manager.get_description(scene_id)
+            matching_scenes.append({
+                "scene_id": scene_id,
+                "start_time": scene["start_time"] if scene else None,
+                "end_time": scene["end_time"] if scene else None,
+                "description": description["text"] if description else None,
+                "score": round(match["score"], 4),
+                "matched_fields": match["matched_fields"]
+            })
+        
+        return {"matching_scenes": matching_scenes}
+    
     def get_emotional_tone(self, scene_id: int) -> dict:
         """
         指定されたシーンの感情的なトーンを取得
@@ -114,34 +200,42 @@ class PropertyQuerySystem:
             scene_id: シーンID
             
         Returns:
-            dict: 感情的なトーン情報
+            dict: 感情的なトーン情報（sourceは"precomputed"または"llm"）
         """
         if not self.session_manager:
             return {"error": "セッションが初期化されていません"}
         
-        scenes = self.session_manager.get_state("scenes", [])
-        descriptions = self.session_manager.get_state("descriptions", [])
+        scenes = self.session_manager.get_scene_index()
         
         # 対応するシーンを検索
-        target_scene = None
-        for scene in scenes:
-            if scene["scene_id"] == scene_id:
-                target_scene = scene
-                break
+        target_scene = scenes.get(scene_id)
         
         if not target_scene:
             return {"error": f"シーンID {scene_id} が見つかりません"}
         
-        # 対応する説明文を検索
-        scene_description = None
-        for desc in descriptions:
-            if desc["scene_id"] == scene_id:
-                scene_description = desc["text"]
-                break
+        # "lazy"モードの場合は、説明文を取得する前にシーンを分析する
+        error = self.ensure_scene_analyzed(scene_id)
+        if error:
+            return error
+        
+        # 対応する説明文をシーンIDの対応表から取得
+        description = self.session_manager.get_description(scene_id)
+        scene_description = description["text"] if description else None
         
         if not scene_description:
             return {"error": f"シーンID {scene_id} の説明文が見つかりません"}
         
+        # 分析後に事前計算した値があれば、モデルを呼び出さずに返す
+        emotional_tone = get_precomputed_property(
+            self.session_manager, "emotional_tone", scene_id, scene_description
+        )
+        if emotional_tone is not None:
+            return {
+                "scene_id": scene_id,
+                "emotional_tone": emotional_tone,
+                "source": "precomputed"
+            }
+        
         # Geminiモデルを使用して感情的なトーンを分析
         prompt = f"""
         以下の登山動画シーンの説明文から、感情的なトーンを分析してください。
@@ -152,47 +246,54 @@ class PropertyQuerySystem:
         JSON形式で回答してください。
         """
         
-        response = self.model.generate_content(prompt)
+        emotional_tone = self.generate_cached(
+            "get_emotional_tone", scene_id, scene_description, prompt
+        )
         
         return {
             "scene_id": scene_id,
-            "emotional_tone": response.text
+            "emotional_tone": emotional_tone,
+            "source": "llm"
         }
     
     def get_weather_conditions(self, scene_id: int) -> dict:
         """
         指定されたシーンの天候状況を取得
         
+        フレーム分析の応答から解析済みの天候状況・時間帯を返します。
+        解析できたフレーム分析がない場合のみ、Geminiモデルで分析テキストから抽出します。
+        
         Args:
             scene_id: シーンID
             
         Returns:
-            dict: 天候状況情報
+            dict: 天候状況情報（sourceは"local"・"precomputed"・"llm"のいずれか）
         """
         if not self.session_manager:
             return {"error": "セッションが初期化されていません"}
         
-        scenes = self.session_manager.get_state("scenes", [])
-        frame_analyses = self.session_manager.get_state("frame_analyses", [])
-        
-        # 対応するシーンを検索
-        target_scene = None
-        for scene in scenes:
-            if scene["scene_id"] == scene_id:
-                target_scene = scene
-                break
-        
-        if not target_scene:
-            return {"error": f"シーンID {scene_id} が見つかりません"}
-        
-        # 対応するフレーム分析を検索
-        scene_analyses = []
-        for analysis in frame_analyses:
-            if target_scene["start_time"] <= analysis["timestamp"] <= target_scene["end_time"]:
-                scene_analyses.append(analysis["analysis"])
-        
-        if not scene_analyses:
-            return {"error": f"シーンID {scene_id} のフレーム分析が見つかりません"}
+        scene_analyses = self.get_scene_frame_analyses(scene_id)
+        if isinstance(scene_analyses, dict):
+            return scene_analyses
+        
+        weather_conditions = get_local_weather_conditions(scene_analyses)
+        if weather_conditions:
+            return {
+                "scene_id": scene_id,
+                "weather_conditions": weather_conditions,
+                "source": "local"
+            }
+        
+        analysis_text = join_analysis_text(scene_analyses)
+        weather_conditions = get_precomputed_property(
+            self.session_manager, "weather_conditions", scene_id, analysis_text
+        )
+        if weather_conditions is not None:
+            return {
+                "scene_id": scene_id,
+                "weather_conditions": weather_conditions,
+                "source": "precomputed"
+            }
         
         # Geminiモデルを使用して天候状況を抽出
         prompt = f"""
@@ -200,18 +301,122 @@ class PropertyQuerySystem:
         天候（晴れ、曇り、雨、雪など）、気温（推定）、視界（良好、普通、不良）などを特定してください。
         
         フレーム分析:
-        {' '.join(scene_analyses)}
+        {analysis_text}
         
         JSON形式で回答してください。
         """
         
-        response = self.model.generate_content(prompt)
+        weather_conditions = self.generate_cached(
+            "get_weather_conditions", scene_id, analysis_text, prompt
+        )
         
         return {
             "scene_id": scene_id,
-            "weather_conditions": response.text
+            "weather_conditions": weather_conditions,
+            "source": "llm"
         }
     
+    def get_scene_properties(self, scene_id: int) -> dict:
+        """
+        指定されたシーンのフレーム分析から解析済みのプロパティ（場所・活動・天候など）を取得
+        
+        Args:
+            scene_id: シーンID
+            
+        Returns:
+            dict: 項目名をキー、フレームごとの値のリストを値とするプロパティ情報
+        """
+        if not self.session_manager:
+            return {"error": "セッションが初期化されていません"}
+        
+        scene_analyses = self.get_scene_frame_analyses(scene_id)
+        if isinstance(scene_analyses, dict):
+            return scene_analyses
+        
+        properties = {}
+        for name, label in FRAME_PROPERTY_LABELS.items():
+            values = unique_values(analysis[name] for analysis in scene_analyses)
+            if values:
+                properties[label] = values
+        
+        if not properties:
+            return {"error": f"シーンID {scene_id} のフレーム分析を解析できませんでした"}
+        
+        return {
+            "scene_id": scene_id,
+            "properties": properties
+        }
+    
+    def generate_cached(self, tool, scene_id, content, prompt):
+        """
+        プロンプトの応答をキャッシュ経由で生成
+        
+        キーには元になった内容のハッシュを含むため、シーンの説明文やフレーム分析が
+        変更されると次の呼び出しでモデルが呼び出され、古い応答は削除されます。
+        
+        Args:
+            tool: ツール名
+            scene_id: シーンID
+            content: プロンプトの元になった説明文やフレーム分析
+            prompt: モデルに渡すプロンプト
+            
+        Returns:
+            str: 応答テキスト
+        """
+        key = (tool, scene_id, content_hash(content), self.model_name)
+        return self.response_cache.get_or_compute(
+            key, lambda: self.model.generate_content(prompt).text
+        )
+    
+    def get_scene_frame_analyses(self, scene_id):
+        """
+        シーンに含まれるフレーム分析結果を、構造化フィールドを持つFrameAnalysisとして取得
+        
+        Args:
+            scene_id: シーンID
+            
+        Returns:
+            list: FrameAnalysisのリスト（シーンまたは分析結果がない場合はエラーの辞書）
+        """
+        if self.session_manager.get_scene_index().get(scene_id) is None:
+            return {"error": f"シーンID {scene_id} が見つかりません"}
+        
+        error = self.ensure_scene_analyzed(scene_id)
+        if error:
+            return error
+        
+        scene_analyses = [
+            ensure_parsed(analysis)
+            for analysis in self.session_manager.get_frame_analyses_for_scene(scene_id)
+        ]
+        
+        if not scene_analyses:
+            return {"error": f"シーンID {scene_id} のフレーム分析が見つかりません"}
+        
+        return scene_analyses
+    
+    def ensure_scene_analyzed(self, scene_id):
+        """
+        "lazy"モードで分析したセッションの場合、シーンの分析が完了するまで待機
+        
+        分析済みのシーンはすぐに戻り、未分析のシーンはこの呼び出しで分析されます。
+        
+        Args:
+            scene_id: シーンID
+            
+        Returns:
+            dict: 分析に失敗した場合はエラー情報（それ以外はNone）
+        """
+        lazy_analyzer = self.session_manager.lazy_analyzer
+        if lazy_analyzer is None or lazy_analyzer.is_analyzed(scene_id):
+            return None
+        
+        try:
+            lazy_analyzer.ensure_scenes([scene_id])
+        except Exception as e:
+            return {"error": f"シーンID {scene_id} の分析中にエラーが発生しました: {e}"}
+        return None
+    
     def get_agent(self):
         """
         エージェントを返す
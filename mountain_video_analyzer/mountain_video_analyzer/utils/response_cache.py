@@ -0,0 +1,157 @@
+"""
+応答キャッシュ - LLMの応答をTTLと件数の上限付きで再利用する
+"""
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from ..config import CONFIG
+
+def content_hash(text):
+    """
+    プロンプトの元になったテキストのハッシュを計算します。
+
+    Args:
+        text: テキスト
+
+    Returns:
+        str: SHA-256の16進文字列
+    """
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    LRU・TTL方式の応答キャッシュ
+
+    キーは(ツール名, シーンID, 内容のハッシュ, モデル名)です。説明文やフレーム分析が変わると
+    ハッシュが変わるため古い応答は使われず、同じ(ツール名, シーンID, モデル名)の古いエントリは
+    新しい応答を保存したときに削除されます。
+    同じキーの計算が実行中の場合、後から来た呼び出しはその結果を待ち、モデルは1回だけ呼び出されます。
+    """
+    def __init__(self, max_entries=None, ttl=None, clock=time.monotonic):
+        """
+        ResponseCacheの初期化
+
+        Args:
+            max_entries: 保持するエントリ数の上限（Noneの場合はCONFIGから取得）
+            ttl: エントリの有効期間（秒、Noneの場合はCONFIGから取得）
+            clock: 現在時刻を返す関数
+        """
+        cache_config = CONFIG["response_cache"]
+        self.max_entries = max_entries if max_entries is not None else cache_config["max_entries"]
+        self.ttl = ttl if ttl is not None else cache_config["ttl"]
+        self.clock = clock
+
+        self._entries = OrderedDict()
+        self._latest = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_compute(self, key, compute):
+        """
+        キャッシュされた応答を返す。ない場合はcomputeを呼び出して結果を保存する
+
+        Args:
+            key: (ツール名, シーンID, 内容のハッシュ, モデル名)
+            compute: 応答を計算する引数なしの関数（例外は保存せずに呼び出し元へ送出する）
+
+        Returns:
+            computeの戻り値
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if self.clock() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+
+            future = self._in_flight.get(key)
+            waiting = future is not None
+            if waiting:
+                self.coalesced += 1
+            else:
+                future = self._in_flight[key] = Future()
+                self.misses += 1
+
+        if waiting:
+            # 同じキーを計算中の呼び出しの結果を待つ
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            self._store(key, value)
+        future.set_result(value)
+
+        return value
+
+    def invalidate(self, tool=None, scene_id=None):
+        """
+        条件に一致するエントリを削除する
+
+        Args:
+            tool: ツール名（Noneの場合はすべて）
+            scene_id: シーンID（Noneの場合はすべて）
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if (tool is None or key[0] == tool) and (scene_id is None or key[1] == scene_id):
+                    self._remove(key)
+
+    def get_metrics(self):
+        """
+        キャッシュの統計情報を取得する
+
+        Returns:
+            dict: エントリ数・ヒット数・ミス数・実行中の計算を待った回数
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced
+            }
+
+    def _store(self, key, value):
+        """
+        エントリを保存し、同じツール・シーン・モデルの古いエントリと上限を超えたエントリを削除する
+        """
+        group = (key[0], key[1], key[3])
+        previous = self._latest.get(group)
+        if previous is not None and previous != key:
+            self._remove(previous)
+
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        self._latest[group] = key
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        """
+        エントリを削除する
+        """
+        self._entries.pop(key, None)
+        group = (key[0], key[1], key[3])
+        if self._latest.get(group) == key:
+            del self._latest[group]
@@ -0,0 +1,172 @@
+"""
+シーンインデックス - シーンIDとタイムスタンプからシーンを高速に検索する
+"""
+import numpy as np
+from ..models.scene_data import Scene, SceneTable
+
+def build_id_index(items, key="scene_id"):
+    """
+    リストの要素をシーンIDで引ける辞書を作成します。
+    同じIDの要素が複数ある場合は、線形探索と同じく最初の要素を採用します。
+
+    Args:
+        items: シーンIDを持つ辞書のリスト
+        key: IDのキー
+
+    Returns:
+        dict: IDをキー、要素を値とする辞書
+    """
+    index = {}
+    for item in items:
+        index.setdefault(item[key], item)
+    return index
+
+class SceneIndex:
+    """
+    シーンの区間インデックス
+
+    シーンを開始時刻順に並べた境界配列を保持し、タイムスタンプを含むシーンを二分探索で求めます。
+    複数のタイムスタンプはnumpy.searchsortedで一度に検索できます。
+    シーン検出が出力するシーンは重なりのない連続した区間であることを前提とします。
+    区間の両端を含むため、境界のタイムスタンプは前後両方のシーンに含まれます。
+    """
+    def __init__(self, scenes):
+        """
+        SceneIndexの初期化
+
+        Args:
+            scenes: シーンのリストまたはSceneTable（scene_id, start_time, end_timeを含む）
+        """
+        table = SceneTable.from_records(scenes)
+        order = np.argsort(table.start_times, kind="stable")
+
+        # 元のテーブルが後から変更されても影響を受けないよう、並べ替えたコピーを保持する
+        self.scene_ids = table.scene_ids[order]
+        self.start_times = table.start_times[order]
+        self.end_times = table.end_times[order]
+        # シーンIDから並べ替え後の行番号への対応表（同じIDは最初のシーンを採用する）
+        self._positions = {}
+        for position, scene_id in enumerate(self.scene_ids.tolist()):
+            self._positions.setdefault(scene_id, position)
+
+    def __len__(self):
+        return len(self.scene_ids)
+
+    def get(self, scene_id):
+        """
+        シーンIDからシーンを取得する
+
+        Args:
+            scene_id: シーンID
+
+        Returns:
+            Scene: シーン（存在しない場合はNone）
+        """
+        position = self._positions.get(scene_id)
+        return self.scene(position) if position is not None else None
+
+    def scene(self, position):
+        """
+        並べ替え後の行番号のシーンを取得する
+
+        Args:
+            position: 行番号
+
+        Returns:
+            Scene: シーン
+        """
+        return Scene(
+            int(self.scene_ids[position]),
+            float(self.start_times[position]),
+            float(self.end_times[position])
+        )
+
+    def lookup(self, timestamps):
+        """
+        複数のタイムスタンプを含むシーンの行番号をまとめて検索する。
+        境界のタイムスタンプには開始時刻の早いシーンを返す
+
+        Args:
+            timestamps: タイムスタンプ（秒）の配列
+
+        Returns:
+            numpy.ndarray: 並べ替え後の行番号の配列（該当するシーンがない場合は-1）
+        """
+        positions, previous = self._candidates(timestamps)
+        return np.where(previous >= 0, previous, positions)
+
+    def scene_ids_at_times(self, timestamps):
+        """
+        複数のタイムスタンプについて、それぞれを含むすべてのシーンのIDをまとめて検索する
+
+        Args:
+            timestamps: タイムスタンプ（秒）の配列
+
+        Returns:
+            list: タイムスタンプごとのシーンIDのリスト（開始時刻順）
+        """
+        positions, previous = self._candidates(timestamps)
+        scene_ids = self.scene_ids.tolist()
+
+        return [
+            [scene_ids[p] for p in (before, position) if p >= 0]
+            for before, position in zip(previous.tolist(), positions.tolist())
+        ]
+
+    def _candidates(self, timestamps):
+        """
+        各タイムスタンプを含むシーンの候補を求める。
+        開始時刻がtimestamp以下の最後のシーンと、境界を共有するその1つ前のシーンが候補になる
+
+        Args:
+            timestamps: タイムスタンプ（秒）の配列
+
+        Returns:
+            tuple: (最後のシーンの行番号, 1つ前のシーンの行番号)。含まない場合はそれぞれ-1
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if len(self) == 0:
+            empty = np.full(timestamps.shape, -1)
+            return empty, empty
+
+        positions = np.searchsorted(self.start_times, timestamps, side="right") - 1
+        contains = (positions >= 0) & (self.end_times[np.maximum(positions, 0)] >= timestamps)
+
+        previous = positions - 1
+        previous_contains = (previous >= 0) & (self.end_times[np.maximum(previous, 0)] >= timestamps)
+
+        return np.where(contains, positions, -1), np.where(previous_contains, previous, -1)
+
+    def scene_at(self, timestamp):
+        """
+        タイムスタンプを含む最初のシーンを取得する
+
+        Args:
+            timestamp: タイムスタンプ（秒）
+
+        Returns:
+            Scene: シーン（該当するシーンがない場合はNone）
+        """
+        # 1件の検索ではNumPy配列を作らずに二分探索する方が速い
+        position = int(np.searchsorted(self.start_times, timestamp, side="right")) - 1
+
+        if position >= 1 and self.end_times[position - 1] >= timestamp:
+            return self.scene(position - 1)
+        if position >= 0 and self.end_times[position] >= timestamp:
+            return self.scene(position)
+        return None
+
+    def scenes_at_times(self, timestamps):
+        """
+        複数のタイムスタンプについて、それぞれを含む最初のシーンを取得する
+
+        Args:
+            timestamps: タイムスタンプ（秒）のリスト
+
+        Returns:
+            list: シーンのリスト（該当するシーンがないタイムスタンプはNone）
+        """
+        return [
+            self.scene(position) if position >= 0 else None
+            for position in self.lookup(timestamps).tolist()
+        ]
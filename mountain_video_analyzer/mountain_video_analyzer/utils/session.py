@@ -34,17 +34,27 @@ class SessionState:
             取得した値またはデフォルト値
         """
         return self.state.get(key, default)
+    
+    def values(self):
+        """
+        状態のすべての値を取得
+        
+        Returns:
+            状態の値のビュー
+        """
+        return self.state.values()
 
 class Session:
     """
     セッションクラス
     """
-    def __init__(self, id=None):
+    def __init__(self, id=None, state=None):
         """
         Sessionの初期化
         
         Args:
             id: セッションID
+            state: セッション状態（get/setを持つオブジェクト、Noneの場合はSessionState）
         """
         self.id = id
-        self.state = SessionState() 
\ No newline at end of file
+        self.state = state if state is not None else SessionState()
\ No newline at end of file
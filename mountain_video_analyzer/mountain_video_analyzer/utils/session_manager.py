@@ -6,23 +6,80 @@ from .runner import Runner
 import uuid
 import time
 import logging
-from ..tools.scene_detection import detect_scenes
-from ..tools.transcription import transcribe_audio
-from ..tools.vision_analysis import analyze_frames
+import asyncio
+import tempfile
+import functools
+import threading
+from concurrent.futures import Future
+from ..config import CONFIG
+from ..tools.scene_detection import detect_scenes_async, iter_scenes_async, get_video_duration_async
+from ..tools.transcription import transcribe_scene_async
+from ..tools.vision_analysis import analyze_timestamp_async, create_vision_model
+from ..agents.main_agent import MountainVideoAnalyzerAgent
+from .graph_executor import GraphExecutor
+from .checkpoint import open_checkpoint
+from .scene_index import SceneIndex, build_id_index
+from .text_index import TextIndex
+from .vector_index import VectorIndex
+from .property_precompute import precompute_scene_properties
+from .library_index import ingest_result
+from .session_store import create_session_state
+from .state_subscription import StateSubscription, build_changes
+from ..models import Scene, SceneTable, TranscriptSegment, FrameAnalysis, to_builtin, estimate_size
+
+# ストリーミング処理でクライアントに送る状態のキーと、イベントの種類の対応
+STREAMING_EVENTS = {
+    "scenes": "scene_detected",
+    "transcriptions": "transcript_ready",
+    "frame_analyses": "vision_ready",
+    "descriptions": "description_ready",
+    "editing_suggestions": "editing_suggestion_ready",
+    "progress": "progress"
+}
+
+# 全文検索・セマンティック検索の対象とする状態のキーと、(文書の種類, テキストのキー)の対応
+TEXT_INDEX_FIELDS = {
+    "descriptions": ("description", "text"),
+    "transcriptions": ("transcript", "text"),
+    "frame_analyses": ("frame_analysis", "analysis")
+}
 
 class SessionManager:
     """
     セッション状態を管理するクラス
     """
-    def __init__(self, session_id=None):
+    def __init__(self, session_id=None, state=None):
         """
         SessionManagerの初期化
         
         Args:
             session_id: セッションID（Noneの場合は自動生成）
+            state: セッション状態の保存先（Noneの場合はCONFIG["session"]["backend"]に従って作成）
         """
         self.session_id = session_id or str(uuid.uuid4())
-        self.session = Session(id=self.session_id)
+        if state is None:
+            state = create_session_state(self.session_id)
+        self.session = Session(id=self.session_id, state=state)
+        self._scene_index = None
+        self._scene_index_key = None
+        self._text_index = None
+        self._text_index_sources = {}
+        self._vector_index = None
+        self._vector_index_sources = {}
+        # セマンティック検索のエンコーダー（Noneの場合はHashingEncoder、インデックス作成前に設定する）
+        self.encoder = None
+        self._frame_analysis_index = None
+        self._frame_analysis_index_key = None
+        self._description_index = None
+        self._description_index_key = None
+        self._text_index_lock = threading.RLock()
+        # "lazy"モードで分析した場合のシーン単位のオンデマンド分析
+        self.lazy_analyzer = None
+        # オンデマンド分析のスレッドなど、ほかのスレッドから結果を追加する間に保持するロック
+        self._state_lock = threading.RLock()
+        self._subscriptions = []
+        self._published = {}
+        self._subscription_lock = threading.RLock()
     
     def set_state(self, key, value):
         """
@@ -33,6 +90,251 @@ class SessionManager:
             value: 状態の値
         """
         self.session.state.set(key, value)
+        
+        self._publish(key, value)
+        
+        if key == "scenes":
+            # シーンが置き換えられたらインデックスを破棄し、次の検索時に再構築する
+            self._scene_index = None
+        elif key in TEXT_INDEX_FIELDS:
+            with self._text_index_lock:
+                if self._text_index is not None:
+                    self._update_search_index(self._text_index, self._text_index_sources, key, value)
+                if self._vector_index is not None:
+                    self._update_search_index(self._vector_index, self._vector_index_sources, key, value)
+    
+    def append_state(self, items):
+        """
+        リストの状態に結果を追加する。ほかのスレッドから追加しても、複数のキーへの追加と
+        get_result()が混ざらないようにロックを保持して追加する
+        
+        Args:
+            items: 状態のキーをキー、追加する要素のリストを値とする辞書
+        """
+        with self._state_lock:
+            for key, values in items.items():
+                current = self.get_state(key, [])
+                current.extend(values)
+                self.set_state(key, current)
+    
+    def close(self):
+        """
+        オンデマンド分析を停止し、分析用のスレッドと一時ディレクトリを破棄する
+        """
+        lazy_analyzer, self.lazy_analyzer = self.lazy_analyzer, None
+        if lazy_analyzer is not None:
+            lazy_analyzer.close()
+    
+    def subscribe(self, *patterns):
+        """
+        状態の変更を購読する
+        
+        パターンはキー（"video_path"）か、リストの要素のパス（"descriptions/42"、"scenes/*"）です。
+        リストは要素ごとに通知され、同じリストに追加して設定し直した場合は追加された要素だけが通知されます。
+        
+        Args:
+            *patterns: 購読するキー・パスのパターン
+            
+        Returns:
+            StateSubscription: async forで変更のリストを受け取る購読（close()で終了）
+        """
+        subscription = StateSubscription(patterns, on_close=self._unsubscribe)
+        with self._subscription_lock:
+            self._subscriptions.append(subscription)
+        return subscription
+    
+    def _unsubscribe(self, subscription):
+        """
+        購読を削除する
+        """
+        with self._subscription_lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+    
+    def _publish(self, key, value):
+        """
+        状態の変更を購読に通知する
+        
+        リストとSceneTableは、前回設定されたものと同じオブジェクトであれば追加分だけを、
+        別のオブジェクトに置き換えられた場合はキーのリセットとすべての要素を通知します。
+        購読がない間も設定されたリストと件数を記録し、後から購読を始めた場合も差分だけを通知します。
+        
+        Args:
+            key: 状態のキー
+            value: 状態の値
+        """
+        with self._subscription_lock:
+            if isinstance(value, (list, SceneTable)):
+                source, published_count = self._published.get(key, (None, 0))
+                self._published[key] = (value, len(value))
+                if not self._subscriptions:
+                    return
+                
+                reset = value is not source or len(value) < published_count
+                start = 0 if reset else published_count
+                changes = build_changes(key, [(position, value[position]) for position in range(start, len(value))], reset)
+            else:
+                if not self._subscriptions:
+                    return
+                changes = [{"key": key, "path": key, "op": "set", "value": value}]
+            
+            if changes:
+                for subscription in list(self._subscriptions):
+                    subscription.push(changes)
+    
+    def get_scene_index(self):
+        """
+        セッションのシーンの区間インデックスを取得
+        
+        シーンが変更されるまでは同じインデックスを再利用します。SceneTableに直接追加された場合も
+        バージョン番号の変化を検出して再構築します。
+        
+        Returns:
+            SceneIndex: シーンの区間インデックス
+        """
+        scenes = self.get_state("scenes", [])
+        key = (id(scenes), len(scenes), getattr(scenes, "version", None))
+        
+        if self._scene_index is None or self._scene_index_key != key:
+            self._scene_index = SceneIndex(scenes)
+            self._scene_index_key = key
+        
+        return self._scene_index
+    
+    def get_frame_analyses_for_scene(self, scene_id):
+        """
+        シーンの区間に含まれるフレーム分析結果を取得
+        
+        シーンIDからフレーム分析結果への対応表は、フレーム分析結果かシーンが変更されるまで再利用します。
+        
+        Args:
+            scene_id: シーンID
+            
+        Returns:
+            list: フレーム分析結果のリスト（タイムスタンプがシーンの境界にある結果は前後両方のシーンに含まれる）
+        """
+        frame_analyses = self.get_state("frame_analyses", [])
+        scene_index = self.get_scene_index()
+        key = (id(frame_analyses), len(frame_analyses), id(scene_index))
+        
+        if self._frame_analysis_index is None or self._frame_analysis_index_key != key:
+            analyses_by_scene = {}
+            scene_ids_by_analysis = scene_index.scene_ids_at_times(
+                [analysis["timestamp"] for analysis in frame_analyses]
+            )
+            for analysis, scene_ids in zip(frame_analyses, scene_ids_by_analysis):
+                for analysis_scene_id in scene_ids:
+                    analyses_by_scene.setdefault(analysis_scene_id, []).append(analysis)
+            
+            self._frame_analysis_index = analyses_by_scene
+            self._frame_analysis_index_key = key
+        
+        return self._frame_analysis_index.get(scene_id, [])
+    
+    def get_description(self, scene_id):
+        """
+        シーンIDから説明文を取得
+        
+        シーンIDから説明文への対応表は、説明文が変更されるまで再利用します。
+        
+        Args:
+            scene_id: シーンID
+            
+        Returns:
+            dict: 説明文（存在しない場合はNone）
+        """
+        descriptions = self.get_state("descriptions", [])
+        key = (id(descriptions), len(descriptions))
+        
+        if self._description_index is None or self._description_index_key != key:
+            self._description_index = build_id_index(descriptions)
+            self._description_index_key = key
+        
+        return self._description_index.get(scene_id)
+    
+    def get_text_index(self):
+        """
+        説明文・書き起こし・フレーム分析の全文検索インデックスを取得
+        
+        インデックスは最初の呼び出し時に作成し、以降は状態が設定されるたびに
+        追加された結果だけを反映します。
+        
+        Returns:
+            TextIndex: 全文検索インデックス（文書のキーは (文書の種類, シーンID, 項目のキー)）
+        """
+        with self._text_index_lock:
+            if self._text_index is None:
+                self._text_index = TextIndex()
+                for key in TEXT_INDEX_FIELDS:
+                    self._update_search_index(
+                        self._text_index, self._text_index_sources, key, self.get_state(key, [])
+                    )
+            return self._text_index
+    
+    def get_vector_index(self):
+        """
+        説明文・書き起こし・フレーム分析のベクトルインデックスを取得
+        
+        全文検索インデックスと同じく、最初の呼び出し時に作成し、以降は追加された結果だけを反映します。
+        
+        Returns:
+            VectorIndex: ベクトルインデックス（文書のキーは (文書の種類, シーンID, 項目のキー)）
+        """
+        with self._text_index_lock:
+            if self._vector_index is None:
+                self._vector_index = VectorIndex(self.encoder)
+                for key in TEXT_INDEX_FIELDS:
+                    self._update_search_index(
+                        self._vector_index, self._vector_index_sources, key, self.get_state(key, [])
+                    )
+            return self._vector_index
+    
+    def _update_search_index(self, index, sources, key, items):
+        """
+        状態の変更を検索インデックスに反映する
+        
+        同じリストに結果が追加された場合は追加分だけを、別のリストに置き換えられた場合は
+        差分を反映します。
+        
+        Args:
+            index: 検索インデックス（TextIndexまたはVectorIndex）
+            sources: インデックスに反映済みのリストと件数を記録する辞書
+            key: 状態のキー
+            items: 状態の値（結果のリスト）
+        """
+        field, text_key = TEXT_INDEX_FIELDS[key]
+        source, indexed_count, doc_keys = sources.get(key, (None, 0, set()))
+        
+        replaced = items is not source or len(items) < indexed_count
+        if replaced:
+            new_items = items
+            stale_keys = doc_keys
+            doc_keys = set()
+        else:
+            new_items = items[indexed_count:]
+        
+        documents = []
+        for item in new_items:
+            if "scene_id" in item:
+                scene_id = item_key = item["scene_id"]
+            else:
+                # フレーム分析はタイムスタンプを含むシーンに対応付ける
+                scene = self.get_scene_index().scene_at(item["timestamp"])
+                if scene is None:
+                    continue
+                scene_id, item_key = scene["scene_id"], item["timestamp"]
+            
+            doc_key = (field, scene_id, item_key)
+            documents.append((doc_key, item[text_key] or ""))
+            doc_keys.add(doc_key)
+        
+        index.add_many(documents)
+        
+        if replaced:
+            for doc_key in stale_keys - doc_keys:
+                index.remove(doc_key)
+        
+        sources[key] = (items, len(items), doc_keys)
     
     def get_state(self, key, default=None):
         """
@@ -55,20 +357,52 @@ class SessionManager:
             Sessionオブジェクト
         """
         return self.session
+    
+    def get_result(self):
+        """
+        分析結果を取得（レコードはJSONに変換できる辞書に戻す）
+        
+        Returns:
+            dict: シーン・説明文・編集提案
+        """
+        with self._state_lock:
+            return to_builtin({
+                "scenes": self.get_state("scenes", []),
+                "descriptions": self.get_state("descriptions", []),
+                "editing_suggestions": self.get_state("editing_suggestions", [])
+            })
+    
+    def estimate_size(self):
+        """
+        セッション状態と検索インデックスのおおよそのメモリ使用量を求める
+        
+        Returns:
+            int: バイト数
+        """
+        return estimate_size([
+            list(self.session.state.values()),
+            self._scene_index,
+            self._frame_analysis_index,
+            self._text_index,
+            self._vector_index
+        ])
 
-async def process_video(main_agent, video_path):
+async def process_video(main_agent, video_path, progress_callback=None, session_manager=None):
     """
     動画を処理し、シーン説明と編集提案を生成する
     
     Args:
         main_agent: メインエージェント
         video_path: 動画ファイルのパス
+        progress_callback: 進捗（0.0〜1.0）とメッセージを受け取る関数
+        session_manager: 結果を保存するセッションマネージャー（Noneの場合は新しく作成）
         
     Returns:
         dict: 処理結果
     """
-    # セッションを初期化
-    session_manager = SessionManager()
+    # セッションを初期化（渡されたセッションのオンデマンド分析は、呼び出し元がclose()で停止する）
+    owns_session = session_manager is None
+    session_manager = session_manager or SessionManager()
     
     # 初期状態を設定
     session_manager.set_state("video_path", video_path)
@@ -84,151 +418,830 @@ async def process_video(main_agent, video_path):
             print(f"{event.author}: {event.content}")
     
     # 実際の分析を実行
-    await analyze_video(session_manager, video_path)
+    await analyze_video(session_manager, video_path, main_agent.get_agent(), progress_callback=progress_callback)
     
     # 結果を取得
-    result = {
-        "scenes": session_manager.get_state("scenes", []),
-        "descriptions": session_manager.get_state("descriptions", []),
-        "editing_suggestions": session_manager.get_state("editing_suggestions", [])
-    }
+    result = session_manager.get_result()
+    
+    # 呼び出し元がセッションを使わないため、"lazy"モードの分析用のスレッドを残さない
+    if owns_session:
+        await asyncio.to_thread(session_manager.close)
+    
+    # 設定で有効な場合は、動画を横断して検索できるようライブラリに保存する
+    await asyncio.to_thread(ingest_result, video_path, result)
     
     return result
 
-async def process_video_streaming(main_agent, video_path, callback):
+async def process_video_streaming(main_agent, video_path, callback, session_manager=None):
     """
     動画をストリーミング処理し、結果をリアルタイムでコールバック関数に渡す
     
+    シーン単位のパイプラインで分析し、シーンの検出・書き起こし・画像分析・説明文・編集提案が
+    完了するたびに、そのシーンの結果をイベント（scene_detectedなど）として、進捗をprogressとして渡します。
+    分析の完了時にcompleteを渡します。コールバックの処理中に更新された進捗は最新のものだけを渡します。
+    
     Args:
         main_agent: メインエージェント
         video_path: 動画ファイルのパス
         callback: コールバック関数
+        session_manager: 結果を保存するセッションマネージャー（Noneの場合は新しく作成）
     """
     # ストリーミングセッションを設定
-    session_manager = SessionManager()
+    session_manager = session_manager or SessionManager()
     session_manager.set_state("video_path", video_path)
     
-    # エージェントを実行
-    runner = Runner()
-    async for event in runner.run_agent(
-        agent=main_agent.get_agent(),
-        session=session_manager.get_session(),
-        message=f"動画 {video_path} をストリーミング分析します",
-        stream=True  # ストリーミングモードを有効化
-    ):
-        # 部分的な結果をコールバックに渡す
-        if event.content:
-            await callback({
-                "type": event.type,
-                "author": event.author,
-                "content": event.content,
-                "timestamp": time.time()
-            })
+    def report_progress(progress, message):
+        # 進捗も状態として設定し、購読を通じて最新の値だけを送る
+        session_manager.set_state("progress", {"progress": progress, "message": message})
     
-    # 実際の分析を実行
-    await analyze_video(session_manager, video_path)
+    # シーンが確定するたびに分析を始めるパイプラインモードで実行し、最初のシーンの結果をすぐに返す
+    await forward_streaming_events(session_manager, analyze_video(
+        session_manager, video_path, main_agent.get_agent(), mode="pipelined", progress_callback=report_progress
+    ), callback)
+
+async def forward_streaming_events(session_manager, analysis, callback):
+    """
+    分析を実行しながらセッション状態の変更をイベントに変換してコールバック関数に渡し、
+    分析の完了時にcompleteを渡します。
+    
+    Args:
+        session_manager: 結果を保存するセッションマネージャー
+        analysis: 分析を実行するコルーチン（結果をsession_managerに設定する）
+        callback: コールバック関数
+    """
+    subscription = session_manager.subscribe(
+        *(key if key == "progress" else f"{key}/*" for key in STREAMING_EVENTS)
+    )
+    analysis = asyncio.ensure_future(analysis)
+    analysis.add_done_callback(lambda _: subscription.close())
     
-    # 最終結果をコールバックに渡す
+    try:
+        async for changes in subscription:
+            for change in changes:
+                event = build_streaming_event(session_manager, change)
+                if event is not None:
+                    await callback(event)
+        await analysis
+    finally:
+        subscription.close()
+        if not analysis.done():
+            # 停止・切断時は分析を中断し、子プロセスの終了と実行枠の返却を待ってから戻る
+            analysis.cancel()
+            await asyncio.gather(analysis, return_exceptions=True)
+    
+    # 結果全体は送らず、完了とセッションIDだけを渡す（結果は/sessions/{session_id}で取得できる）
     await callback({
-        "type": "result",
-        "content": {
-            "scenes": session_manager.get_state("scenes", []),
-            "descriptions": session_manager.get_state("descriptions", []),
-            "editing_suggestions": session_manager.get_state("editing_suggestions", [])
-        },
+        "type": "complete",
+        "session_id": session_manager.session_id,
+        "scene_count": len(session_manager.get_state("scenes", [])),
+        "percent": 100.0,
         "timestamp": time.time()
     })
 
-async def analyze_video(session_manager, video_path):
+def build_streaming_event(session_manager, change):
+    """
+    状態の変更をストリーミングのイベントに変換します。
+    
+    Args:
+        session_manager: セッションマネージャー
+        change: 状態の変更（StateSubscriptionが返す辞書）
+        
+    Returns:
+        dict: イベント（リストのリセットなど、送る必要のない変更の場合はNone）
+    """
+    if change["op"] != "set":
+        return None
+    
+    value = to_builtin(change["value"])
+    event = {"type": STREAMING_EVENTS[change["key"]], "timestamp": time.time()}
+    
+    if change["key"] == "progress":
+        event.update(value)
+        event["percent"] = round(value["progress"] * 100, 1)
+        return event
+    
+    scene_id = value.get("scene_id")
+    if scene_id is None and "timestamp" in value:
+        # フレーム分析はタイムスタンプを含むシーンに対応付ける
+        scene = session_manager.get_scene_index().scene_at(value["timestamp"])
+        scene_id = scene["scene_id"] if scene is not None else None
+    
+    event["scene_id"] = scene_id
+    event["data"] = value
+    return event
+
+async def analyze_video(session_manager, video_path, agent=None, mode=None, progress_callback=None):
     """
     動画を分析し、結果をセッションに保存します。
     
+    "graph"モードではエージェントツリーの構造に従い、ParallelAgent配下のステージを並行に実行します。
+    "pipelined"モードではシーンが確定するたびに、そのシーンの音声認識と画像分析を開始します。
+    "lazy"モードではシーン検出のみを実行し、音声認識と画像分析は対話型プロパティ照会で
+    質問されたシーンについてのみ実行します（session_manager.lazy_analyzerを参照）。
+    チェックポイントが有効な場合、シーン検出結果とシーン単位の音声認識・画像分析結果を
+    完了するたびに保存し、同じ動画と設定での再実行時には保存済みの単位をスキップします。
+    事前計算が有効な場合、分析後に全シーンの感情的なトーンと天候状況をまとめて計算します。
+    
     Args:
         session_manager: セッションマネージャー
         video_path: 動画ファイルのパス
+        agent: 実行するエージェントツリー（Noneの場合はMountainVideoAnalyzerAgentを使用）
+        mode: 分析モード（Noneの場合はCONFIGから取得）
+        progress_callback: 進捗（0.0〜1.0）とメッセージを受け取る関数
     """
+    mode = mode or CONFIG["pipeline"]["mode"]
+    
     try:
-        logging.info(f"動画 {video_path} の分析を開始します")
+        logging.info(f"動画 {video_path} の分析を開始します（モード: {mode}）")
         
-        # 1. シーン検出
-        scene_result = detect_scenes(video_path)
-        if "error" in scene_result:
-            logging.error(f"シーン検出エラー: {scene_result['error']}")
-            scenes = generate_fallback_scenes()
+        # チェックポイントの識別にはファイルの一部を読むためスレッドで実行
+        checkpoint = await asyncio.to_thread(open_checkpoint, video_path)
+        
+        if mode == "pipelined":
+            await run_pipelined_analysis(session_manager, video_path, progress_callback, checkpoint)
+        elif mode == "lazy":
+            await run_scene_detection_stage(session_manager, video_path, checkpoint)
+            session_manager.set_state("transcriptions", [])
+            session_manager.set_state("frame_analyses", [])
+            session_manager.set_state("descriptions", [])
+            # 編集提案はシーンの位置から決まるため、シーン検出の直後にすべてのシーンの分を生成する
+            session_manager.set_state("editing_suggestions", generate_editing_suggestions(
+                session_manager.get_state("scenes", []), []
+            ))
+            session_manager.lazy_analyzer = LazySceneAnalyzer(session_manager, video_path, checkpoint)
+            
+            if progress_callback:
+                progress_callback(1.0, "シーン検出が完了しました（各シーンは質問時に分析されます）")
         else:
-            scenes = scene_result.get("scenes", [])
+            if agent is None:
+                agent = MountainVideoAnalyzerAgent().get_agent()
+            
+            executor = GraphExecutor(
+                build_stage_handlers(checkpoint), STAGE_DEPENDENCIES,
+                progress_callback=progress_callback, agent=agent
+            )
+            await executor.run(agent, session_manager, video_path)
         
+        logging.info(f"動画 {video_path} の分析が完了しました")
+        
+        # すべてのシーンを分析し終えたチェックポイントは不要になるため削除する
+        # （"lazy"モードでは未分析のシーンがあり、失敗したシーンがある場合は再実行で続きから分析する）
+        if checkpoint is not None and mode != "lazy" and is_analysis_complete(session_manager):
+            await asyncio.to_thread(checkpoint.clear)
+    
+    except Exception as e:
+        logging.error(f"動画分析中にエラーが発生しました: {e}")
+        session_manager.set_state("analysis_error", str(e))
+        # エラー時はフォールバックデータを使用
+        fallback_data = generate_fallback_data()
+        session_manager.set_state("scenes", fallback_data["scenes"])
+        session_manager.set_state("descriptions", fallback_data["descriptions"])
+        session_manager.set_state("editing_suggestions", fallback_data["editing_suggestions"])
+        return
+    
+    if CONFIG["precompute"]["enabled"]:
+        try:
+            await precompute_scene_properties(session_manager)
+        except Exception as e:
+            # 事前計算できなかったプロパティはツールの呼び出し時に個別に計算される
+            logging.error(f"プロパティの事前計算中にエラーが発生しました: {e}")
+
+def get_analysis_error(session_manager):
+    """
+    分析が失敗した、または代替の結果を含む場合にその理由を取得します。
+    
+    analyze_videoは失敗してもフォールバックデータで結果を返すため、結果を保存する前に
+    （バッチ処理など）このエラーを確認します。
+    
+    Args:
+        session_manager: analyze_videoを実行したセッションマネージャー
+        
+    Returns:
+        str: エラーメッセージ（すべてのシーンを分析できた場合はNone）
+    """
+    error = session_manager.get_state("analysis_error")
+    if error:
+        return error
+    
+    if not is_analysis_complete(session_manager):
+        scenes = session_manager.get_state("scenes", [])
+        analyzed = sum(
+            1 for analysis in session_manager.get_state("frame_analyses", [])
+            if not getattr(analysis, "fallback", False)
+        )
+        return f"一部のシーンを分析できませんでした（フレーム分析 {analyzed}/{len(scenes)}）"
+    
+    return None
+
+def is_analysis_complete(session_manager):
+    """
+    すべてのシーンの音声認識と画像分析が完了しているかどうかを判定します。
+    
+    Args:
+        session_manager: セッションマネージャー
+        
+    Returns:
+        bool: すべてのシーンに書き起こしと代替でないフレーム分析結果がある場合True
+    """
+    scenes = session_manager.get_state("scenes", [])
+    transcriptions = session_manager.get_state("transcriptions", [])
+    frame_analyses = session_manager.get_state("frame_analyses", [])
+    
+    return (
+        len(transcriptions) == len(scenes) and len(frame_analyses) == len(scenes)
+        and not any(getattr(analysis, "fallback", False) for analysis in frame_analyses)
+    )
+
+async def run_pipelined_analysis(session_manager, video_path, progress_callback=None, checkpoint=None):
+    """
+    シーン単位のパイプライン分析を実行します。
+    
+    シーン検出が境界を出力するたびに、そのシーンを上限付きキューに投入します。
+    ワーカーはキューからシーンを取り出し、音声認識と画像分析を並行して実行した後、
+    説明文を生成してセッションに追加します。キューが満杯の間はシーン検出側が待機します。
+    
+    Args:
+        session_manager: セッションマネージャー
+        video_path: 動画ファイルのパス
+        progress_callback: 進捗（0.0〜1.0）とメッセージを受け取る関数
+        checkpoint: 途中結果を保存・再利用するCheckpointStore（Noneの場合は保存しない）
+    """
+    pipeline_config = CONFIG["pipeline"]
+    queue = asyncio.Queue(maxsize=pipeline_config["queue_size"])
+    worker_count = pipeline_config["workers"]
+    
+    scenes = SceneTable()
+    transcriptions = []
+    frame_analyses = []
+    descriptions = []
+    
+    session_manager.set_state("scenes", scenes)
+    session_manager.set_state("transcriptions", transcriptions)
+    session_manager.set_state("frame_analyses", frame_analyses)
+    session_manager.set_state("descriptions", descriptions)
+    
+    # 進捗は分析済みのシーンの長さの合計を動画の長さで割って求める
+    # （同じ取得結果をシーン検出の最後のシーンにも使い、FFprobeを1回だけ実行する）
+    duration_task = asyncio.ensure_future(get_video_duration_async(video_path))
+    analyzed_duration = 0.0
+    
+    def get_progress():
+        if duration_task.done() and not duration_task.cancelled() and duration_task.exception() is None:
+            video_duration = duration_task.result()
+            if video_duration > 0:
+                return min(analyzed_duration / video_duration, 1.0)
+        # 動画の長さが分からない場合は、検出済みのシーンに対する割合を報告する
+        return len(descriptions) / len(scenes)
+    
+    async def enqueue(scene):
+        scenes.append(scene)
         session_manager.set_state("scenes", scenes)
+        await queue.put(scene)
+    
+    async def produce():
+        saved_scenes = await asyncio.to_thread(checkpoint.load, "scenes") if checkpoint is not None else None
+        
+        if saved_scenes:
+            logging.info(f"チェックポイントから {len(saved_scenes)} 個のシーンを再利用します")
+            for scene in saved_scenes:
+                await enqueue(Scene.from_dict(scene))
+        else:
+            async for scene in iter_scenes_async(
+                video_path, CONFIG["scene_detection"]["min_scene_length"], video_duration=duration_task
+            ):
+                await enqueue(scene)
+            
+            if scenes and checkpoint is not None:
+                await asyncio.to_thread(checkpoint.save, "scenes", scenes)
         
         if not scenes:
             logging.warning("シーンが検出されませんでした")
-            scenes = generate_fallback_scenes()
-            session_manager.set_state("scenes", scenes)
+            session_manager.set_state("analysis_error", "シーンを検出できませんでした")
+            for scene in generate_fallback_scenes():
+                await enqueue(scene)
         
-        # 2. 各シーンの中間点のタイムスタンプを取得
-        scene_timestamps = [
-            (scene["start_time"] + scene["end_time"]) / 2
-            for scene in scenes
-        ]
+        # ワーカーに終了を通知
+        for _ in range(worker_count):
+            await queue.put(None)
+    
+    async def consume(model, temp_dir):
+        nonlocal analyzed_duration
         
-        # 3. 音声認識
-        transcription_result = transcribe_audio(video_path, scenes)
-        scene_transcriptions = transcription_result.get("scene_transcriptions", [])
-        session_manager.set_state("transcriptions", scene_transcriptions)
+        while True:
+            scene = await queue.get()
+            if scene is None:
+                break
+            
+            transcript, analysis = await analyze_scene_async(model, video_path, scene, temp_dir, checkpoint)
+            
+            if transcript is not None:
+                transcriptions.append(transcript)
+                session_manager.set_state("transcriptions", transcriptions)
+            if analysis is not None:
+                frame_analyses.append(analysis)
+                session_manager.set_state("frame_analyses", frame_analyses)
+            
+            descriptions.extend(generate_descriptions(
+                [scene],
+                [transcript] if transcript is not None else [],
+                [analysis] if analysis is not None else []
+            ))
+            session_manager.set_state("descriptions", descriptions)
+            
+            analyzed_duration += scene["end_time"] - scene["start_time"]
+            if progress_callback:
+                progress_callback(get_progress(), f"シーン {scene['scene_id']} の分析が完了しました")
+    
+    model = create_vision_model()
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        tasks = [asyncio.create_task(produce())]
+        tasks.extend(
+            asyncio.create_task(consume(model, temp_dir))
+            for _ in range(worker_count)
+        )
         
-        # 4. フレーム分析
-        vision_result = analyze_frames(video_path, scene_timestamps)
-        frame_analyses = vision_result.get("frame_analyses", [])
-        session_manager.set_state("frame_analyses", frame_analyses)
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            duration_task.cancel()
+            await asyncio.gather(duration_task, return_exceptions=True)
+    
+    # ワーカーの完了順ではなくシーン順に並べ替える
+    transcriptions.sort(key=lambda item: item["scene_id"])
+    frame_analyses.sort(key=lambda item: item["timestamp"])
+    descriptions.sort(key=lambda item: item["scene_id"])
+    
+    session_manager.set_state("transcriptions", transcriptions)
+    session_manager.set_state("frame_analyses", frame_analyses)
+    session_manager.set_state("descriptions", descriptions)
+    session_manager.set_state("editing_suggestions", generate_editing_suggestions(scenes, descriptions))
+
+class LazySceneAnalyzer:
+    """
+    シーン単位のオンデマンド分析
+    
+    質問されたシーンの音声認識・画像分析・説明文生成を実行し、結果をセッションに追加します。
+    各シーンの分析は1回だけ実行され、同じシーンへの同時の要求は同じ分析の完了を待ちます。
+    要求されたシーンの前後のシーンはバックグラウンドで先読みします。
+    同期的に呼び出されるツールからも使えるよう、分析は専用スレッドのイベントループで実行します。
+    """
+    def __init__(self, session_manager, video_path, checkpoint=None, prefetch=None, prefetch_workers=None):
+        """
+        LazySceneAnalyzerの初期化
         
-        # 5. シーン説明文を生成
-        descriptions = generate_descriptions(scenes, scene_transcriptions, frame_analyses)
-        session_manager.set_state("descriptions", descriptions)
+        Args:
+            session_manager: セッションマネージャー（"scenes"が設定済みであること）
+            video_path: 動画ファイルのパス
+            checkpoint: 途中結果を保存・再利用するCheckpointStore
+            prefetch: 先読みする前後のシーン数（Noneの場合はCONFIGから取得）
+            prefetch_workers: 同時に実行する先読みの数（Noneの場合はCONFIGから取得）
+        """
+        lazy_config = CONFIG["lazy"]
+        self.session_manager = session_manager
+        self.video_path = video_path
+        self.checkpoint = checkpoint
+        self.prefetch = lazy_config["prefetch"] if prefetch is None else prefetch
+        self.prefetch_workers = prefetch_workers or lazy_config["prefetch_workers"]
         
-        # 6. 編集提案を生成
-        editing_suggestions = generate_editing_suggestions(scenes, descriptions)
-        session_manager.set_state("editing_suggestions", editing_suggestions)
+        self.model = create_vision_model()
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._prefetch_semaphore = None
+    
+    def is_analyzed(self, scene_id):
+        """
+        シーンの分析が完了しているかどうか
         
-        logging.info(f"動画 {video_path} の分析が完了しました")
+        Args:
+            scene_id: シーンID
+            
+        Returns:
+            bool: 完了している場合True
+        """
+        future = self._futures.get(scene_id)
+        return future is not None and future.done()
+    
+    def ensure_scenes(self, scene_ids, timeout=None):
+        """
+        シーンの分析が完了するまで待機する（同期版）
+        
+        Args:
+            scene_ids: シーンIDのリスト
+            timeout: 待機する最大時間（秒）
+        """
+        for future in self._request(scene_ids):
+            future.result(timeout)
+    
+    async def ensure_scenes_async(self, scene_ids):
+        """
+        シーンの分析が完了するまで待機する（非同期版、任意のイベントループから呼び出せる）
+        
+        Args:
+            scene_ids: シーンIDのリスト
+        """
+        await asyncio.gather(*(asyncio.wrap_future(future) for future in self._request(scene_ids)))
+    
+    def close(self):
+        """
+        実行中の分析を中止し、イベントループと一時ディレクトリを破棄する
+        """
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        
+        if loop is not None:
+            async def cancel_all():
+                tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            
+            asyncio.run_coroutine_threadsafe(cancel_all(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        
+        self._temp_dir.cleanup()
+    
+    def _request(self, scene_ids):
+        """
+        シーンの分析を要求し、前後のシーンの先読みを開始する
+        
+        Args:
+            scene_ids: シーンIDのリスト
+            
+        Returns:
+            list: 要求したシーンの分析のFutureのリスト
+        """
+        scenes = SceneTable.from_records(self.session_manager.get_state("scenes", []))
+        futures = []
+        
+        for scene_id in scene_ids:
+            position = scenes.index_of(scene_id)
+            if position < 0:
+                continue
+            futures.append(self._submit(scenes[position], prefetch=False))
+            
+            for offset in range(1, self.prefetch + 1):
+                for neighbor in (position - offset, position + offset):
+                    if 0 <= neighbor < len(scenes):
+                        self._submit(scenes[neighbor], prefetch=True)
+        
+        return futures
+    
+    def _submit(self, scene, prefetch):
+        """
+        シーンの分析を開始する（開始済みの場合は既存のFutureを返す）
+        
+        Args:
+            scene: シーン
+            prefetch: 先読みの場合True（先読みの同時実行数はprefetch_workersに制限される）
+            
+        Returns:
+            concurrent.futures.Future: 分析のFuture
+        """
+        with self._lock:
+            future = self._futures.get(scene["scene_id"])
+            if future is not None:
+                return future
+            
+            future = self._futures[scene["scene_id"]] = Future()
+            loop = self._get_loop()
+        
+        loop.call_soon_threadsafe(self._start, scene, prefetch, future)
+        return future
+    
+    def _get_loop(self):
+        """
+        分析用のイベントループを取得する（初回はスレッドを起動する）
+        
+        Returns:
+            asyncio.AbstractEventLoop: イベントループ
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="lazy-scene-analyzer", daemon=True)
+            self._thread.start()
+        return self._loop
+    
+    def _start(self, scene, prefetch, future):
+        """
+        イベントループ上で分析タスクを作成し、結果をFutureに伝える
+        """
+        if self._prefetch_semaphore is None:
+            self._prefetch_semaphore = asyncio.Semaphore(self.prefetch_workers)
+        
+        task = asyncio.ensure_future(self._analyze(scene, prefetch))
+        
+        def done(task):
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+        
+        task.add_done_callback(done)
+    
+    async def _analyze(self, scene, prefetch):
+        """
+        1つのシーンを分析し、結果をセッションに追加する
+        
+        Args:
+            scene: シーン
+            prefetch: 先読みの場合True
+        """
+        if prefetch:
+            async with self._prefetch_semaphore:
+                transcript, analysis = await analyze_scene_async(
+                    self.model, self.video_path, scene, self._temp_dir.name, self.checkpoint
+                )
+        else:
+            transcript, analysis = await analyze_scene_async(
+                self.model, self.video_path, scene, self._temp_dir.name, self.checkpoint
+            )
+        
+        # 分析用のスレッドから追加するため、呼び出し元のスレッドが結果を取得する間は待つ
+        self.session_manager.append_state({
+            "transcriptions": [transcript] if transcript is not None else [],
+            "frame_analyses": [analysis] if analysis is not None else [],
+            "descriptions": generate_descriptions(
+                [scene],
+                [transcript] if transcript is not None else [],
+                [analysis] if analysis is not None else []
+            )
+        })
+        
+        logging.info(f"シーン {scene['scene_id']} をオンデマンドで分析しました{'（先読み）' if prefetch else ''}")
+
+async def analyze_scene_async(model, video_path, scene, temp_dir, checkpoint=None):
+    """
+    1つのシーンの音声認識と画像分析を並行して実行します。
+    
+    Args:
+        model: フレーム分析用のGeminiモデル
+        video_path: 動画ファイルのパス
+        scene: シーン情報
+        temp_dir: フレーム画像を保存する一時ディレクトリ
+        checkpoint: 途中結果を保存・再利用するCheckpointStore
+        
+    Returns:
+        tuple: (書き起こし結果, フレーム分析結果)。失敗した場合はそれぞれNone
+    """
+    timestamp = (scene["start_time"] + scene["end_time"]) / 2
+    
+    transcript, analysis = await asyncio.gather(
+        run_checkpointed(
+            checkpoint, "transcriptions", scene["scene_id"],
+            functools.partial(transcribe_scene_async, video_path, scene), TranscriptSegment
+        ),
+        run_checkpointed(
+            checkpoint, "frame_analyses", scene["scene_id"],
+            functools.partial(analyze_timestamp_async, model, video_path, timestamp, temp_dir), FrameAnalysis
+        ),
+        return_exceptions=True
+    )
+    
+    if isinstance(transcript, Exception):
+        logging.error(f"シーン {scene['scene_id']} の音声認識中にエラーが発生しました: {transcript}")
+        transcript = None
+    if isinstance(analysis, Exception):
+        logging.error(f"シーン {scene['scene_id']} のフレーム分析中にエラーが発生しました: {analysis}")
+        analysis = None
+    
+    return transcript, analysis
+
+async def run_checkpointed(checkpoint, stage, unit_id, analyze, record_type=None):
+    """
+    チェックポイントに保存済みの結果があれば再利用し、なければ分析を実行して結果を保存します。
+    チェックポイントの読み込みと追記はファイルを操作するため、イベントループを待たせないようスレッドで実行します。
     
+    Args:
+        checkpoint: CheckpointStore（Noneの場合は常に分析を実行）
+        stage: ステージ名
+        unit_id: 単位ID（シーンID）
+        analyze: 分析を実行するコルーチン関数（引数なし）
+        record_type: 保存済みの結果を変換するレコードクラス（Noneの場合は辞書のまま返す）
+        
+    Returns:
+        分析結果
+    """
+    if checkpoint is not None:
+        result = await asyncio.to_thread(checkpoint.get_unit, stage, unit_id)
+        if result is not None:
+            return record_type.from_dict(result) if record_type else result
+    
+    result = await analyze()
+    
+    # 代替の結果（FallbackFrameAnalysisなど）は保存せず、再実行時に分析し直す
+    if checkpoint is not None and not getattr(result, "fallback", False):
+        await asyncio.to_thread(checkpoint.append_unit, stage, unit_id, result)
+    
+    return result
+
+async def run_scene_detection_stage(session_manager, video_path, checkpoint=None):
+    """
+    シーン検出ステージ - 検出したシーンをセッションに保存します。
+    
+    Args:
+        session_manager: セッションマネージャー
+        video_path: 動画ファイルのパス
+        checkpoint: 途中結果を保存・再利用するCheckpointStore
+    """
+    scenes = checkpoint.load("scenes") if checkpoint is not None else None
+    
+    if scenes:
+        logging.info(f"チェックポイントから {len(scenes)} 個のシーンを再利用します")
+        scenes = SceneTable.from_records(scenes)
+    else:
+        scene_result = await detect_scenes_async(video_path)
+        if "error" in scene_result:
+            logging.error(f"シーン検出エラー: {scene_result['error']}")
+            scenes = []
+        else:
+            scenes = scene_result.get("scenes", [])
+        
+        # フォールバックのシーンは保存せず、次回は検出をやり直す
+        if scenes and checkpoint is not None:
+            checkpoint.save("scenes", scenes)
+    
+    if not scenes:
+        logging.warning("シーンが検出されませんでした")
+        session_manager.set_state("analysis_error", "シーンを検出できませんでした")
+        scenes = generate_fallback_scenes()
+    
+    session_manager.set_state("scenes", scenes)
+
+async def run_transcription_stage(session_manager, video_path, checkpoint=None):
+    """
+    音声認識ステージ - シーンごとの書き起こしをセッションに保存します。
+    
+    Args:
+        session_manager: セッションマネージャー
+        video_path: 動画ファイルのパス
+        checkpoint: 途中結果を保存・再利用するCheckpointStore
+    """
+    scenes = session_manager.get_state("scenes", [])
+    scene_transcriptions = []
+    
+    try:
+        for scene in scenes:
+            scene_transcriptions.append(await run_checkpointed(
+                checkpoint, "transcriptions", scene["scene_id"],
+                functools.partial(transcribe_scene_async, video_path, scene), TranscriptSegment
+            ))
     except Exception as e:
-        logging.error(f"動画分析中にエラーが発生しました: {e}")
-        # エラー時はフォールバックデータを使用
-        fallback_data = generate_fallback_data()
-        session_manager.set_state("scenes", fallback_data["scenes"])
-        session_manager.set_state("descriptions", fallback_data["descriptions"])
-        session_manager.set_state("editing_suggestions", fallback_data["editing_suggestions"])
+        # 完了済みのシーンはチェックポイントに残っているため、再実行時はその続きから処理する
+        logging.error(f"音声認識中にエラーが発生しました: {e}")
+    
+    session_manager.set_state("transcriptions", scene_transcriptions)
 
-def generate_descriptions(scenes, transcriptions, frame_analyses):
+async def run_vision_analysis_stage(session_manager, video_path, checkpoint=None):
+    """
+    フレーム分析ステージ - 各シーンの中間点のフレーム分析をセッションに保存します。
+    
+    Args:
+        session_manager: セッションマネージャー
+        video_path: 動画ファイルのパス
+        checkpoint: 途中結果を保存・再利用するCheckpointStore
+    """
+    scenes = session_manager.get_state("scenes", [])
+    frame_analyses = []
+    
+    try:
+        model = create_vision_model()
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for scene in scenes:
+                timestamp = (scene["start_time"] + scene["end_time"]) / 2
+                frame_analyses.append(await run_checkpointed(
+                    checkpoint, "frame_analyses", scene["scene_id"],
+                    functools.partial(analyze_timestamp_async, model, video_path, timestamp, temp_dir),
+                    FrameAnalysis
+                ))
+    except Exception as e:
+        logging.error(f"フレーム分析中にエラーが発生しました: {e}")
+    
+    session_manager.set_state("frame_analyses", frame_analyses)
+
+def run_description_stage(session_manager, video_path):
+    """
+    説明文生成ステージ - シーン説明文をセッションに保存します。
+    
+    Args:
+        session_manager: セッションマネージャー
+        video_path: 動画ファイルのパス
+    """
+    descriptions = generate_descriptions(
+        session_manager.get_state("scenes", []),
+        session_manager.get_state("transcriptions", []),
+        session_manager.get_state("frame_analyses", []),
+        session_manager.get_scene_index()
+    )
+    session_manager.set_state("descriptions", descriptions)
+
+def run_editing_suggestion_stage(session_manager, video_path):
+    """
+    編集提案ステージ - 編集提案をセッションに保存します。
+    
+    Args:
+        session_manager: セッションマネージャー
+        video_path: 動画ファイルのパス
+    """
+    editing_suggestions = generate_editing_suggestions(
+        session_manager.get_state("scenes", []),
+        session_manager.get_state("descriptions", [])
+    )
+    session_manager.set_state("editing_suggestions", editing_suggestions)
+
+# エージェント名とステージ処理の対応
+STAGE_HANDLERS = {
+    "scene_detector": run_scene_detection_stage,
+    "transcription_agent": run_transcription_stage,
+    "vision_analyst": run_vision_analysis_stage,
+    "description_generator": run_description_stage,
+    "editing_advisor": run_editing_suggestion_stage
+}
+
+def build_stage_handlers(checkpoint=None):
+    """
+    チェックポイントを渡したステージ処理の対応表を作成します。
+    
+    Args:
+        checkpoint: 途中結果を保存・再利用するCheckpointStore
+        
+    Returns:
+        dict: エージェント名をキー、ステージ処理を値とする辞書
+    """
+    if checkpoint is None:
+        return STAGE_HANDLERS
+    
+    return {
+        "scene_detector": functools.partial(run_scene_detection_stage, checkpoint=checkpoint),
+        "transcription_agent": functools.partial(run_transcription_stage, checkpoint=checkpoint),
+        "vision_analyst": functools.partial(run_vision_analysis_stage, checkpoint=checkpoint),
+        "description_generator": run_description_stage,
+        "editing_advisor": run_editing_suggestion_stage
+    }
+
+# 各ステージが完了を待つ必要のあるステージ
+STAGE_DEPENDENCIES = {
+    "transcription_agent": ["scene_detector"],
+    "vision_analyst": ["scene_detector"],
+    "description_generator": ["transcription_agent", "vision_analyst"],
+    "editing_advisor": ["description_generator"]
+}
+
+def generate_descriptions(scenes, transcriptions, frame_analyses, scene_index=None):
     """
     音声認識と映像分析結果からシーン説明文を生成します。
     
+    音声認識結果はシーンIDの辞書で、フレーム分析結果はシーンの区間インデックスで
+    対応付けるため、シーン数と結果数に対して線形に近い時間で処理できます。
+    
     Args:
         scenes: シーンリスト
         transcriptions: 音声認識結果
         frame_analyses: フレーム分析結果
+        scene_index: scenesから作成済みのSceneIndex（Noneの場合はここで作成）
         
     Returns:
         list: シーン説明文のリスト
     """
+    if scene_index is None:
+        scene_index = SceneIndex(scenes)
+    transcripts_by_id = build_id_index(transcriptions)
+    
+    # 各シーンについて、リスト内で最初に区間に含まれるフレーム分析結果を採用する
+    analyses_by_id = {}
+    scene_ids_by_analysis = scene_index.scene_ids_at_times(
+        [analysis["timestamp"] for analysis in frame_analyses]
+    )
+    for analysis, scene_ids in zip(frame_analyses, scene_ids_by_analysis):
+        for scene_id in scene_ids:
+            analyses_by_id.setdefault(scene_id, analysis)
+    
     descriptions = []
     
     for scene in scenes:
         scene_id = scene["scene_id"]
         
         # 対応する音声認識結果を検索
-        scene_transcript = ""
-        for transcript in transcriptions:
-            if transcript["scene_id"] == scene_id:
-                scene_transcript = transcript["text"]
-                break
+        transcript = transcripts_by_id.get(scene_id)
+        scene_transcript = transcript["text"] if transcript else ""
         
         # 対応するフレーム分析結果を検索
-        scene_analysis = ""
-        for analysis in frame_analyses:
-            if scene["start_time"] <= analysis["timestamp"] <= scene["end_time"]:
-                scene_analysis = analysis["analysis"]
-                break
+        analysis = analyses_by_id.get(scene_id)
+        scene_analysis = analysis["analysis"] if analysis else ""
         
         # 説明文を生成
         if scene_transcript and scene_analysis:
@@ -263,16 +1276,14 @@ def generate_editing_suggestions(scenes, descriptions):
         list: 編集提案のリスト
     """
     editing_suggestions = []
+    descriptions_by_id = build_id_index(descriptions)
     
     for i, scene in enumerate(scenes):
         scene_id = scene["scene_id"]
         
         # 対応する説明文を検索
-        scene_description = ""
-        for desc in descriptions:
-            if desc["scene_id"] == scene_id:
-                scene_description = desc["text"]
-                break
+        desc = descriptions_by_id.get(scene_id)
+        scene_description = desc["text"] if desc else ""
         
         # シーンの位置に基づいて異なる提案を生成
         if i == 0:
@@ -303,25 +1314,13 @@ def generate_fallback_scenes():
     シーン検出に失敗した場合のフォールバックシーンを生成します。
     
     Returns:
-        list: フォールバックシーンのリスト
+        SceneTable: フォールバックシーンのテーブル
     """
-    return [
-        {
-            "scene_id": 1,
-            "start_time": 0.0,
-            "end_time": 30.0
-        },
-        {
-            "scene_id": 2,
-            "start_time": 30.0,
-            "end_time": 60.0
-        },
-        {
-            "scene_id": 3,
-            "start_time": 60.0,
-            "end_time": 90.0
-        }
-    ]
+    return SceneTable.from_records([
+        Scene(1, 0.0, 30.0),
+        Scene(2, 30.0, 60.0),
+        Scene(3, 60.0, 90.0)
+    ])
 
 def generate_fallback_data():
     """
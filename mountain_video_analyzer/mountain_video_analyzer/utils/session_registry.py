@@ -0,0 +1,454 @@
+"""
+セッションレジストリ - 分析済みのセッションをメモリ使用量の上限付きで保持する
+"""
+import os
+import re
+import time
+import asyncio
+import pickle
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
+from ..config import CONFIG
+from .session import SessionState
+from .session_store import SQLiteSessionState
+from .session_manager import SessionManager
+
+# ファイル名として使用できるセッションID（URLから受け取ったIDでディレクトリ外を参照しないため）
+SESSION_ID_PATTERN = re.compile(r"[0-9A-Za-z_-]+")
+
+class SessionEntry:
+    """
+    レジストリに保持しているセッションと、そのサイズ・最終アクセス時刻・使用中の数
+    """
+    __slots__ = ("session_manager", "size", "last_access", "pins")
+
+    def __init__(self, session_manager, size, last_access):
+        self.session_manager = session_manager
+        self.size = size
+        self.last_access = last_access
+        self.pins = 0
+
+class SessionRegistry:
+    """
+    セッションIDからセッションを取得するレジストリ
+
+    セッションごとにおおよそのメモリ使用量を記録し、合計がmax_bytesを超えた場合は
+    最も長く使われていないセッションから、ttl秒以上使われていないセッションは合計に関係なく
+    メモリから取り除きます。分析中など使用中のセッションは取り除きません。
+    spill_dirを指定した場合、取り除いたセッションの状態をファイルに書き出し、
+    次に取得されたときに読み込み直します。書き出しとオンデマンド分析の停止は専用のスレッドで行うため、
+    呼び出し元は待たされません。書き出したファイルは
+    spill_ttl秒を過ぎるか、合計がmax_spill_bytesを超えると古いものから削除します。
+    SQLiteSessionStateのセッションは状態がデータベースにあるため、書き出さずに開き直します。
+    オンデマンド分析中のセッションを取り除いた場合、未分析のシーンの分析は停止します。
+    イベントループから使う場合は、サイズの計測などをスレッドで行うuse_async()を使います。
+    """
+    def __init__(self, max_bytes=None, ttl=None, spill_dir=None, clock=time.monotonic,
+                 spill_ttl=None, max_spill_bytes=None):
+        """
+        SessionRegistryの初期化
+
+        Args:
+            max_bytes: メモリに保持するセッションの合計サイズの上限（Noneの場合はCONFIGから取得）
+            ttl: 使われていないセッションを保持する秒数（Noneの場合はCONFIGから取得）
+            spill_dir: 取り除いたセッションを書き出すディレクトリ（Noneの場合はCONFIGから取得、空文字列で無効）
+            clock: 現在時刻を返す関数
+            spill_ttl: 書き出したファイルを保持する秒数（Noneの場合はCONFIGから取得）
+            max_spill_bytes: 書き出したファイルの合計サイズの上限（Noneの場合はCONFIGから取得）
+        """
+        session_config = CONFIG["session"]
+        self.max_bytes = max_bytes if max_bytes is not None else session_config["max_bytes"]
+        self.ttl = ttl if ttl is not None else session_config["ttl"]
+        self.spill_dir = spill_dir if spill_dir is not None else session_config["spill_dir"]
+        self.clock = clock
+        self.spill_ttl = spill_ttl if spill_ttl is not None else session_config["spill_ttl"]
+        self.max_spill_bytes = max_spill_bytes if max_spill_bytes is not None else session_config["max_spill_bytes"]
+
+        self._entries = {}
+        self._reopen = {}
+        self._pending = {}
+        self._lock = threading.RLock()
+        # 書き出しと、取り除いたセッションのオンデマンド分析の停止を順に実行するスレッド
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-registry")
+        self.total_bytes = 0
+        self.evictions = 0
+        self.reloads = 0
+        self.expired_spills = 0
+
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            # 以前のプロセスが書き出したファイルも期限を過ぎていれば削除する
+            self._worker.submit(self.expire_spills)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def create(self, state=None):
+        """
+        新しいセッションを作成して登録する
+
+        Args:
+            state: セッション状態の保存先（Noneの場合はCONFIGに従って作成）
+
+        Returns:
+            SessionManager: セッションマネージャー
+        """
+        session_manager = SessionManager(state=state)
+        self.register(session_manager)
+        return session_manager
+
+    def register(self, session_manager):
+        """
+        セッションを登録する
+
+        Args:
+            session_manager: セッションマネージャー
+        """
+        size = session_manager.estimate_size()
+        with self._lock:
+            self._add(session_manager, size)
+            self._evict()
+
+    def get(self, session_id):
+        """
+        セッションを取得する。書き出したセッションは読み込み直す
+
+        Args:
+            session_id: セッションID
+
+        Returns:
+            SessionManager: セッションマネージャー（存在しない場合はNone）
+        """
+        with self._lock:
+            entry = self._lookup(session_id)
+            if entry is None:
+                return None
+            self._evict()
+            return entry.session_manager
+
+    @contextmanager
+    def use(self, session_id):
+        """
+        ブロックの間セッションを使用中にし、取り除かれないようにする。
+        終了時にサイズを計測し直し、上限を超えていればほかのセッションを取り除く
+
+        Args:
+            session_id: セッションID
+
+        Yields:
+            SessionManager: セッションマネージャー（存在しない場合はNone）
+        """
+        session_manager = self._pin(session_id)
+        try:
+            yield session_manager
+        finally:
+            if session_manager is not None:
+                self._unpin(session_id)
+
+    @asynccontextmanager
+    async def use_async(self, session_id):
+        """
+        use()の非同期版。セッションの読み込み直しと終了時のサイズの計測をスレッドで行い、
+        大きなセッションでもイベントループを待たせない
+
+        Args:
+            session_id: セッションID
+
+        Yields:
+            SessionManager: セッションマネージャー（存在しない場合はNone）
+        """
+        session_manager = await asyncio.to_thread(self._pin, session_id)
+        try:
+            yield session_manager
+        finally:
+            if session_manager is not None:
+                # キャンセルされても使用中の数を必ず戻す
+                await asyncio.shield(asyncio.to_thread(self._unpin, session_id))
+
+    def update(self, session_id):
+        """
+        セッションのサイズを計測し直し、上限を超えていればセッションを取り除く。
+        サイズの計測はセッション全体を走査するため、ロックを保持せずに行う
+
+        Args:
+            session_id: セッションID
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+
+        size = entry.session_manager.estimate_size() if entry is not None else None
+
+        with self._lock:
+            # 計測中に取り除かれたセッションのサイズは合計に含めない
+            if entry is not None and self._entries.get(session_id) is entry:
+                self.total_bytes += size - entry.size
+                entry.size = size
+                entry.last_access = self.clock()
+            self._evict()
+
+    def remove(self, session_id):
+        """
+        セッションを削除する（書き出したファイルも削除する）
+
+        Args:
+            session_id: セッションID
+        """
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self.total_bytes -= entry.size
+                self._close(entry.session_manager)
+            self._reopen.pop(session_id, None)
+
+            pending = self._pending.pop(session_id, None)
+
+        # 書き出し中の場合は、書き出しが終わってからファイルを削除する
+        if pending is not None and not pending[0].cancel():
+            wait([pending[0]])
+
+        path = self._spill_path(session_id)
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+    def get_metrics(self):
+        """
+        レジストリの統計情報を取得する
+
+        Returns:
+            dict: メモリ上のセッション数・合計サイズ・上限・取り除いた回数・読み込み直した回数
+        """
+        with self._lock:
+            return {
+                "live_sessions": len(self._entries),
+                "memory_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+                "pending_spills": len(self._pending),
+                "expired_spills": self.expired_spills
+            }
+
+    def flush(self):
+        """
+        書き出し中のセッションの書き出しと、取り除いたセッションのオンデマンド分析の停止が終わるまで待つ
+        """
+        self._worker.submit(lambda: None).result()
+
+    def expire_spills(self):
+        """
+        spill_ttl秒を過ぎた書き出し済みのファイルを削除し、合計がmax_spill_bytesを超えていれば
+        古いものから削除する（専用のスレッドで、書き出しのたびに実行される）
+        """
+        if not self.spill_dir:
+            return
+
+        now = time.time()
+        files = []
+        expired = 0
+        for name in os.listdir(self.spill_dir):
+            if not name.endswith(".pickle"):
+                continue
+            path = os.path.join(self.spill_dir, name)
+            try:
+                stat = os.stat(path)
+                if now - stat.st_mtime > self.spill_ttl:
+                    os.remove(path)
+                    expired += 1
+                    continue
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_spill_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            expired += 1
+
+        with self._lock:
+            self.expired_spills += expired
+
+    def _pin(self, session_id):
+        """
+        セッションを取得して使用中にする
+
+        Returns:
+            SessionManager: セッションマネージャー（存在しない場合はNone）
+        """
+        with self._lock:
+            entry = self._lookup(session_id)
+            if entry is None:
+                return None
+            entry.pins += 1
+            self._evict()
+            return entry.session_manager
+
+    def _unpin(self, session_id):
+        """
+        セッションの使用を終了し、サイズを計測し直す
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                entry.pins -= 1
+        self.update(session_id)
+
+    def _lookup(self, session_id):
+        """
+        メモリ上のセッションを取得し、最終アクセス時刻を更新する。取り除いたセッションは読み込み直す
+
+        Returns:
+            SessionEntry: エントリ（存在しない場合はNone）
+        """
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            entry.last_access = self.clock()
+            return entry
+
+        session_manager = self._reload(session_id)
+        if session_manager is None:
+            return None
+        return self._add(session_manager, session_manager.estimate_size())
+
+    def _add(self, session_manager, size):
+        """
+        セッションをメモリ上のセッションに追加する
+
+        Args:
+            session_manager: セッションマネージャー
+            size: セッションのおおよそのサイズ（バイト）
+        """
+        session_id = session_manager.session_id
+        previous = self._entries.pop(session_id, None)
+        if previous is not None:
+            self.total_bytes -= previous.size
+
+        entry = SessionEntry(session_manager, size, self.clock())
+        self._entries[session_id] = entry
+        self.total_bytes += entry.size
+        self._reopen.pop(session_id, None)
+        return entry
+
+    def _evict(self):
+        """
+        TTLを過ぎたセッションと、合計サイズが上限を超えた分のセッションを古い順に取り除く
+        """
+        now = self.clock()
+        idle = sorted(
+            (entry for entry in self._entries.values() if entry.pins == 0),
+            key=lambda entry: entry.last_access
+        )
+
+        for entry in idle:
+            if now - entry.last_access < self.ttl and self.total_bytes <= self.max_bytes:
+                break
+            self._spill(entry)
+
+    def _spill(self, entry):
+        """
+        セッションをメモリから取り除き、設定に応じて状態を書き出す
+        """
+        session_manager = entry.session_manager
+        session_id = session_manager.session_id
+        state = session_manager.get_session().state
+
+        if isinstance(state, SQLiteSessionState):
+            self._reopen[session_id] = (state.session_id, state.db_path)
+        elif self.spill_dir and self._spill_path(session_id) is not None:
+            # 大きなセッションの書き出しで呼び出し元を待たせないよう、専用のスレッドで書き出す。
+            # 書き出しが終わる前に取得された場合は、書き出し待ちの状態をそのまま使う
+            values = state.state
+            future = self._worker.submit(self._write_spill, session_id, values)
+            self._pending[session_id] = (future, values)
+            future.add_done_callback(lambda _: self._finish_spill(session_id, future))
+
+        del self._entries[session_id]
+        self.total_bytes -= entry.size
+        self.evictions += 1
+        self._close(session_manager)
+        logging.info(f"セッション {session_id}（{entry.size}バイト）をメモリから取り除きました")
+
+    def _write_spill(self, session_id, values):
+        """
+        セッションの状態をファイルに書き出す（専用のスレッドで実行される）
+        """
+        path = self._spill_path(session_id)
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                pickle.dump(values, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except Exception as e:
+            # 専用のスレッドで発生した例外は呼び出し元に届かないため、ここで記録する
+            logging.error(f"セッション {session_id} の書き出し中にエラーが発生しました: {e}")
+
+        self.expire_spills()
+
+    def _finish_spill(self, session_id, future):
+        """
+        書き出しが終わったセッションを書き出し待ちから取り除く
+        """
+        with self._lock:
+            pending = self._pending.get(session_id)
+            if pending is not None and pending[0] is future:
+                del self._pending[session_id]
+
+    def _reload(self, session_id):
+        """
+        取り除いたセッションを読み込み直す
+
+        Returns:
+            SessionManager: セッションマネージャー（存在しない場合はNone）
+        """
+        stored = self._reopen.get(session_id)
+        if stored is not None:
+            self.reloads += 1
+            return SessionManager(session_id, state=SQLiteSessionState(*stored))
+
+        pending = self._pending.pop(session_id, None)
+        if pending is not None:
+            # 書き出しがまだ始まっていなければ取り消し、書き出し待ちの状態を使う
+            # （書き出し中の場合に備え、書き出している辞書とは別の辞書にする）
+            pending[0].cancel()
+            state = SessionState()
+            state.state = dict(pending[1])
+            self.reloads += 1
+            return SessionManager(session_id, state=state)
+
+        path = self._spill_path(session_id)
+        if path is None or not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, "rb") as f:
+                values = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logging.error(f"セッション {session_id} の読み込み中にエラーが発生しました: {e}")
+            return None
+
+        state = SessionState()
+        state.state = values
+        self.reloads += 1
+        return SessionManager(session_id, state=state)
+
+    def _spill_path(self, session_id):
+        """
+        セッションを書き出すファイルのパス（書き出しが無効、またはIDが不正な場合はNone）
+        """
+        if not self.spill_dir or not SESSION_ID_PATTERN.fullmatch(session_id):
+            return None
+        return os.path.join(self.spill_dir, f"{session_id}.pickle")
+
+    def _close(self, session_manager):
+        """
+        取り除いたセッションのオンデマンド分析を停止する（スレッドの終了を待つため、専用のスレッドで実行する）
+        """
+        if session_manager.lazy_analyzer is not None:
+            self._worker.submit(session_manager.close)
@@ -0,0 +1,351 @@
+"""
+セッションストア - セッション状態をSQLiteに保存し、複数のプロセスで共有する
+"""
+import os
+import time
+import pickle
+import sqlite3
+import threading
+from contextlib import contextmanager
+from ..config import CONFIG
+from ..models import SceneTable
+from .session import SessionState
+
+# 要素ごとに保存する値の種類（種類名, 型, 要素のリストから値を作成する関数）
+SEQUENCE_KINDS = (
+    ("scene_table", SceneTable, SceneTable.from_records),
+    ("list", list, list)
+)
+
+def get_value_kind(value):
+    """
+    値の保存方法の種類を取得します。
+
+    Args:
+        value: 状態の値
+
+    Returns:
+        str: "scene_table"・"list"（要素ごとに保存）または "value"（値全体を保存）
+    """
+    for kind, value_type, _ in SEQUENCE_KINDS:
+        if type(value) is value_type:
+            return kind
+    return "value"
+
+def build_sequence(kind, items):
+    """
+    要素のリストから種類に応じた値を作成します。
+
+    Args:
+        kind: 値の種類
+        items: 要素のリスト
+
+    Returns:
+        listまたはSceneTable
+    """
+    for sequence_kind, _, factory in SEQUENCE_KINDS:
+        if sequence_kind == kind:
+            return factory(items)
+    raise ValueError(f"未知の値の種類です: {kind}")
+
+class StoredValue:
+    """
+    プロセス内に読み込んだ値と、その値に対応するデータベース上の状態
+    """
+    __slots__ = ("value", "kind", "generation", "length", "version")
+
+    def __init__(self, value, kind, generation, length, version):
+        self.value = value
+        self.kind = kind
+        self.generation = generation
+        self.length = length
+        self.version = version
+
+class SQLiteSessionState:
+    """
+    SQLiteに保存されるセッション状態
+
+    SessionStateと同じget/setで利用でき、キーごとに保存されます。リストとSceneTableは
+    要素ごとに保存し、同じリストに要素を追加して設定し直した場合は追加分だけを書き込みます。
+    値は最初に取得されたときに読み込み、別のプロセスが更新した場合は次の取得時に
+    差分（追加された要素）だけを読み込みます。
+    WALモードで開くため、複数のプロセスから同時に読み書きできます。
+    値はpickleで保存するため、信頼できないデータベースファイルは開かないでください。
+    """
+    def __init__(self, session_id, db_path=None):
+        """
+        SQLiteSessionStateの初期化
+
+        Args:
+            session_id: セッションID（同じIDを指定すると別のプロセスでも同じ状態を参照する）
+            db_path: データベースファイルのパス（Noneの場合はCONFIGから取得）
+        """
+        self.session_id = session_id
+        self.db_path = db_path or CONFIG["session"]["db_path"]
+        self._cache = {}
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        # close()ですべてのスレッドの接続を閉じるため、開いた接続を記録する
+        self._connections = []
+
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_state (
+                    session_id TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    value BLOB,
+                    length INTEGER NOT NULL,
+                    generation INTEGER NOT NULL,
+                    version INTEGER NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, key)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_items (
+                    session_id TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    generation INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    item BLOB NOT NULL,
+                    PRIMARY KEY (session_id, key, generation, position)
+                )
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def set(self, key, value):
+        """
+        状態に値を設定
+
+        Args:
+            key: 状態のキー
+            value: 状態の値（リストとSceneTableの既存の要素を書き換えた場合は、別のリストとして設定する）
+        """
+        kind = get_value_kind(value)
+
+        with self._lock, self._transaction(immediate=True) as conn:
+            row = conn.execute(
+                "SELECT kind, length, generation, version FROM session_state WHERE session_id = ? AND key = ?",
+                (self.session_id, key)
+            ).fetchone()
+            cached = self._cache.get(key)
+
+            appendable = (
+                kind != "value" and row is not None and cached is not None
+                and cached.value is value and len(value) >= cached.length
+                and (row[0], row[1], row[2]) == (kind, cached.length, cached.generation)
+            )
+
+            if appendable:
+                # 同じリストに追加された要素だけを書き込む
+                if len(value) == cached.length:
+                    return
+                generation = cached.generation
+                start = cached.length
+            else:
+                generation = row[2] + 1 if row is not None else 1
+                start = 0
+                conn.execute(
+                    "DELETE FROM session_items WHERE session_id = ? AND key = ?",
+                    (self.session_id, key)
+                )
+
+            length = 0
+            blob = None
+            if kind == "value":
+                blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            else:
+                length = len(value)
+                conn.executemany(
+                    "INSERT INTO session_items (session_id, key, generation, position, item) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (self.session_id, key, generation, position,
+                         pickle.dumps(value[position], protocol=pickle.HIGHEST_PROTOCOL))
+                        for position in range(start, length)
+                    ]
+                )
+
+            version = row[3] + 1 if row is not None else 1
+            conn.execute(
+                "INSERT OR REPLACE INTO session_state "
+                "(session_id, key, kind, value, length, generation, version, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.session_id, key, kind, blob, length, generation, version, time.time())
+            )
+
+            self._cache[key] = StoredValue(value, kind, generation, length, version)
+
+    def get(self, key, default=None):
+        """
+        状態から値を取得
+
+        Args:
+            key: 状態のキー
+            default: キーが存在しない場合のデフォルト値
+
+        Returns:
+            取得した値またはデフォルト値
+        """
+        with self._lock:
+            # 読み込み済みの値が最新かどうかはトランザクションを開始せずに（自動コミットで）確認する
+            row = self._read_state_row(self._connect(), key)
+            cached = self._cache.get(key)
+            if row is None:
+                self._cache.pop(key, None)
+                return default
+            if cached is not None and cached.version == row[3]:
+                return cached.value
+
+            return self._load(key)
+
+    def _load(self, key):
+        """
+        値をデータベースから読み込む。状態の行と要素を同じスナップショットから読むため、トランザクション内で読み込む
+
+        Args:
+            key: 状態のキー
+
+        Returns:
+            読み込んだ値（キーが存在しない場合はNone）
+        """
+        with self._transaction() as conn:
+            row = self._read_state_row(conn, key)
+            if row is None:
+                self._cache.pop(key, None)
+                return None
+
+            kind, length, generation, version = row
+            cached = self._cache.get(key)
+            if cached is not None and cached.version == version:
+                return cached.value
+
+            if kind == "value":
+                (blob,) = conn.execute(
+                    "SELECT value FROM session_state WHERE session_id = ? AND key = ?",
+                    (self.session_id, key)
+                ).fetchone()
+                value = pickle.loads(blob)
+            elif (cached is not None and (cached.kind, cached.generation) == (kind, generation)
+                  and len(cached.value) == cached.length <= length):
+                # 別のプロセスが同じリストに追加した要素だけを読み込む
+                value = cached.value
+                for item in self._load_items(conn, key, generation, cached.length):
+                    value.append(item)
+            else:
+                value = build_sequence(kind, self._load_items(conn, key, generation, 0))
+
+            self._cache[key] = StoredValue(value, kind, generation, length, version)
+            return value
+
+    def values(self):
+        """
+        このプロセスに読み込み済みの値を取得（未読み込みの値はメモリを使用していないため含まない）
+
+        Returns:
+            list: 値のリスト
+        """
+        with self._lock:
+            return [stored.value for stored in self._cache.values()]
+
+    def close(self):
+        """
+        すべてのスレッドが開いた接続を閉じる（閉じた後に使用した場合は接続を開き直す）
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+            # ほかのスレッドが閉じた接続を使わないよう、スレッドごとの接続の記録も作り直す
+            self._local = threading.local()
+
+        for conn in connections:
+            conn.close()
+
+    def _read_state_row(self, conn, key):
+        """
+        キーの状態の行を読み込む
+
+        Returns:
+            tuple: (kind, length, generation, version)。存在しない場合はNone
+        """
+        return conn.execute(
+            "SELECT kind, length, generation, version FROM session_state WHERE session_id = ? AND key = ?",
+            (self.session_id, key)
+        ).fetchone()
+
+    def _load_items(self, conn, key, generation, start):
+        """
+        指定した位置以降の要素を読み込む
+
+        Returns:
+            list: 要素のリスト
+        """
+        rows = conn.execute(
+            "SELECT item FROM session_items WHERE session_id = ? AND key = ? AND generation = ? AND position >= ? "
+            "ORDER BY position",
+            (self.session_id, key, generation, start)
+        )
+        return [pickle.loads(item) for (item,) in rows]
+
+    def _connect(self):
+        """
+        現在のスレッドの接続を取得する（初回は接続を開く）。接続は自動コミットモードで開く
+
+        Returns:
+            sqlite3.Connection: 接続
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            # WALモードではコミットごとの同期を省略しても破損しない
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._lock:
+                self._connections.append(conn)
+                self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self, immediate=False):
+        """
+        スレッドごとの接続でトランザクションを実行する。ブロックの終了時にコミット（例外時はロールバック）する
+
+        Args:
+            immediate: Trueの場合は書き込みロックを先に取得する
+
+        Yields:
+            sqlite3.Connection: 接続
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+def create_session_state(session_id, backend=None, db_path=None):
+    """
+    設定に応じたセッション状態を作成します。
+
+    Args:
+        session_id: セッションID
+        backend: "memory"または"sqlite"（Noneの場合はCONFIGから取得）
+        db_path: "sqlite"の場合のデータベースファイルのパス（Noneの場合はCONFIGから取得）
+
+    Returns:
+        SessionStateまたはSQLiteSessionState
+    """
+    backend = backend or CONFIG["session"]["backend"]
+    if backend == "memory":
+        return SessionState()
+    if backend == "sqlite":
+        return SQLiteSessionState(session_id, db_path)
+    raise ValueError(f"未知のセッションの保存先です: {backend}")
@@ -0,0 +1,182 @@
+"""
+状態の購読 - セッション状態の変更をキー・パス単位で非同期に受け取る
+"""
+import asyncio
+import fnmatch
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
+# リストの要素のパスに使用するフィールド（いずれもない場合はリスト内の位置）
+ITEM_ID_FIELDS = ("scene_id", "timestamp")
+
+def get_item_path(key, item, position):
+    """
+    リストの要素のパスを作成します（例: "descriptions/42"）。
+
+    Args:
+        key: 状態のキー
+        item: 要素
+        position: リスト内の位置
+
+    Returns:
+        str: パス
+    """
+    if isinstance(item, Mapping):
+        for field in ITEM_ID_FIELDS:
+            if item.get(field) is not None:
+                return f"{key}/{item[field]}"
+    return f"{key}/{position}"
+
+def build_changes(key, items, reset):
+    """
+    リストの変更を要素ごとの変更に変換します。
+
+    Args:
+        key: 状態のキー
+        items: (位置, 要素)のリスト
+        reset: リストが置き換えられた場合True（先頭にキー全体のリセットを含める）
+
+    Returns:
+        list: 変更の辞書のリスト
+    """
+    changes = [{"key": key, "path": key, "op": "reset", "value": None}] if reset else []
+    changes.extend(
+        {"key": key, "path": get_item_path(key, item, position), "op": "set", "value": item}
+        for position, item in items
+    )
+    return changes
+
+class StateSubscription:
+    """
+    セッション状態の変更の購読
+
+    パターンはキー（"video_path"）またはパス（"descriptions/42"）に対するワイルドカード
+    （"scenes/*"）で指定します。async forで反復すると、前回の反復以降の変更をまとめたリストが得られます。
+    受け取る前に同じパスが複数回変更された場合は最新の変更だけが残り、キー全体のリセットは
+    それ以前のそのキーの要素の変更を取り消します。
+    変更はどのスレッドから通知されても、反復しているイベントループで受け取れます。
+    """
+    def __init__(self, patterns, on_close=None):
+        """
+        StateSubscriptionの初期化
+
+        Args:
+            patterns: 購読するキー・パスのパターンのリスト
+            on_close: 購読の終了時に呼び出す関数
+        """
+        self.patterns = tuple(patterns)
+        self.on_close = on_close
+        self.coalesced = 0
+
+        self._pending = OrderedDict()
+        self._waiter = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def matches(self, change):
+        """
+        変更が購読するパターンに一致するかどうか
+
+        Args:
+            change: 変更の辞書
+
+        Returns:
+            bool: 一致する場合True
+        """
+        path = change["path"]
+        for pattern in self.patterns:
+            if fnmatch.fnmatchcase(path, pattern):
+                return True
+            # キー全体のリセットは、そのキーの要素を購読している場合にも通知する
+            if change["op"] == "reset" and pattern.startswith(f"{path}/"):
+                return True
+        return False
+
+    def push(self, changes):
+        """
+        変更を受け取り、反復を待っている場合は再開する
+
+        Args:
+            changes: 変更の辞書のリスト
+        """
+        with self._lock:
+            if self._closed:
+                return
+
+            pushed = False
+            for change in changes:
+                if not self.matches(change):
+                    continue
+
+                if change["op"] == "reset":
+                    prefix = f"{change['path']}/"
+                    for path in [path for path in self._pending if path.startswith(prefix)]:
+                        del self._pending[path]
+                        self.coalesced += 1
+
+                if self._pending.pop(change["path"], None) is not None:
+                    self.coalesced += 1
+                self._pending[change["path"]] = change
+                pushed = True
+
+            if pushed:
+                self._wake()
+
+    def close(self):
+        """
+        購読を終了する。受け取り済みの変更を返した後に反復が終了する
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wake()
+
+        if self.on_close is not None:
+            self.on_close(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            with self._lock:
+                if self._pending:
+                    changes = list(self._pending.values())
+                    self._pending.clear()
+                    return changes
+                if self._closed:
+                    raise StopAsyncIteration
+
+                loop = asyncio.get_running_loop()
+                waiter = loop.create_future()
+                self._waiter = (loop, waiter)
+
+            await waiter
+
+    def _wake(self):
+        """
+        反復を待っているイベントループに再開を通知する（ロックを保持して呼び出す）
+        """
+        if self._waiter is None:
+            return
+
+        loop, waiter = self._waiter
+        self._waiter = None
+
+        def resume():
+            if not waiter.done():
+                waiter.set_result(None)
+
+        try:
+            loop.call_soon_threadsafe(resume)
+        except RuntimeError:
+            # 反復していたイベントループが既に終了している
+            pass
@@ -0,0 +1,229 @@
+"""
+ストリーミングジョブ - 同じ動画のストリーミング分析を1回だけ実行し、イベントを複数のクライアントに配信する
+"""
+import json
+import asyncio
+import hashlib
+import logging
+from .checkpoint import compute_content_hash, get_analysis_params
+from .event_stream import EventBuffer, SUPERSEDED_EVENTS
+
+def get_stream_job_key(video_path, mode="streaming"):
+    """
+    ストリーミングジョブのキー（動画の内容と分析パラメータのハッシュ）を作成します。
+
+    Args:
+        video_path: 動画ファイルのパス
+        mode: 分析の種類
+
+    Returns:
+        str: キー（ファイルを読み込めない場合はNone）
+    """
+    try:
+        content_hash = compute_content_hash(video_path)
+    except OSError as e:
+        logging.warning(f"動画 {video_path} のハッシュを計算できないため、分析を共有しません: {e}")
+        return None
+
+    params = json.dumps({"mode": mode, **get_analysis_params()}, sort_keys=True)
+    return hashlib.sha256((content_hash + params).encode("utf-8")).hexdigest()
+
+class StreamJob:
+    """
+    実行中のストリーミング分析と、その購読者
+
+    分析のイベントには連番のevent_idを付けて記録し、購読中のすべてのEventBufferに入れます。
+    途中から購読したクライアントには、記録済みのイベントを先に入れます（進捗は最新のものだけ）。
+    購読者がいなくなった場合は分析を中断します。
+    """
+    def __init__(self, key, session_id, processor):
+        """
+        StreamJobの初期化
+
+        Args:
+            key: ジョブのキー（共有しない場合はNone）
+            session_id: 結果を保存するセッションID
+            processor: 分析を実行するStreamingProcessor
+        """
+        self.key = key
+        self.session_id = session_id
+        self.processor = processor
+        self.task = None
+
+        self._events = []
+        self._latest = {}
+        self._subscribers = set()
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def start(self, coroutine):
+        """
+        分析をバックグラウンドで開始する
+
+        Args:
+            coroutine: 分析を実行するコルーチン（イベントはsend()に渡す）
+        """
+        self.task = asyncio.ensure_future(self._run(coroutine))
+        # 開始前に中断された場合もコルーチンを閉じる（実行済みの場合は何もしない）
+        self.task.add_done_callback(lambda _: coroutine.close())
+
+    def publish(self, event):
+        """
+        イベントを記録し、すべての購読者に入れる
+
+        Args:
+            event: イベントの辞書
+        """
+        event = {**event, "event_id": len(self._events) + 1}
+        event_type = event.get("type")
+
+        # 記録済みの古い進捗は再送しないため取り除く（event_idは位置と対応させるため詰めない）
+        if event_type in SUPERSEDED_EVENTS:
+            previous = self._latest.get(event_type)
+            if previous is not None:
+                self._events[previous] = None
+            self._latest[event_type] = len(self._events)
+
+        self._events.append(event)
+        for buffer in self._subscribers:
+            buffer.put(event)
+
+    async def send(self, event):
+        """
+        publish()の非同期版（StreamingProcessorのコールバックとして渡す）
+
+        Args:
+            event: イベントの辞書
+        """
+        self.publish(event)
+
+    def subscribe(self, last_event_id=None):
+        """
+        購読を開始する
+
+        Args:
+            last_event_id: 受け取り済みの最後のevent_id（それより後のイベントだけを入れる）
+
+        Returns:
+            EventBuffer: イベントを受け取るバッファ
+        """
+        buffer = EventBuffer(session_id=self.session_id)
+        for event in self._events[last_event_id or 0:]:
+            if event is not None:
+                buffer.put(event)
+
+        if self.task is not None and self.task.done():
+            buffer.close()
+        else:
+            self._subscribers.add(buffer)
+        return buffer
+
+    def stop(self, buffer):
+        """
+        購読者から停止を要求された場合に呼び出す。ほかに購読者がいなければ分析を停止し、
+        いればこの購読者にだけcancelledを入れて購読を終了する
+
+        Args:
+            buffer: subscribe()が返したバッファ
+        """
+        if self._subscribers == {buffer}:
+            self.processor.stop_streaming()
+            return
+
+        self._subscribers.discard(buffer)
+        buffer.put({"type": "cancelled", "session_id": self.session_id})
+
+    async def detach(self, buffer):
+        """
+        購読を終了する。最後の購読者だった場合は分析を中断し、FFmpegの終了と実行枠の返却を待つ
+
+        Args:
+            buffer: subscribe()が返したバッファ
+        """
+        self._subscribers.discard(buffer)
+        buffer.close()
+        logging.info(f"セッション {self.session_id} のイベント送信: {buffer.get_metrics()}")
+
+        if not self._subscribers and self.task is not None:
+            if not self.task.done():
+                self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    async def _run(self, coroutine):
+        """
+        分析を実行し、停止・エラー時は対応するイベントを配信する
+        """
+        try:
+            await coroutine
+            if self.processor.stopped:
+                self.publish({"type": "cancelled", "session_id": self.session_id})
+        except Exception as e:
+            logging.error(f"セッション {self.session_id} のストリーミング分析中にエラーが発生しました: {e}")
+            self.publish({"type": "error", "error": str(e)})
+        finally:
+            for buffer in self._subscribers:
+                buffer.close()
+            self._subscribers.clear()
+
+class StreamJobRegistry:
+    """
+    キーごとに実行中のストリーミングジョブ
+
+    同じキーのジョブが実行中であれば新しく分析を開始せずに購読し、完了したジョブは取り除きます。
+    """
+    def __init__(self):
+        self._jobs = {}
+        self.started = 0
+        self.shared = 0
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def attach(self, key, create, last_event_id=None):
+        """
+        実行中のジョブを購読する。キーのジョブが実行中でなければcreate(key)で開始する
+
+        Args:
+            key: ジョブのキー（Noneの場合は共有せずに毎回開始する）
+            create: キーを受け取り、開始したStreamJobを返す関数
+            last_event_id: 受け取り済みの最後のevent_id（実行中のジョブを購読する場合だけ使用する。
+                完了後に開始し直したジョブではevent_idが1から振り直されるため）
+
+        Returns:
+            tuple: (StreamJob, EventBuffer)
+        """
+        job = self._jobs.get(key) if key is not None else None
+        # 購読者がいなくなって中断中のジョブや、停止を要求されたジョブは購読しない
+        if job is not None and job.subscribers and not job.processor.stopped:
+            self.shared += 1
+            return job, job.subscribe(last_event_id)
+
+        job = create(key)
+        self.started += 1
+        if key is not None:
+            self._jobs[key] = job
+            job.task.add_done_callback(lambda _: self._remove(job))
+        return job, job.subscribe()
+
+    def get_metrics(self):
+        """
+        レジストリの統計情報を取得する
+
+        Returns:
+            dict: 実行中のジョブ数・購読者数・開始したジョブ数・実行中のジョブを購読した回数
+        """
+        return {
+            "running": len(self._jobs),
+            "subscribers": sum(job.subscribers for job in self._jobs.values()),
+            "started": self.started,
+            "shared": self.shared
+        }
+
+    def _remove(self, job):
+        """
+        完了したジョブを取り除く
+        """
+        if self._jobs.get(job.key) is job:
+            del self._jobs[job.key]
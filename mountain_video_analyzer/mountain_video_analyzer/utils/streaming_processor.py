@@ -2,13 +2,20 @@
 ストリーミング処理サポート - リアルタイム分析機能
 """
 import asyncio
+import logging
 from ..agents.main_agent import MountainVideoAnalyzerAgent
-from ..utils.session_manager import SessionManager
-from google.adk.runners import Runner
+from ..utils.session_manager import SessionManager, process_video_streaming, forward_streaming_events
+from ..utils.live_ingest import LiveAnalyzer
+from ..tools.cancellation import record_reclaimed
+from ..models import to_builtin
 
 class StreamingProcessor:
     """
     動画のストリーミング処理を行うクラス
+    
+    stop_streaming()を呼び出すと実行中の分析のタスクをすべてキャンセルします。
+    FFmpegプロセスは強制終了され、応答待ちのモデル呼び出しは破棄され、スケジューラーの実行枠は返却されます。
+    回収したリソースの数はtools.cancellation.get_reclaimed_metrics()で確認できます。
     """
     def __init__(self, main_agent=None):
         """
@@ -19,43 +26,80 @@ class StreamingProcessor:
         """
         self.main_agent = main_agent or MountainVideoAnalyzerAgent()
         self.session_manager = None
-        self.runner = Runner()
+        self.live_analyzer = None
+        # stop_streaming()で停止された場合True
+        self.stopped = False
+        self._task = None
     
-    async def start_streaming(self, video_path, callback):
+    async def start_streaming(self, video_path, callback, session_manager=None):
         """
         ストリーミング処理を開始
         
+        シーン単位のパイプラインで分析し、process_video_streamingと同じイベントをコールバックに渡します。
+        stop_streaming()で停止された場合は、リソースを解放した後にcompleteを渡さずに戻ります。
+        
         Args:
             video_path: 動画ファイルのパス
             callback: 結果を受け取るコールバック関数
+            session_manager: 結果を保存するセッションマネージャー（Noneの場合は新しく作成）
         """
-        # セッションを初期化
-        self.session_manager = SessionManager()
-        self.session_manager.set_state("video_path", video_path)
-        self.session_manager.set_state("streaming", True)
+        self.session_manager = session_manager or SessionManager()
+        await self._run(process_video_streaming(
+            self.main_agent, video_path, callback, session_manager=self.session_manager
+        ))
+    
+    async def start_live(self, source, callback, session_manager=None):
+        """
+        書き込み中の動画ファイル、または標準入力の動画をライブ分析する
         
-        # エージェントを実行
-        async for event in self.runner.run_agent(
-            agent=self.main_agent.get_agent(),
-            session=self.session_manager.get_session(),
-            message=f"動画 {video_path} をストリーミング分析します。リアルタイムで結果を返してください。",
-            stream=True  # ストリーミングモードを有効化
-        ):
-            # イベントをコールバックに渡す
-            if event.content:
-                await callback({
-                    "type": event.type,
-                    "author": event.author,
-                    "content": event.content,
-                    "timestamp": asyncio.get_event_loop().time()
-                })
+        シーンが確定して分析が終わるたびに、process_video_streamingと同じイベント（scene_detectedなど）を
+        コールバックに渡し、入力の終了後に残りのシーンを分析してcompleteを渡します。
+        受け取り済みの入力を分析してから終える場合はstop_streaming()ではなくlive_analyzer.stop()を呼び出します。
+        
+        Args:
+            source: ファイルのパス、"-"（標準入力）、またはバイナリのファイルオブジェクト
+            callback: 結果を受け取るコールバック関数
+            session_manager: 結果を保存するセッションマネージャー（Noneの場合は新しく作成）
+        """
+        self.session_manager = session_manager or SessionManager()
+        self.live_analyzer = LiveAnalyzer(self.session_manager, source)
+        await self._run(forward_streaming_events(self.session_manager, self.live_analyzer.run(), callback))
     
     def stop_streaming(self):
         """
         ストリーミング処理を停止
+        
+        実行中の分析のタスクをキャンセルします（イベントループのスレッドから呼び出す）。
+        start_streaming()・start_live()は、子プロセスの終了と実行枠の返却が完了してから戻ります。
         """
         if self.session_manager:
             self.session_manager.set_state("streaming", False)
+        if self._task is not None and not self._task.done():
+            self.stopped = True
+            self._task.cancel()
+    
+    async def _run(self, coroutine):
+        """
+        分析をタスクとして実行し、stop_streaming()によるキャンセルを正常な停止として扱う
+        
+        Args:
+            coroutine: 分析を実行するコルーチン
+        """
+        self.stopped = False
+        self.session_manager.set_state("streaming", True)
+        self._task = asyncio.ensure_future(coroutine)
+        
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            record_reclaimed("streams")
+            # 呼び出し元がキャンセルされた場合はキャンセルを伝える
+            if not self.stopped:
+                raise
+            logging.info(f"セッション {self.session_manager.session_id} のストリーミング処理を停止しました")
+        finally:
+            self._task = None
+            self.session_manager.set_state("streaming", False)
     
     async def get_final_result(self):
         """
@@ -67,8 +111,8 @@ class StreamingProcessor:
         if not self.session_manager:
             return {"error": "ストリーミングが開始されていません"}
         
-        return {
+        return to_builtin({
             "scenes": self.session_manager.get_state("scenes", []),
             "descriptions": self.session_manager.get_state("descriptions", []),
             "editing_suggestions": self.session_manager.get_state("editing_suggestions", [])
-        }
+        })
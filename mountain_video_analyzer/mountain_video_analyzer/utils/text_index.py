@@ -0,0 +1,251 @@
+"""
+全文検索インデックス - 文字n-gramによる転置インデックス
+"""
+import re
+import math
+import unicodedata
+from collections import Counter
+from ..config import CONFIG
+
+# 単語境界をまたぐn-gramを作らないよう、文字・数字の連続ごとに分割する
+WORD_PATTERN = re.compile(r"\w+")
+
+def normalize_text(text):
+    """
+    検索用にテキストを正規化します（全角・半角の統一と小文字化）。
+
+    Args:
+        text: テキスト
+
+    Returns:
+        str: 正規化したテキスト
+    """
+    return unicodedata.normalize("NFKC", text).lower()
+
+def tokenize_ngrams(text, sizes):
+    """
+    テキストを文字n-gramに分割します。
+    日本語のように単語の区切りがないテキストでも、部分文字列として検索できます。
+    最短のn-gramより短い語（「雪」など）は語そのものを1つのn-gramとします。
+
+    Args:
+        text: テキスト
+        sizes: n-gramの長さのリスト
+
+    Returns:
+        Counter: n-gramをキー、出現回数を値とするカウンター
+    """
+    grams = Counter()
+
+    for word in WORD_PATTERN.findall(normalize_text(text)):
+        if len(word) < sizes[0]:
+            grams[word] += 1
+            continue
+        for size in sizes:
+            for i in range(len(word) - size + 1):
+                grams[word[i:i + size]] += 1
+
+    return grams
+
+class TextIndex:
+    """
+    文字n-gramの転置インデックス
+
+    n-gramごとに、それを含む文書と出現回数を保持します。検索時は検索語のn-gramの
+    ポスティングだけを参照するため、検索時間は文書数ではなく該当する文書数に比例します。
+    文書は追加・置換・削除でき、インデックス全体を作り直す必要はありません。
+    """
+    def __init__(self, ngram_sizes=None, weights=None):
+        """
+        TextIndexの初期化
+
+        Args:
+            ngram_sizes: n-gramの長さのリスト（Noneの場合はCONFIGから取得）
+            weights: 文書の種類をキー、スコアの重みを値とする辞書（Noneの場合はCONFIGから取得）
+        """
+        search_config = CONFIG["search"]
+        self.ngram_sizes = sorted(ngram_sizes or search_config["ngram_sizes"])
+        self.weights = weights or search_config["field_weights"]
+
+        self.postings = {}
+        self.documents = {}
+        self._grams_by_char = {}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, doc_key, text):
+        """
+        文書を追加する。同じキーの文書が既にある場合は置き換える
+
+        Args:
+            doc_key: 文書のキー（文書の種類, シーンID）
+            text: 文書のテキスト
+        """
+        if doc_key in self.documents:
+            if self.documents[doc_key]["text"] == text:
+                return
+            self.remove(doc_key)
+
+        grams = tokenize_ngrams(text, self.ngram_sizes)
+        length = sum(grams.values())
+
+        for gram, count in grams.items():
+            postings = self.postings.get(gram)
+            if postings is None:
+                postings = self.postings[gram] = {}
+                self._register_gram(gram)
+            postings[doc_key] = count
+
+        self.documents[doc_key] = {"text": text, "grams": list(grams), "length": length}
+        self._total_length += length
+
+    def add_many(self, documents):
+        """
+        複数の文書を追加する
+
+        Args:
+            documents: (文書のキー, テキスト)のリスト
+        """
+        for doc_key, text in documents:
+            self.add(doc_key, text)
+
+    def remove(self, doc_key):
+        """
+        文書を削除する
+
+        Args:
+            doc_key: 文書のキー
+        """
+        document = self.documents.pop(doc_key, None)
+        if document is None:
+            return
+
+        for gram in document["grams"]:
+            postings = self.postings[gram]
+            del postings[doc_key]
+            if not postings:
+                del self.postings[gram]
+                self._unregister_gram(gram)
+
+        self._total_length -= document["length"]
+
+    def search(self, query, limit=None):
+        """
+        検索語をすべて含む文書をBM25のスコア順に返す
+
+        Args:
+            query: 検索語（空白で区切った複数語はすべて含む文書のみ一致）
+            limit: 返す件数の上限
+
+        Returns:
+            list: (文書のキー, スコア)のリスト（スコアの高い順）
+        """
+        terms = WORD_PATTERN.findall(normalize_text(query))
+        if not terms or not self.documents:
+            return []
+
+        scores = None
+        for term in terms:
+            term_scores = self._score_term(term)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    doc_key: score + term_scores[doc_key]
+                    for doc_key, score in scores.items()
+                    if doc_key in term_scores
+                }
+            if not scores:
+                return []
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit] if limit else ranked
+
+    def _score_term(self, term):
+        """
+        1つの検索語について、すべてのn-gramを含む文書のスコアを計算する
+
+        Args:
+            term: 正規化済みの検索語
+
+        Returns:
+            dict: 文書のキーをキー、スコアを値とする辞書
+        """
+        size = min(len(term), self.ngram_sizes[-1])
+
+        if size < self.ngram_sizes[0]:
+            # インデックスの最短n-gramより短い検索語は、それを含むn-gramの和集合で検索する
+            posting_lists = [self._substring_postings(term)]
+        else:
+            grams = {term[i:i + size] for i in range(len(term) - size + 1)}
+            posting_lists = [self.postings.get(gram, {}) for gram in grams]
+
+        # 件数の少ないポスティングから順に絞り込む
+        posting_lists.sort(key=len)
+        candidates = set(posting_lists[0])
+        for postings in posting_lists[1:]:
+            candidates.intersection_update(postings)
+            if not candidates:
+                return {}
+
+        document_count = len(self.documents)
+        average_length = self._total_length / document_count if document_count else 1.0
+        scores = {}
+
+        for postings in posting_lists:
+            idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_key in candidates:
+                frequency = postings[doc_key]
+                length = self.documents[doc_key]["length"]
+                normalized = frequency * 2.2 / (frequency + 1.2 * (0.25 + 0.75 * length / average_length))
+                scores[doc_key] = scores.get(doc_key, 0.0) + idf * normalized
+
+        for doc_key in scores:
+            scores[doc_key] *= self.weights.get(doc_key[0], 1.0)
+
+        return scores
+
+    def _substring_postings(self, term):
+        """
+        検索語を含む短いn-gramのポスティングを合算する
+
+        Args:
+            term: 最短のn-gramより短い検索語
+
+        Returns:
+            dict: 文書のキーをキー、出現回数を値とする辞書
+        """
+        merged = {}
+        for gram in self._grams_by_char.get(term[0], ()):
+            if term in gram:
+                for doc_key, count in self.postings[gram].items():
+                    merged[doc_key] = merged.get(doc_key, 0) + count
+        return merged
+
+    def _register_gram(self, gram):
+        """
+        最短以下の長さのn-gramを、構成する文字から引けるようにする
+
+        Args:
+            gram: n-gram
+        """
+        if len(gram) <= self.ngram_sizes[0]:
+            for char in set(gram):
+                self._grams_by_char.setdefault(char, set()).add(gram)
+
+    def _unregister_gram(self, gram):
+        """
+        文字からn-gramへの対応を削除する
+
+        Args:
+            gram: n-gram
+        """
+        if len(gram) <= self.ngram_sizes[0]:
+            for char in set(gram):
+                grams = self._grams_by_char.get(char)
+                if grams is not None:
+                    grams.discard(gram)
+                    if not grams:
+                        del self._grams_by_char[char]
@@ -0,0 +1,263 @@
+"""
+ベクトルインデックス - 文書の埋め込みベクトルによる類似検索
+"""
+import re
+import math
+import zlib
+import numpy as np
+from ..config import CONFIG
+from collections import Counter
+from .text_index import normalize_text
+
+# 漢字・カタカナ・英数字の連続を内容語とみなす。ひらがな（助詞や活用語尾）はどの文書にも
+# 現れて類似度を不正確にするため、また語をまたぐn-gramを作らないため、区切りとして扱う
+CONTENT_RUN_PATTERN = re.compile(r"[\u4e00-\u9fff\u3005\u3006\u30f5\u30f6]+|[\u30a1-\u30fa\u30fc]+|[a-z0-9]+")
+
+class HashingEncoder:
+    """
+    文字n-gramのハッシュによる埋め込み
+
+    n-gramをハッシュで固定次元のベクトルに割り当てるため、モデルのダウンロードや
+    ネットワーク接続なしで動作します。「雲海」と「雲の海」のように文字を共有する言い換えは
+    近いベクトルになりますが、「稜線」と「尾根道」のように文字を共有しない同義語は区別できません。
+    その場合はencode()とdimを持つ別のエンコーダーを使用してください。
+    """
+    def __init__(self, dim=None, ngram_sizes=None):
+        """
+        HashingEncoderの初期化
+
+        Args:
+            dim: ベクトルの次元数（Noneの場合はCONFIGから取得）
+            ngram_sizes: n-gramの長さのリスト（Noneの場合はCONFIGから取得）
+        """
+        semantic_config = CONFIG["semantic_search"]
+        self.dim = dim or semantic_config["dim"]
+        self.ngram_sizes = sorted(ngram_sizes or semantic_config["ngram_sizes"])
+        self._buckets = {}
+
+    def encode(self, texts):
+        """
+        テキストを長さ1に正規化したベクトルに変換する
+
+        Args:
+            texts: テキストのリスト
+
+        Returns:
+            numpy.ndarray: (テキスト数, dim)のfloat32配列
+        """
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+
+        for row, text in enumerate(texts):
+            for gram, count in self._features(text).items():
+                index, sign = self._bucket(gram)
+                # 長いn-gramほど意味を特定しやすいため重みを大きくする
+                vectors[row, index] += sign * len(gram) * (1.0 + math.log(count))
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+    def _features(self, text):
+        """
+        テキストの内容語から文字n-gramを取り出す
+
+        Args:
+            text: テキスト
+
+        Returns:
+            Counter: n-gramをキー、出現回数を値とするカウンター
+        """
+        grams = Counter()
+        for run in CONTENT_RUN_PATTERN.findall(normalize_text(text or "")):
+            for size in self.ngram_sizes:
+                for i in range(len(run) - size + 1):
+                    grams[run[i:i + size]] += 1
+        return grams
+
+    def _bucket(self, gram):
+        """
+        n-gramを割り当てる次元と符号を求める（プロセスをまたいで同じ値になるようCRC32を使う）
+
+        Args:
+            gram: n-gram
+
+        Returns:
+            tuple: (次元, 符号)
+        """
+        bucket = self._buckets.get(gram)
+        if bucket is None:
+            value = zlib.crc32(gram.encode("utf-8"))
+            bucket = self._buckets[gram] = (value % self.dim, 1.0 if value & 0x80000000 else -1.0)
+        return bucket
+
+class VectorIndex:
+    """
+    埋め込みベクトルのインデックス
+
+    文書のベクトルを連続したfloat32の行列に格納し、検索語のベクトルとの内積を
+    1回の行列演算で計算して上位の文書を返します。
+    quantize=Trueの場合は行ごとのスケールを持つint8で格納し、メモリ使用量を約1/4にします。
+    """
+    # int8の行列をfloat32に変換して内積を計算する際の1回あたりの行数
+    CHUNK_ROWS = 16384
+
+    def __init__(self, encoder=None, quantize=None, capacity=1024):
+        """
+        VectorIndexの初期化
+
+        Args:
+            encoder: encode(texts)とdimを持つエンコーダー（Noneの場合はHashingEncoder）
+            quantize: int8で格納するかどうか（Noneの場合はCONFIGから取得）
+            capacity: 最初に確保する行数
+        """
+        self.encoder = encoder or HashingEncoder()
+        self.quantize = CONFIG["semantic_search"]["quantize"] if quantize is None else quantize
+
+        dtype = np.int8 if self.quantize else np.float32
+        self._matrix = np.zeros((max(capacity, 1), self.encoder.dim), dtype=dtype)
+        self._scales = np.ones(max(capacity, 1), dtype=np.float32)
+        self._keys = []
+        self._positions = {}
+        # 変更のない文書を再計算しないよう、テキストのハッシュを保持する
+        self._hashes = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, doc_key, text):
+        """
+        文書を追加する。同じキーの文書が既にある場合は置き換える
+
+        Args:
+            doc_key: 文書のキー（文書の種類, シーンID, 項目のキー）
+            text: 文書のテキスト
+        """
+        self.add_many([(doc_key, text)])
+
+    def add_many(self, documents):
+        """
+        複数の文書をまとめて追加する
+
+        Args:
+            documents: (文書のキー, テキスト)のリスト
+        """
+        documents = [
+            (doc_key, text) for doc_key, text in dict(documents).items()
+            if self._hashes.get(doc_key) != hash(text)
+        ]
+        if not documents:
+            return
+
+        vectors = self.encoder.encode([text for doc_key, text in documents])
+        rows = []
+
+        for doc_key, text in documents:
+            position = self._positions.get(doc_key)
+            if position is None:
+                position = len(self._keys)
+                self._positions[doc_key] = position
+                self._keys.append(doc_key)
+            rows.append(position)
+            self._hashes[doc_key] = hash(text)
+
+        self._reserve(len(self._keys))
+        self._store(np.asarray(rows), np.asarray(vectors, dtype=np.float32))
+
+    def remove(self, doc_key):
+        """
+        文書を削除する（最後の行を削除した行に移動する）
+
+        Args:
+            doc_key: 文書のキー
+        """
+        position = self._positions.pop(doc_key, None)
+        if position is None:
+            return
+
+        del self._hashes[doc_key]
+        last = len(self._keys) - 1
+        if position != last:
+            moved_key = self._keys[last]
+            self._keys[position] = moved_key
+            self._positions[moved_key] = position
+            self._matrix[position] = self._matrix[last]
+            self._scales[position] = self._scales[last]
+        self._keys.pop()
+
+    def search(self, query, limit=10):
+        """
+        検索語のベクトルとの内積（コサイン類似度）が大きい文書を返す
+
+        Args:
+            query: 検索語
+            limit: 返す件数の上限
+
+        Returns:
+            list: (文書のキー, スコア)のリスト（スコアの高い順）
+        """
+        size = len(self._keys)
+        if size == 0 or limit <= 0:
+            return []
+
+        query_vector = np.asarray(self.encoder.encode([query])[0], dtype=np.float32)
+        scores = self._scores(query_vector, size)
+
+        limit = min(limit, size)
+        top = np.argpartition(scores, size - limit)[size - limit:]
+        top = top[np.argsort(scores[top])[::-1]]
+
+        return [(self._keys[position], float(scores[position])) for position in top.tolist()]
+
+    def _scores(self, query_vector, size):
+        """
+        全文書と検索語のベクトルの内積を計算する
+
+        Args:
+            query_vector: 検索語のベクトル
+            size: 文書数
+
+        Returns:
+            numpy.ndarray: 文書ごとのスコア
+        """
+        if not self.quantize:
+            return self._matrix[:size] @ query_vector
+
+        # int8の行列全体を一度に変換しないよう、行を分けて計算する
+        scores = np.empty(size, dtype=np.float32)
+        for start in range(0, size, self.CHUNK_ROWS):
+            end = min(start + self.CHUNK_ROWS, size)
+            scores[start:end] = self._matrix[start:end].astype(np.float32) @ query_vector
+        return scores * self._scales[:size]
+
+    def _store(self, rows, vectors):
+        """
+        ベクトルを行列の指定した行に書き込む（int8の場合は行ごとにスケールを求めて量子化する）
+        """
+        if not self.quantize:
+            self._matrix[rows] = vectors
+            return
+
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        self._matrix[rows] = np.round(vectors / scales[:, None]).astype(np.int8)
+        self._scales[rows] = scales
+
+    def _reserve(self, size):
+        """
+        行列の行数が足りない場合は2倍に拡張する
+
+        Args:
+            size: 必要な行数
+        """
+        capacity = len(self._matrix)
+        if size <= capacity:
+            return
+
+        while capacity < size:
+            capacity *= 2
+
+        matrix = np.zeros((capacity, self._matrix.shape[1]), dtype=self._matrix.dtype)
+        matrix[:len(self._matrix)] = self._matrix
+        scales = np.ones(capacity, dtype=np.float32)
+        scales[:len(self._scales)] = self._scales
+        self._matrix, self._scales = matrix, scales
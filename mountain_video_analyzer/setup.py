@@ -25,6 +25,7 @@ setup(
         "faster-whisper",
         "uvicorn",
         "fastapi",
+        "numpy",
     ],
     entry_points={
         "console_scripts": [